@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Compare the time needed to install a distribution file with the different
+distribution modes as the number of hosts grows.
+
+Usage example, from a Grid5000 frontend with a running job:
+
+  python benchmarks/bench_distribution.py $OAR_NODEFILE cassandra.tar.gz \\
+      --sizes 1 2 4 8 16 32 --modes flat chain tree
+"""
+
+from argparse import ArgumentParser
+import time
+
+from execo.action import TaktukRemote
+from execo_engine import logger
+
+from dm_g5k.distribution import DISTRIBUTION_MODES, DEFAULT_DIST_FANOUT, \
+    install_dist_file
+from dm_g5k.util import generate_hosts
+
+DEST_DIR = "/tmp/dm_g5k_bench_dist"
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Benchmark the distribution modes "
+                                        "used in bootstrap")
+    parser.add_argument("hosts",
+                        help="The hosts file, site:job_id list or "
+                             "oargrid_job_id")
+    parser.add_argument("dist_file",
+                        help="The archive to be distributed")
+    parser.add_argument("--sizes",
+                        type=int,
+                        nargs="+",
+                        help="The number of hosts of each round")
+    parser.add_argument("--modes",
+                        nargs="+",
+                        choices=DISTRIBUTION_MODES,
+                        default=DISTRIBUTION_MODES,
+                        help="The distribution modes to compare")
+    parser.add_argument("--fanout",
+                        type=int,
+                        default=DEFAULT_DIST_FANOUT,
+                        help="The fanout of chain and tree modes")
+    parser.add_argument("--repetitions",
+                        type=int,
+                        default=3,
+                        help="The number of runs of each configuration")
+
+    args = parser.parse_args()
+
+    hosts = generate_hosts(args.hosts)
+    sizes = args.sizes or [len(hosts)]
+
+    results = []
+    for n in sizes:
+        if n > len(hosts):
+            logger.warn("Skipping size " + str(n) + ": only " +
+                        str(len(hosts)) + " hosts available")
+            continue
+
+        round_hosts = hosts[:n]
+        for mode in args.modes:
+            for _ in range(args.repetitions):
+                TaktukRemote("rm -rf " + DEST_DIR, round_hosts).run()
+
+                start = time.time()
+                ok = install_dist_file(round_hosts, args.dist_file, DEST_DIR,
+                                       mode, args.fanout)
+                elapsed = time.time() - start
+
+                results.append((n, mode, elapsed, ok))
+
+    TaktukRemote("rm -rf " + DEST_DIR, hosts).run()
+
+    print "%8s %8s %12s %6s" % ("hosts", "mode", "time (s)", "ok")
+    for (n, mode, elapsed, ok) in results:
+        print "%8d %8s %12.2f %6s" % (n, mode, elapsed, ok)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Compare the latency of short remote commands with and without the SSH
+connection pool.
+
+Usage example, from a Grid5000 frontend with a running job:
+
+  python benchmarks/bench_ssh_pool.py $OAR_NODEFILE --commands 20
+"""
+
+from argparse import ArgumentParser
+import time
+
+from execo.action import Remote, TaktukRemote
+
+from dm_g5k.connections import get_ssh_pool
+from dm_g5k.util import generate_hosts
+
+ACTIONS = {
+    "remote": Remote,
+    "taktuk": TaktukRemote
+}
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Benchmark the SSH connection pool")
+    parser.add_argument("hosts",
+                        help="The hosts file, site:job_id list or "
+                             "oargrid_job_id")
+    parser.add_argument("--commands",
+                        type=int,
+                        default=10,
+                        help="The number of sequential commands of each run")
+    parser.add_argument("--repetitions",
+                        type=int,
+                        default=3,
+                        help="The number of runs of each configuration")
+
+    args = parser.parse_args()
+
+    hosts = generate_hosts(args.hosts)
+    pool = get_ssh_pool()
+
+    results = []
+    for pooled in [False, True]:
+        if pooled:
+            pool.enable()
+            # Open the masters so that all runs measure multiplexed commands
+            Remote("true", hosts).run()
+        else:
+            pool.disable()
+
+        for name in sorted(ACTIONS):
+            for _ in range(args.repetitions):
+                start = time.time()
+                ok = True
+                for _ in range(args.commands):
+                    action = ACTIONS[name]("true", hosts)
+                    action.run()
+                    ok = ok and action.finished_ok
+                elapsed = time.time() - start
+
+                results.append((name, pooled, elapsed / args.commands, ok))
+
+    pool.close(hosts)
+    pool.disable()
+
+    print "%8s %8s %16s %6s" % ("action", "pool", "latency (ms)", "ok")
+    for (name, pooled, latency, ok) in results:
+        print "%8s %8s %16.1f %6s" % (name, pooled, latency * 1000, ok)
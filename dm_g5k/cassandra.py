@@ -1,6 +1,8 @@
 import os
+import re
 import shutil
 import tempfile
+import time
 import yaml
 
 from ConfigParser import ConfigParser
@@ -9,21 +11,74 @@ from execo import SshProcess
 from execo.action import TaktukPut, Get, Remote, TaktukRemote, \
     SequentialActions
 from execo_engine import logger
-from execo_g5k.api_utils import get_host_cluster
 from subprocess import call
-from dm_g5k.cluster import Cluster, ClusterNotInitializedException
+from dm_g5k.cluster import Cluster, ClusterException, \
+    ClusterNotInitializedException
+from dm_g5k.loading import DEFAULT_STAGING_DIR, load_chunks
+from dm_g5k.readiness import wait_for_port, wait_for_cassandra_ring
+from dm_g5k.tuning import get_group_resources, compute_cassandra_settings, \
+    render_cassandra_env
+from dm_g5k.util import update_yaml_file, write_file_atomically
 
 # Configuration files
 CONF_FILE = "cassandra.yaml"
+ENV_FILE = "cassandra-env.sh"
+RACKDC_FILE = "cassandra-rackdc.properties"
 
 # Default parameters
 DEFAULT_CASSANDRA_BASE_DIR = "/tmp/cassandra"
 DEFAULT_CASSANDRA_CONF_DIR = DEFAULT_CASSANDRA_BASE_DIR + "/conf"
 DEFAULT_CASSANDRA_LOGS_DIR = DEFAULT_CASSANDRA_BASE_DIR + "/logs"
 
+DEFAULT_CASSANDRA_NATIVE_PORT = 9042
+DEFAULT_CASSANDRA_RPC_PORT = 9160
+DEFAULT_CASSANDRA_NUM_SEEDS = 3
+
+SNITCH = "GossipingPropertyFileSnitch"
+DEFAULT_DC = "dc1"
+DEFAULT_RACK = "rack1"
+
+# Token modes
+RANDOM_TOKENS = "random"
+BALANCED_TOKENS = "balanced"
+ALLOCATED_TOKENS = "allocate"
+
+TOKEN_MODES = [RANDOM_TOKENS, BALANCED_TOKENS, ALLOCATED_TOKENS]
+
+DEFAULT_CASSANDRA_TOKEN_MODE = RANDOM_TOKENS
+DEFAULT_CASSANDRA_NUM_TOKENS = 16
+DEFAULT_CASSANDRA_ALLOCATION_RF = 3
+DEFAULT_CASSANDRA_START_WAVE = 10
+
+MIN_TOKEN = -2 ** 63
+TOKEN_RANGE = 2 ** 64
+DC_TOKEN_OFFSET = 100
+
+TOKEN_ALLOCATION_KEYSPACE = "dm_g5k_tokens"
+MIN_TOKEN_ALLOCATION_VERSION = (3, 0)
+YCSB_KEYSPACE = "ycsb"
+
 DEFAULT_CASSANDRA_LOCAL_CONF_DIR = "conf"
 
 
+def get_balanced_tokens(num_nodes, offset=0):
+    """Return evenly spaced Murmur3Partitioner tokens.
+
+    Args:
+      num_nodes (int):
+        The number of nodes sharing the ring.
+      offset (int, optional):
+        A value added to every token, so that the nodes of different data
+        centers do not get the same tokens.
+
+    Returns (list of int):
+      The initial token of every node.
+    """
+
+    return [MIN_TOKEN + i * TOKEN_RANGE // num_nodes + offset
+            for i in range(num_nodes)]
+
+
 class CassandraCluster(Cluster):
     """This class manages the whole life-cycle of a Cassandra cluster.
 
@@ -34,14 +89,23 @@ class CassandraCluster(Cluster):
     running = False
     running_cassandra = False
 
+    heavy_fields = Cluster.heavy_fields + ("seeds",)
+
     # Default properties
-    defaults = {
+    defaults = dict(Cluster.defaults, **{
         "cassandra_base_dir": DEFAULT_CASSANDRA_BASE_DIR,
         "cassandra_conf_dir": DEFAULT_CASSANDRA_CONF_DIR,
         "cassandra_logs_dir": DEFAULT_CASSANDRA_LOGS_DIR,
+        "cassandra_native_port": str(DEFAULT_CASSANDRA_NATIVE_PORT),
+        "cassandra_rpc_port": str(DEFAULT_CASSANDRA_RPC_PORT),
+        "cassandra_num_seeds": str(DEFAULT_CASSANDRA_NUM_SEEDS),
+        "cassandra_token_mode": DEFAULT_CASSANDRA_TOKEN_MODE,
+        "cassandra_num_tokens": str(DEFAULT_CASSANDRA_NUM_TOKENS),
+        "cassandra_allocation_rf": str(DEFAULT_CASSANDRA_ALLOCATION_RF),
+        "cassandra_start_wave": str(DEFAULT_CASSANDRA_START_WAVE),
 
         "local_base_conf_dir": DEFAULT_CASSANDRA_LOCAL_CONF_DIR
-    }
+    })
 
     @staticmethod
     def get_cluster_type():
@@ -68,28 +132,72 @@ class CassandraCluster(Cluster):
         self.base_dir = config.get("cluster", "cassandra_base_dir")
         self.conf_dir = config.get("cluster", "cassandra_conf_dir")
         self.logs_dir = config.get("cluster", "cassandra_logs_dir")
+        self.native_port = config.getint("cluster", "cassandra_native_port")
+        self.rpc_port = config.getint("cluster", "cassandra_rpc_port")
+        self.num_seeds = config.getint("cluster", "cassandra_num_seeds")
+        self.token_mode = config.get("cluster", "cassandra_token_mode")
+        self.num_tokens = config.getint("cluster", "cassandra_num_tokens")
+        self.allocation_rf = config.getint("cluster",
+                                           "cassandra_allocation_rf")
+        self.start_wave = config.getint("cluster", "cassandra_start_wave")
         self.local_base_conf_dir = config.get("local", "local_base_conf_dir")
+        self._load_common_properties(config)
+
+        if self.token_mode not in TOKEN_MODES:
+            logger.error("Unknown token mode " + self.token_mode)
+            raise ClusterException("Unknown token mode " + self.token_mode)
 
         self.bin_dir = self.base_dir + "/bin"
+        self.pid_file = self.base_dir + "/cassandra.pid"
 
         # Configure nodes and seeds
         self.hosts = hosts
-        self.seeds = self.hosts[0:3]
+        self.seeds = self.__select_seeds()
 
         # TODO: Temporary
         self.master = self.hosts[0]
 
         # Store cluster information
-        self.host_clusters = {}
-        for h in self.hosts:
-            g5k_cluster = get_host_cluster(h)
-            if g5k_cluster in self.host_clusters:
-                self.host_clusters[g5k_cluster].append(h)
-            else:
-                self.host_clusters[g5k_cluster] = [h]
+        self.host_clusters = self._get_host_info().group_by_cluster(self.hosts)
+
+        logger.info("Seeds: " + str(self.seeds))
 
         logger.info("Cassandra cluster created with hosts " + str(self.hosts))
 
+    def __select_seeds(self):
+        """Choose the seeds spread across sites and clusters, with at least
+        one per site."""
+
+        host_info = self._get_host_info()
+        num_sites = len(set(host_info.get_site(h) for h in self.hosts))
+        num_seeds = min(len(self.hosts), max(self.num_seeds, num_sites))
+
+        return host_info.interleave(self.hosts)[:num_seeds]
+
+    def _get_location(self, host):
+        """Return the data center (Grid5000 site) and rack (Grid5000 cluster)
+        of a host.
+
+        Returns (tuple of (str, str)):
+          The names of the data center and the rack.
+        """
+
+        host_info = self._get_host_info()
+        return (host_info.get_site(host) or DEFAULT_DC,
+                host_info.get_cluster(host) or DEFAULT_RACK)
+
+    def get_datacenters(self):
+        """Return the hosts of every data center of the cluster.
+
+        Returns (dict of str -> list of Host):
+          The hosts of every data center.
+        """
+
+        datacenters = {}
+        for h in self.hosts:
+            datacenters.setdefault(self._get_location(h)[0], []).append(h)
+        return datacenters
+
     def bootstrap(self, tar_file):
         """Install Cassandra in all cluster nodes from the specified tar.gz file.
 
@@ -121,25 +229,19 @@ class CassandraCluster(Cluster):
 
         logger.info("All required packages are present")
 
-        # 1. Copy hadoop tar file and uncompress
+        # 1. Copy Cassandra tar file and uncompress
         logger.info("Copy " + tar_file + " to hosts and uncompress")
         rm_dirs = TaktukRemote("rm -rf " + self.base_dir +
                                " " + self.conf_dir +
                                " " + self.logs_dir,
                                 self.hosts)
-        put_tar = TaktukPut(self.hosts, [tar_file], "/tmp")
-        tar_xf = TaktukRemote(
-            "tar xf /tmp/" + os.path.basename(tar_file) + " -C /tmp",
-            self.hosts)
-        SequentialActions([rm_dirs, put_tar, tar_xf]).run()
+        rm_dirs.run()
+        self._reset_conf_hashes()
+        if not self._install_dist_file(tar_file, self.base_dir):
+            raise ClusterException("Could not install " + tar_file)
 
-        # 2. Move installation to base dir and create other dirs
+        # 2. Create other dirs
         logger.info("Create installation directories")
-        mv_base_dir = TaktukRemote(
-            "mv /tmp/" +
-            os.path.basename(tar_file).replace(".tar.gz", "") + " " +
-            self.base_dir,
-            self.hosts)
         mkdirs = TaktukRemote("mkdir -p " + self.conf_dir +
                               " && mkdir -p " + self.logs_dir,
                               self.hosts)
@@ -147,7 +249,7 @@ class CassandraCluster(Cluster):
                               " && chmod g+w " + self.conf_dir +
                               " && chmod g+w " + self.logs_dir,
                               self.hosts)
-        SequentialActions([mv_base_dir, mkdirs, chmods]).run()
+        SequentialActions([mkdirs, chmods]).run()
 
     def initialize(self):
         """Initialize the cluster: copy base configuration and format DFS."""
@@ -157,17 +259,59 @@ class CassandraCluster(Cluster):
         logger.info("Initializing Cassandra")
 
         # Set basic configuration
-        self._copy_base_conf()
-        self._create_nodes_and_seeds_conf()
+        self._prepare_conf()
 
         # Configure hosts depending on resource type
-        for g5k_cluster in self.host_clusters:
-            hosts = self.host_clusters[g5k_cluster]
-            self._configure_servers(hosts)
-            self._copy_conf(self.conf_dir, hosts)
+        self._configure_groups()
 
         self.initialized = True
 
+    def _prepare_conf(self):
+        """Render the base configuration in self.temp_conf_dir."""
+
+        self.__check_token_mode()
+        self._copy_base_conf()
+        self._create_nodes_and_seeds_conf()
+
+    def get_version(self):
+        """Return the version of the Cassandra installed in the master,
+        taken from the name of its jar file.
+
+        Returns (tuple of int):
+          The major and minor version numbers, or None if they could not be
+          determined.
+        """
+
+        proc = TaktukRemote("ls " + self.base_dir + "/lib", [self.master])
+        for p in proc.processes:
+            p.nolog_exit_code = p.nolog_error = True
+        proc.run()
+
+        match = re.search(r"apache-cassandra-(\d+)\.(\d+)",
+                          proc.processes[0].stdout)
+        if not match:
+            return None
+        return (int(match.group(1)), int(match.group(2)))
+
+    def __check_token_mode(self):
+        """Fall back to balanced tokens if the installed Cassandra does not
+        support token allocation (allocate_tokens_for_keyspace was added in
+        3.0)."""
+
+        if self.token_mode != ALLOCATED_TOKENS:
+            return
+
+        version = self.get_version()
+        if version is None or version < MIN_TOKEN_ALLOCATION_VERSION:
+            logger.warn("Token allocation needs Cassandra " +
+                        ".".join(str(v) for v in
+                                 MIN_TOKEN_ALLOCATION_VERSION) +
+                        " or later (found " +
+                        (".".join(str(v) for v in version) if version
+                         else "unknown version") +
+                        "). Using balanced tokens")
+            self.token_mode = BALANCED_TOKENS
+
     def _pre_initialize(self):
         """Clean previous configurations"""
 
@@ -183,7 +327,7 @@ class CassandraCluster(Cluster):
     def _copy_base_conf(self):
         """Copy base configuration files to tmp dir."""
 
-        self.temp_conf_dir = tempfile.mkdtemp("", "cassandra-", "/tmp")
+        self._new_temp_conf_dir()
         if os.path.exists(self.local_base_conf_dir):
             base_conf_files = [os.path.join(self.local_base_conf_dir, f)
                                for f in os.listdir(self.local_base_conf_dir)]
@@ -194,7 +338,7 @@ class CassandraCluster(Cluster):
                 "Local conf dir does not exist. Using default configuration")
             base_conf_files = []
 
-        mandatory_files = [CONF_FILE]
+        mandatory_files = [CONF_FILE, ENV_FILE]
 
         missing_conf_files = mandatory_files
         for f in base_conf_files:
@@ -214,17 +358,26 @@ class CassandraCluster(Cluster):
     def _create_nodes_and_seeds_conf(self):
         """Create master and slaves configuration files."""
 
-        with open(os.path.join(self.conf_dir, CONF_FILE)) as stream:
-            config = yaml.load(stream)
-
-        print config
-
-        # Change configuration
-        config["seed_provider"][0]["parameters"][0]["seeds"] = \
-            '"' + ",".join(s.address for s in self.seeds) + '"'
-
-        with open(os.path.join(self.conf_dir, CONF_FILE), "w") as stream:
-            yaml.dump(config, stream)
+        properties = {
+            "seed_provider.0.parameters.0.seeds":
+                '"' + ",".join(s.address for s in self.seeds) + '"',
+            "native_transport_port": self.native_port,
+            "rpc_port": self.rpc_port,
+            "endpoint_snitch": SNITCH,
+            # Empty addresses are resolved from the host name of every node,
+            # so that nodes gossip and serve clients on their real address
+            "listen_address": None,
+            "rpc_address": None
+        }
+
+        # Tokens
+        if self.token_mode == BALANCED_TOKENS:
+            properties["num_tokens"] = 1
+        elif self.token_mode == ALLOCATED_TOKENS:
+            properties["num_tokens"] = self.num_tokens
+
+        update_yaml_file(os.path.join(self.temp_conf_dir, CONF_FILE),
+                         properties)
 
     def _check_initialization(self):
         """ Check whether the cluster is initialized and raise and exception if
@@ -236,26 +389,130 @@ class CassandraCluster(Cluster):
             raise ClusterNotInitializedException(
                 "The cluster should be initialized")
 
-    def _configure_servers(self, hosts=None):
-        pass
+    def _configure_servers(self, conf_dir, hosts=None):
+        """Set the data center and rack of the hosts, place the data and
+        commitlog directories in their disks and tune the JVM and the thread
+        pools to their hardware.
+
+        All the hosts of a group belong to the same Grid5000 cluster, so they
+        share the same cassandra-rackdc.properties.
 
-    def _copy_conf(self, conf_dir, hosts=None):
+        Args:
+          conf_dir (str):
+            The local directory with the configuration files of the group.
+          hosts (list of Host, optional):
+            The hosts of the group. All the cluster hosts are used if not
+            provided.
+        """
 
         if not hosts:
             hosts = self.hosts
 
-        conf_files = [os.path.join(conf_dir, f) for f in os.listdir(conf_dir)]
+        # Topology
+        (dc, rack) = self._get_location(hosts[0])
+        with open(os.path.join(conf_dir, RACKDC_FILE), "w") as stream:
+            stream.write("dc=" + dc + "\nrack=" + rack + "\n")
 
-        action = TaktukPut(hosts, conf_files, self.conf_dir)
+        with open(os.path.join(conf_dir, CONF_FILE)) as stream:
+            config = yaml.load(stream)
 
-        action.run()
+        # Storage
+        placement = self.__place_storage(hosts)
+        if placement:
+            config["data_file_directories"] = placement["data_dirs"]
+            config["commitlog_directory"] = placement["commitlog_dir"]
+            (data_disks, ssd) = (len(placement["data_dirs"]),
+                                 placement["ssd"])
+
+        else:
+            (data_disks, ssd) = (1, None)
+
+        # Hardware
+        resources = get_group_resources(self._get_host_info(), hosts)
+        if resources:
+            if ssd is None:
+                ssd = resources["ssd"]
+            settings = compute_cassandra_settings(resources["cores"],
+                                                  resources["memory"],
+                                                  data_disks, ssd)
+            self.__apply_settings(conf_dir, config, settings, hosts,
+                                  resources)
+        else:
+            logger.warn("Hardware of " + str(hosts) + " is unknown. "
+                        "Using default settings")
+
+        write_file_atomically(os.path.join(conf_dir, CONF_FILE),
+                              yaml.dump(config))
+
+    def __place_storage(self, hosts):
+        """Choose the data and commitlog directories of the given hosts.
+
+        With several disks, the commitlog gets a dedicated one (the second
+        fastest) and data directories go to the other disks of the same
+        class as the fastest one.
+
+        Args:
+          hosts (list of Host):
+            The hosts of a group.
+
+        Returns (dict):
+          The data directories, the commitlog directory and whether the data
+          disks are SSDs, or None if the default directories are used.
+        """
+
+        disks = self._get_storage_disks(hosts)
+        if not disks:
+            return None
+
+        if len(disks) > 1:
+            commitlog_disk = disks[1]
+            data_disks = [d for d in disks if d is not commitlog_disk and
+                          d["ssd"] == disks[0]["ssd"]]
+        else:
+            commitlog_disk = disks[0]
+            data_disks = [disks[0]]
+
+        placement = {
+            "data_dirs": [os.path.join(d["dir"], "data") for d in data_disks],
+            "commitlog_dir": os.path.join(commitlog_disk["dir"], "commitlog"),
+            "ssd": data_disks[0]["ssd"]
+        }
+
+        logger.info("Storage for " + str(len(hosts)) + " hosts: data in " +
+                    str(placement["data_dirs"]) + ", commitlog in " +
+                    placement["commitlog_dir"])
+
+        self._create_storage_dirs(placement["data_dirs"] +
+                                  [placement["commitlog_dir"]], hosts)
+
+        return placement
+
+    def __apply_settings(self, conf_dir, config, settings, hosts, resources):
+        """Apply the JVM and thread pool settings to the configuration of a
+        group."""
 
-        if not action.finished_ok:
-            logger.warn("Error while copying configuration")
-            if not action.ended:
-                action.kill()
+        logger.info("Settings for " + str(len(hosts)) + " hosts with " +
+                    str(resources["cores"]) + " cores and " +
+                    str(resources["memory"] // (1024 * 1024)) + " MB: " +
+                    str(settings))
+
+        # JVM
+        env_file = os.path.join(conf_dir, ENV_FILE)
+        if os.path.exists(env_file):
+            render_cassandra_env(env_file, settings)
+        else:
+            logger.warn(ENV_FILE + " not found. JVM settings not applied")
+
+        # Thread pools
+        for name in ("concurrent_reads", "concurrent_writes",
+                     "memtable_flush_writers"):
+            config[name] = settings[name]
 
     def start(self):
+        """Start Cassandra, first in the seeds and then in the rest of the
+        nodes in waves of start_wave nodes (0 means all of them at once).
+        Every wave starts when all the previous nodes are Up and Normal.
+        """
 
         self._check_initialization()
 
@@ -265,14 +522,258 @@ class CassandraCluster(Cluster):
             logger.warn("Cassandra was already started")
             return
 
-        proc = TaktukRemote(self.bin_dir + "/cassandra", self.hosts)
-        proc.run()
+        others = [h for h in self.hosts if h not in self.seeds]
+        wave_size = self.start_wave or len(others)
+        waves = [list(self.seeds)] + [others[i:i + wave_size]
+                                      for i in range(0, len(others),
+                                                     wave_size)]
+
+        options = self.__get_start_options()
+
+        num_started = 0
+        for (i, wave) in enumerate(waves):
+            if i == 1 and self.token_mode == ALLOCATED_TOKENS:
+                self.__enable_token_allocation(others)
+
+            logger.info("Starting wave " + str(i) + " (" + str(len(wave)) +
+                        " nodes)")
+            host_options = [options[h] for h in wave]
+            proc = TaktukRemote(self.bin_dir + "/cassandra -p " +
+                                self.pid_file + " {{host_options}}", wave)
+            proc.run()
+
+            if not proc.finished_ok:
+                logger.warn("Error while starting Cassandra")
+                return
 
-        if not proc.finished_ok:
-            logger.warn("Error while starting Cassandra")
-        else:
             self.running_cassandra = True
             self.running = True
+            num_started += len(wave)
+
+            if i < len(waves) - 1 and not wait_for_cassandra_ring(
+                    self.seeds[0], self.bin_dir, num_started,
+                    self.start_timeout):
+                logger.warn("Nodes of wave " + str(i) + " did not join the "
+                            "ring. Remaining nodes not started")
+                return
+
+        if not self._wait_until_ready():
+            logger.warn("Cassandra is running but not ready")
+
+    def __get_start_options(self):
+        """Return the JVM options used to start every node: the initial token
+        in balanced mode and, if non-seed nodes join at the same time, the
+        option allowing it in a fresh ring."""
+
+        options = dict((h, []) for h in self.hosts)
+
+        if self.token_mode == BALANCED_TOKENS:
+            datacenters = self.get_datacenters()
+            for (i, dc) in enumerate(sorted(datacenters)):
+                dc_hosts = datacenters[dc]
+                tokens = get_balanced_tokens(len(dc_hosts),
+                                             i * DC_TOKEN_OFFSET)
+                for (h, token) in zip(dc_hosts, tokens):
+                    options[h].append("-Dcassandra.initial_token=" +
+                                      str(token))
+
+        if self.start_wave != 1:
+            for h in self.hosts:
+                if h not in self.seeds:
+                    options[h].append(
+                        "-Dcassandra.consistent.rangemovement=false")
+
+        return dict((h, " ".join(o)) for (h, o) in options.items())
+
+    def __enable_token_allocation(self, hosts):
+        """Create the keyspace driving token allocation and make the given
+        hosts use it when they join the ring.
+
+        The keyspace cannot exist before the seeds are started, so the
+        option is only added to the configuration of the remaining hosts.
+        """
+
+        if not self.create_keyspace(TOKEN_ALLOCATION_KEYSPACE,
+                                    self.allocation_rf):
+            logger.warn("Could not create keyspace " +
+                        TOKEN_ALLOCATION_KEYSPACE + ". Using random tokens")
+            return
+
+        for (g5k_cluster, conf_dir) in self.group_conf_dirs.items():
+            group_hosts = [h for h in self.host_clusters[g5k_cluster]
+                           if h in hosts]
+            if not group_hosts:
+                continue
+
+            update_yaml_file(os.path.join(conf_dir, CONF_FILE),
+                             {"allocate_tokens_for_keyspace":
+                              TOKEN_ALLOCATION_KEYSPACE})
+
+            self._copy_conf(conf_dir, group_hosts)
+
+    def _wait_until_ready(self):
+        """Wait until all the nodes have joined the ring and accept client
+        connections, or until start_timeout expires.
+
+        Returns (bool):
+          True if the cluster is ready, False otherwise.
+        """
+
+        deadline = time.time() + self.start_timeout
+
+        ring_ok = wait_for_cassandra_ring(self.master, self.bin_dir,
+                                          len(self.hosts), self.start_timeout)
+        not_listening = wait_for_port(self.hosts, self.native_port,
+                                      max(0, deadline - time.time()))
+
+        return ring_ok and not not_listening
+
+    def execute_cql(self, statements, node=None):
+        """Execute CQL statements with cqlsh.
+
+        Args:
+          statements (list of str):
+            The statements to execute, each one ending with a semicolon.
+          node (Host, optional):
+            The host were cqlsh is executed. If not provided, self.master is
+            chosen.
+
+        Returns (bool):
+          True if the statements were executed successfully, False otherwise.
+        """
+
+        if not node:
+            node = self.master
+
+        (fd, cql_file) = tempfile.mkstemp(".cql", "cassandra-", "/tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(statements) + "\n")
+
+        remote_file = "/tmp/" + os.path.basename(cql_file)
+        put_file = TaktukPut([node], [cql_file], "/tmp")
+        cqlsh = TaktukRemote(self.bin_dir + "/cqlsh " + node.address + " " +
+                             str(self.native_port) + " -f " + remote_file +
+                             " ; status=$? ; rm -f " + remote_file +
+                             " ; exit $status", [node])
+        action = SequentialActions([put_file, cqlsh])
+        action.run()
+        os.remove(cql_file)
+
+        if not action.ok:
+            logger.warn("Error while executing CQL statements")
+
+        return action.ok
+
+    def get_replication(self, replication_factor):
+        """Return the replication factor of every data center, limited to the
+        number of nodes in it.
+
+        Args:
+          replication_factor (int):
+            The number of replicas of each row in every data center.
+
+        Returns (dict of str -> int):
+          The replication factor of every data center.
+        """
+
+        return dict((dc, min(replication_factor, len(hosts)))
+                    for (dc, hosts) in self.get_datacenters().items())
+
+    def create_keyspace(self, name, replication_factor):
+        """Create a keyspace with NetworkTopologyStrategy if it does not
+        exist.
+
+        Args:
+          name (str):
+            The name of the keyspace.
+          replication_factor (int):
+            The number of replicas of each row in every data center.
+
+        Returns (bool):
+          True if the keyspace is available, False otherwise.
+        """
+
+        replication = self.get_replication(replication_factor)
+        return self.execute_cql([
+            "CREATE KEYSPACE IF NOT EXISTS " + name + " WITH replication = "
+            "{'class': 'NetworkTopologyStrategy', " +
+            ", ".join("'" + dc + "': " + str(rf)
+                      for (dc, rf) in sorted(replication.items())) + "};"])
+
+    def get_ycsb_binding(self):
+        """Return the YCSB binding for Cassandra and its properties."""
+
+        return ("cassandra-cql",
+                {"hosts": ",".join(h.address for h in self.hosts),
+                 "port": self.native_port,
+                 "cassandra.keyspace": YCSB_KEYSPACE})
+
+    def prepare_ycsb(self, replication_factor=1):
+        """Create the keyspace and table used by YCSB.
+
+        Args:
+          replication_factor (int, optional):
+            The number of replicas of each record.
+        """
+
+        self._check_initialization()
+
+        fields = ", ".join("field" + str(i) + " varchar" for i in range(10))
+        self.create_keyspace(YCSB_KEYSPACE, replication_factor)
+        self.execute_cql([
+            "CREATE TABLE IF NOT EXISTS " + YCSB_KEYSPACE + ".usertable "
+            "(y_id varchar PRIMARY KEY, " + fields + ");"])
+
+    def load_data(self, chunks, namespace, loaders=None,
+                  staging_dir=DEFAULT_STAGING_DIR):
+        """Bulk load SSTables generated offline, streaming them to the nodes
+        owning their rows with sstableloader.
+
+        Chunks are distributed among the loaders and staged in their disks
+        in parallel, and then all the loaders stream their chunks at the
+        same time.
+
+        Args:
+          chunks (list of str):
+            The local directories with the SSTables of the table, as written
+            for instance by CQLSSTableWriter. The table must exist.
+          namespace (str):
+            The table, as keyspace.table.
+          loaders (list of Host, optional):
+            The hosts where sstableloader is executed, which need Cassandra
+            installed in the same directory. All the cluster hosts are used
+            if not provided.
+          staging_dir (str, optional):
+            The remote directory where the chunks are staged.
+
+        Returns (bool):
+          True if all the SSTables were loaded, False otherwise.
+        """
+
+        self._check_initialization()
+
+        (keyspace, table) = namespace.split(".")
+        seeds = ",".join(s.address for s in self.seeds)
+
+        # sstableloader connects through Thrift before 3.0 and through the
+        # native protocol afterwards, with -p being the port of either
+        version = self.get_version()
+        if version and version >= (3, 0):
+            port = self.native_port
+        else:
+            port = getattr(self, "rpc_port", DEFAULT_CASSANDRA_RPC_PORT)
+            if not version:
+                logger.warn("Unknown Cassandra version. Loading through the "
+                            "RPC port " + str(port))
+
+        def get_command(i, dirs):
+            return " && ".join(self.bin_dir + "/sstableloader -d " + seeds +
+                               " -p " + str(port) + " " + d for d in dirs)
+
+        logger.info("Loading " + str(len(chunks)) + " chunks of SSTables "
+                    "into " + namespace)
+        return load_chunks(chunks, loaders or self.hosts, get_command,
+                           staging_dir, "/" + keyspace + "/" + table)
 
     def start_shell(self, node=None, exec_params=None):
         """Open a Hive shell.
@@ -299,16 +800,60 @@ class CassandraCluster(Cluster):
              self.bin_dir + "/cassandra-cli" + params_str + "'",
              shell=True)
 
+    def _stop_nodes(self, hosts):
+        """Flush and stop Cassandra in the given hosts.
+
+        Returns (bool):
+          True if Cassandra was stopped in all the hosts, False otherwise.
+        """
+
+        proc = TaktukRemote(self.bin_dir + "/nodetool drain ; "
+                            "pid=$(cat " + self.pid_file + ") && "
+                            "kill $pid && "
+                            "while kill -0 $pid 2> /dev/null ; "
+                            "do sleep 1 ; done && "
+                            "rm -f " + self.pid_file, hosts)
+        proc.run()
+
+        return proc.finished_ok
+
+    def _start_nodes(self, hosts):
+        """Start Cassandra in the given hosts of a running ring and wait until
+        the whole ring is Up and Normal again.
+
+        Returns (bool):
+          True if the hosts rejoined the ring, False otherwise.
+        """
+
+        proc = TaktukRemote(self.bin_dir + "/cassandra -p " + self.pid_file,
+                            hosts)
+        proc.run()
+        if not proc.finished_ok:
+            return False
+
+        deadline = time.time() + self.start_timeout
+        others = [h for h in self.hosts if h not in hosts]
+        ring_ok = wait_for_cassandra_ring(others[0] if others else hosts[0],
+                                          self.bin_dir, len(self.hosts),
+                                          self.start_timeout)
+        not_listening = wait_for_port(hosts, self.native_port,
+                                      max(0, deadline - time.time()))
+
+        return ring_ok and not not_listening
+
     def stop(self):
+        """Flush and stop Cassandra in all the nodes."""
+
         self._check_initialization()
 
         logger.info("Stopping Cassandra")
 
+        if not self._stop_nodes(self.hosts):
+            logger.warn("Error while stopping Cassandra")
+
         self.running_cassandra = False
         self.running = False
 
-        pass
-
     def clean_logs(self):
         """Remove all Cassandra logs."""
 
@@ -334,6 +879,19 @@ class CassandraCluster(Cluster):
             self.stop()
 
         self.clean_logs()
+        self.clean_data()
+
+    def clean_data(self):
+        """Remove the contents of the data directories placed in the local
+        disks."""
+
+        if self.running:
+            logger.warn("The cluster needs to be stopped before cleaning.")
+            self.stop()
+
+        logger.info("Cleaning Cassandra data")
+
+        self._clean_storage_dirs()
 
     def __force_clean(self):
         pass
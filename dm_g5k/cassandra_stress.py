@@ -0,0 +1,259 @@
+import itertools
+import os
+import re
+import time
+
+from execo.action import TaktukRemote
+from execo_engine import logger
+
+# Default parameters
+DEFAULT_STRESS_OPERATIONS = 1000000
+DEFAULT_STRESS_THREADS = 50
+DEFAULT_STRESS_CONSISTENCY = "ONE"
+DEFAULT_STRESS_COMPACTION = "SizeTieredCompactionStrategy"
+DEFAULT_STRESS_REPLICATION_FACTOR = 1
+
+STRESS_KEYSPACE = "keyspace1"
+
+# Sweep parameters, from the slowest to the fastest changing one. Changing
+# the first two requires recreating the schema.
+SWEEP_PARAMETERS = ["replication_factor", "compaction", "consistency",
+                    "threads"]
+
+__summary_fields = {
+    "op rate": "op_rate",
+    "partition rate": "partition_rate",
+    "row rate": "row_rate",
+    "latency mean": "latency_mean_ms",
+    "latency median": "latency_median_ms",
+    "latency 95th percentile": "latency_p95_ms",
+    "latency 99th percentile": "latency_p99_ms",
+    "latency 99.9th percentile": "latency_p999_ms",
+    "latency max": "latency_max_ms"
+}
+
+__summary_regex = re.compile(r"^\s*([a-z0-9. ]+?)\s*:\s*([0-9][0-9.,]*)",
+                             re.MULTILINE | re.IGNORECASE)
+
+
+def parse_stress_output(output):
+    """Parse the summary printed at the end of a cassandra-stress run.
+
+    Args:
+      output (str): the standard output of cassandra-stress.
+
+    Returns (dict of str -> float):
+      The op, partition and row rates (per second) and the mean, median,
+      p95, p99, p99.9 and max latencies (in ms) found in the summary.
+    """
+
+    summary_start = output.rfind("Results:")
+    if summary_start >= 0:
+        output = output[summary_start:]
+
+    results = {}
+    for (name, value) in __summary_regex.findall(output):
+        field = __summary_fields.get(name.lower())
+        if field:
+            results[field] = float(value.replace(",", ""))
+    return results
+
+
+def aggregate_stress_results(client_results):
+    """Combine the summaries of several cassandra-stress clients.
+
+    Rates are added and latencies take the worst client value.
+
+    Args:
+      client_results (list of dict): the parsed output of every client.
+
+    Returns (dict of str -> float):
+      The combined summary.
+    """
+
+    results = {}
+    for field in __summary_fields.values():
+        values = [r[field] for r in client_results if field in r]
+        if not values:
+            continue
+        if field.endswith("_rate"):
+            results[field] = sum(values)
+        else:
+            results[field] = max(values)
+    return results
+
+
+class CassandraStress(object):
+    """This class drives cassandra-stress, as installed with Cassandra in the
+    cluster nodes, and runs parameter sweeps over it.
+    """
+
+    def __init__(self, cluster, clients=None, results_store=None):
+        """Create a new cassandra-stress driver.
+
+        Args:
+          cluster (CassandraCluster):
+            The cluster to benchmark. It should be running.
+          clients (list of Host, optional):
+            The cluster nodes where cassandra-stress is executed. If not
+            provided, the cluster master is used.
+          results_store (ResultsStore, optional):
+            If given, the result of every run is added to it.
+        """
+
+        self.cluster = cluster
+        self.clients = clients or [cluster.master]
+        self.results_store = results_store
+
+        self.stress_bin = os.path.join(cluster.base_dir,
+                                       "tools/bin/cassandra-stress")
+        self._schema = None
+
+    def _get_command(self, operation, num_ops, threads, consistency,
+                     compaction, replication_factor, client=0):
+        replication = self.cluster.get_replication(replication_factor)
+        pop_start = client * num_ops + 1
+        return (self.stress_bin + " " + operation +
+                " n=" + str(num_ops) +
+                " cl=" + consistency +
+                " -mode native cql3" +
+                " -rate threads=" + str(threads) +
+                " -schema 'replication(strategy=NetworkTopologyStrategy," +
+                ",".join(dc + "=" + str(rf)
+                         for (dc, rf) in sorted(replication.items())) +
+                ")' 'compaction(strategy=" + compaction + ")'" +
+                " -node " + ",".join(h.address for h in self.cluster.hosts) +
+                " -port native=" + str(self.cluster.native_port) +
+                " -pop seq=" + str(pop_start) + ".." +
+                str(pop_start + num_ops - 1))
+
+    def reset_schema(self):
+        """Drop the stress keyspace so that it is created again with the
+        schema of the next run."""
+
+        logger.info("Dropping keyspace " + STRESS_KEYSPACE)
+        self.cluster.execute_cql(["DROP KEYSPACE IF EXISTS " +
+                                  STRESS_KEYSPACE + ";"])
+        self._schema = None
+
+    def run(self, operation="write", num_ops=DEFAULT_STRESS_OPERATIONS,
+            threads=DEFAULT_STRESS_THREADS,
+            consistency=DEFAULT_STRESS_CONSISTENCY,
+            compaction=DEFAULT_STRESS_COMPACTION,
+            replication_factor=DEFAULT_STRESS_REPLICATION_FACTOR):
+        """Execute cassandra-stress in all the clients at the same time.
+
+        Every client works on its own range of partitions, so that the
+        aggregated rates do not count the same partitions several times. The
+        stress keyspace is dropped first in the first run of the driver and
+        whenever the requested compaction strategy or replication factor
+        differ from the ones of the previous run.
+
+        Args:
+          operation (str, optional):
+            The cassandra-stress command (write, read, mixed...).
+          num_ops (int, optional):
+            The number of operations of each client.
+          threads (int, optional):
+            The number of threads of each client.
+          consistency (str, optional):
+            The consistency level of the operations.
+          compaction (str, optional):
+            The compaction strategy of the stress table.
+          replication_factor (int, optional):
+            The replication factor of the stress keyspace in every data
+            center.
+
+        Returns (dict):
+          The parameters and the aggregated summary of the run, or None if
+          it failed.
+        """
+
+        schema = (replication_factor, compaction)
+        if self._schema != schema:
+            self.reset_schema()
+        self._schema = schema
+
+        commands = [self._get_command(operation, num_ops, threads,
+                                      consistency, compaction,
+                                      replication_factor, i)
+                    for i in range(len(self.clients))]
+
+        logger.info("Running cassandra-stress " + operation + " with " +
+                    str(len(self.clients)) + " clients x " + str(threads) +
+                    " threads, cl=" + consistency + ", rf=" +
+                    str(replication_factor) + ", " + compaction)
+
+        start_ts = time.time()
+        action = TaktukRemote("{{commands}}", self.clients)
+        action.run()
+
+        if not action.finished_ok:
+            logger.error("cassandra-stress failed")
+            return None
+
+        results = aggregate_stress_results([parse_stress_output(p.stdout)
+                                            for p in action.processes])
+        results.update({
+            "operation": operation,
+            "num_ops": num_ops,
+            "clients": len(self.clients),
+            "threads": threads,
+            "consistency": consistency,
+            "compaction": compaction,
+            "replication_factor": replication_factor,
+            "timestamp": start_ts
+        })
+
+        if "op_rate" in results:
+            logger.info("Op rate: %.1f ops/s" % results["op_rate"])
+
+        if self.results_store is not None:
+            self.results_store.add(results)
+
+        return results
+
+    def sweep(self, operation="write", num_ops=DEFAULT_STRESS_OPERATIONS,
+              **params):
+        """Run cassandra-stress for every combination of the given values.
+
+        Points are ordered so that the schema parameters change as few
+        times as possible, and the schema is only recreated when one of
+        them changes.
+
+        Args:
+          operation (str, optional):
+            The cassandra-stress command (write, read, mixed...).
+          num_ops (int, optional):
+            The number of operations of each client in every point.
+          **params:
+            Lists of values for threads, consistency, compaction and
+            replication_factor. Missing parameters take their default value.
+
+        Returns (list of dict):
+          The result of every successful point.
+        """
+
+        unknown = set(params) - set(SWEEP_PARAMETERS)
+        if unknown:
+            raise ValueError("Unknown sweep parameters " + str(list(unknown)))
+
+        defaults = {
+            "threads": DEFAULT_STRESS_THREADS,
+            "consistency": DEFAULT_STRESS_CONSISTENCY,
+            "compaction": DEFAULT_STRESS_COMPACTION,
+            "replication_factor": DEFAULT_STRESS_REPLICATION_FACTOR
+        }
+        values = [params.get(p, [defaults[p]]) for p in SWEEP_PARAMETERS]
+        points = list(itertools.product(*values))
+
+        logger.info("Sweeping " + str(len(points)) + " points")
+
+        results = []
+        for point in points:
+            res = self.run(operation, num_ops,
+                           **dict(zip(SWEEP_PARAMETERS, point)))
+            if res is not None:
+                results.append(res)
+
+        return results
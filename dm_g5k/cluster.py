@@ -1,7 +1,25 @@
+import functools
+import os
+import shutil
+import tempfile
+
 from abc import ABCMeta, abstractmethod
 
+from execo.action import Remote, TaktukRemote, TaktukPut, ParallelActions
 from execo_engine import logger
 
+from dm_g5k.connections import DEFAULT_SSH_CONTROL_PERSIST, get_ssh_pool
+from dm_g5k.distribution import DEFAULT_DIST_MODE, DEFAULT_DIST_FANOUT, \
+    DEFAULT_DIST_PORT, DEFAULT_DIST_CACHE_DIR, DEFAULT_DIST_CACHE_ENTRIES, \
+    DISTRIBUTION_MODES, install_dist_file, install_cached_dist_file, \
+    get_file_checksum
+from dm_g5k.hostinfo import DEFAULT_HOST_INFO_FILE, DEFAULT_HOST_INFO_TTL, \
+    get_host_info_cache
+from dm_g5k.readiness import DEFAULT_READY_TIMEOUT
+from dm_g5k.storage import DEFAULT_STORAGE_MODE, STORAGE_MODES, \
+    DEFAULT_STORAGE, TMPFS_STORAGE, TMPFS_DIR, get_common_disks
+from dm_g5k.util import run_in_parallel
+
 
 class Cluster(object):
 
@@ -19,6 +37,26 @@ class Cluster(object):
     hosts = []
     master = None
 
+    # Fields not needed by light commands, see serialization
+    heavy_fields = ("hosts", "host_clusters", "conf_hashes")
+
+    # Default properties
+    defaults = {
+        "dist_mode": DEFAULT_DIST_MODE,
+        "dist_fanout": str(DEFAULT_DIST_FANOUT),
+        "dist_port": str(DEFAULT_DIST_PORT),
+        "dist_cache_dir": DEFAULT_DIST_CACHE_DIR,
+        "dist_cache_entries": str(DEFAULT_DIST_CACHE_ENTRIES),
+        "max_parallel_groups": "0",
+        "host_info_file": DEFAULT_HOST_INFO_FILE,
+        "host_info_ttl": str(DEFAULT_HOST_INFO_TTL),
+        "host_info_snapshot": "",
+        "start_timeout": str(DEFAULT_READY_TIMEOUT),
+        "storage_mode": DEFAULT_STORAGE_MODE,
+        "ssh_pool": "false",
+        "ssh_control_persist": str(DEFAULT_SSH_CONTROL_PERSIST)
+    }
+
     @staticmethod
     def get_cluster_type():
         return "cassandra"
@@ -33,11 +71,475 @@ class Cluster(object):
         """
         pass
 
+    def _load_common_properties(self, config):
+        """Load the properties shared by all the cluster types.
+
+        Args:
+          config (ConfigParser):
+            The parser containing the cluster properties.
+        """
+
+        self.dist_mode = config.get("cluster", "dist_mode")
+        self.dist_fanout = config.getint("cluster", "dist_fanout")
+        self.dist_port = config.getint("cluster", "dist_port")
+        self.dist_cache_dir = config.get("cluster", "dist_cache_dir")
+        self.dist_cache_entries = config.getint("cluster",
+                                                "dist_cache_entries")
+        self.max_parallel_groups = config.getint("cluster",
+                                                 "max_parallel_groups")
+
+        self.host_info_file = config.get("cluster", "host_info_file")
+        self.host_info_ttl = config.getint("cluster", "host_info_ttl")
+        self.host_info_snapshot = \
+            config.get("cluster", "host_info_snapshot") or None
+
+        self.start_timeout = config.getint("cluster", "start_timeout")
+
+        self.storage_mode = config.get("cluster", "storage_mode")
+        self.storage_dirs = set()
+
+        self.temp_conf_dir = None
+        self.group_conf_dirs = {}
+        self.conf_hashes = {}
+
+        self.ssh_pool = config.getboolean("cluster", "ssh_pool")
+        self.ssh_control_persist = config.getint("cluster",
+                                                 "ssh_control_persist")
+        self._setup_connections()
+
+        if self.dist_mode not in DISTRIBUTION_MODES:
+            logger.error("Unknown distribution mode " + self.dist_mode)
+            raise ClusterException(
+                "Unknown distribution mode " + self.dist_mode)
+
+        if self.storage_mode not in STORAGE_MODES:
+            logger.error("Unknown storage mode " + self.storage_mode)
+            raise ClusterException(
+                "Unknown storage mode " + self.storage_mode)
+
+    def __get_ssh_pool(self):
+        """Return the shared SSH pool, or None if it is disabled.
+
+        Clusters stored before the pool existed lack its properties, so the
+        defaults are used for them.
+        """
+
+        if not getattr(self, "ssh_pool",
+                       Cluster.defaults["ssh_pool"] == "true"):
+            return None
+
+        return get_ssh_pool(getattr(
+            self, "ssh_control_persist",
+            int(Cluster.defaults["ssh_control_persist"])))
+
+    def _setup_connections(self):
+        """Route the connections to the hosts through the shared SSH pool if
+        it is enabled. Called on creation and after deserialization."""
+
+        pool = self.__get_ssh_pool()
+        if pool:
+            pool.enable()
+
+    def close_connections(self):
+        """Close the persistent SSH connections to the cluster hosts."""
+
+        pool = self.__get_ssh_pool()
+        if pool:
+            pool.close(self.hosts)
+
+    def _get_host_info(self):
+        """Return the cache with the reference data of the hosts.
+
+        Returns (HostInfoCache):
+          The cache shared by all the clusters with the same properties.
+        """
+
+        return get_host_info_cache(self.host_info_file, self.host_info_ttl,
+                                   self.host_info_snapshot)
+
+    def _install_dist_file(self, dist_file, dest_dir):
+        """Copy the distribution file to all cluster nodes and extract it
+        into dest_dir using the configured distribution mode. If a cache dir
+        is configured, nodes already holding an extracted copy of the same
+        file reuse it instead of receiving it again.
+
+        Args:
+          dist_file (str):
+            The file containing the software binaries.
+          dest_dir (str):
+            The remote directory where the software is installed.
+
+        Returns (bool):
+          True if the software was installed in all nodes, False otherwise.
+        """
+
+        if self.dist_cache_dir:
+            # Clusters serialized before the property existed lack it
+            max_entries = getattr(self, "dist_cache_entries",
+                                  int(Cluster.defaults["dist_cache_entries"]))
+            return install_cached_dist_file(self.hosts, dist_file, dest_dir,
+                                            self.dist_cache_dir,
+                                            self.dist_mode, self.dist_fanout,
+                                            self.dist_port, max_entries)
+        else:
+            return install_dist_file(self.hosts, dist_file, dest_dir,
+                                     self.dist_mode, self.dist_fanout,
+                                     self.dist_port)
+
+    def _get_storage_disks(self, hosts):
+        """Return the disks where the data of the given hosts should be
+        placed, according to the storage mode.
+
+        Args:
+          hosts (list of Host):
+            The hosts of a group.
+
+        Returns (list of dict):
+          The disks shared by all the hosts, from the fastest to the
+          slowest, with the directory reserved to the cluster in each one
+          (see storage.parse_storage), or None if the default directories
+          should be used.
+        """
+
+        if self.storage_mode == DEFAULT_STORAGE:
+            return None
+        elif self.storage_mode == TMPFS_STORAGE:
+            disks = [{"disk": "tmpfs", "dir": TMPFS_DIR, "ssd": True,
+                      "nvme": False, "size": 0}]
+        else:
+            disks = get_common_disks(hosts)
+            if not disks:
+                logger.warn("No common writable disks found in " +
+                            str(hosts) + ". Using default directories")
+                return None
+
+        cluster_dir = "dm_g5k-" + self.get_cluster_type()
+        return [dict(d, dir=os.path.join(d["dir"], cluster_dir))
+                for d in disks]
+
+    def _create_storage_dirs(self, dirs, hosts):
+        """Create the given data directories in the hosts and remember them
+        so that they are removed when cleaning the cluster.
+
+        Args:
+          dirs (list of str):
+            The directories to create.
+          hosts (list of Host):
+            The hosts where the directories are created.
+
+        Raises:
+          ClusterException: if the directories cannot be created.
+        """
+
+        action = TaktukRemote("mkdir -p " + " ".join(dirs), hosts)
+        action.run()
+        if not action.finished_ok:
+            raise ClusterException("Could not create data directories " +
+                                   str(dirs))
+        self.storage_dirs.update(dirs)
+
+    def _clean_storage_dirs(self):
+        """Remove the contents of the data directories created by
+        _create_storage_dirs.
+
+        The directories themselves are kept, as the servers expect them to
+        exist when started again, and so are the symbolic links placed in
+        them, which point to other data directories that are cleaned too.
+        """
+
+        if self.storage_dirs:
+            Remote("find " + " ".join(sorted(self.storage_dirs)) +
+                   " -mindepth 1 -maxdepth 1 ! -type l -exec rm -rf {} +",
+                   self.hosts).run()
+
     @abstractmethod
     def initialize(self):
         """Initialize the cluster."""
         self.initialized = True
 
+    def _configure_servers(self, conf_dir, hosts=None):
+        """Adapt the configuration files in conf_dir to the given hosts.
+
+        Args:
+          conf_dir (str):
+            The local directory containing the configuration files.
+          hosts (list of Host, optional):
+            The hosts that will receive the configuration.
+        """
+        pass
+
+    def _new_temp_conf_dir(self):
+        """Create the local directory where the base configuration is
+        rendered, removing the previous one.
+
+        Returns (str):
+          The new directory, also stored in self.temp_conf_dir.
+        """
+
+        if self.temp_conf_dir:
+            shutil.rmtree(self.temp_conf_dir, ignore_errors=True)
+
+        self.temp_conf_dir = tempfile.mkdtemp("", self.get_cluster_type() +
+                                              "-", "/tmp")
+        return self.temp_conf_dir
+
+    def remove_temp_dirs(self):
+        """Remove the local directories where the configuration is
+        rendered."""
+
+        for d in [self.temp_conf_dir] + self.group_conf_dirs.values():
+            if d:
+                shutil.rmtree(d, ignore_errors=True)
+
+        self.temp_conf_dir = None
+        self.group_conf_dirs = {}
+
+    def _reset_conf_hashes(self):
+        """Forget the configuration files known to be in the hosts, so that
+        the next copy sends all of them. To be called whenever the remote
+        configuration directory is removed."""
+
+        self.conf_hashes = {}
+
+    def _copy_conf(self, conf_dir, hosts=None):
+        """Copy the configuration files in conf_dir to the given hosts.
+
+        Only the files whose content differs from the one last copied to
+        each host are sent. Hosts needing the same files receive them in the
+        same transfer, and all the transfers run in parallel.
+
+        Args:
+          conf_dir (str):
+            The local directory containing the configuration files.
+          hosts (list of Host, optional):
+            The hosts where the files are copied. All the cluster hosts are
+            used if not provided.
+
+        Returns (bool):
+          True if the files were copied to all the hosts, False otherwise.
+        """
+
+        if not hosts:
+            hosts = self.hosts
+
+        checksums = dict((f, get_file_checksum(os.path.join(conf_dir, f)))
+                         for f in os.listdir(conf_dir))
+
+        # Group hosts by the files they need
+        pending = {}
+        for h in hosts:
+            known = self.conf_hashes.get(h, {})
+            changed = tuple(sorted(f for f in checksums
+                                   if known.get(f) != checksums[f]))
+            if changed:
+                pending.setdefault(changed, []).append(h)
+
+        if not pending:
+            logger.info("Configuration of " + str(len(hosts)) +
+                        " hosts is up to date")
+            return True
+
+        actions = [TaktukPut(pending[files],
+                             [os.path.join(conf_dir, f) for f in files],
+                             self.conf_dir)
+                   for files in sorted(pending)]
+        action = ParallelActions(actions)
+        action.run()
+
+        for (files, put) in zip(sorted(pending), actions):
+            updated = [p.host for p in put.processes if p.ok]
+            for h in updated:
+                known = self.conf_hashes.setdefault(h, {})
+                known.update((f, checksums[f]) for f in files)
+            if updated:
+                logger.info("Updated " + ", ".join(files) + " in " +
+                            str(len(updated)) + " hosts: " + str(updated))
+
+        if not action.finished_ok:
+            logger.warn("Error while copying configuration")
+            if not action.ended:
+                action.kill()
+
+        return action.finished_ok
+
+    def _configure_groups(self, copy=True):
+        """Configure each group of hosts sharing the same hardware and copy
+        the resulting configuration to them.
+
+        Groups are processed concurrently, with at most max_parallel_groups
+        of them at the same time (0 means no limit). Every group starts from
+        a copy of the base configuration in self.temp_conf_dir.
+
+        Args:
+          copy (bool, optional):
+            Whether to copy the configuration to the hosts. If False, it is
+            only rendered in self.group_conf_dirs.
+
+        Raises:
+          ClusterException: if the configuration of any group fails.
+        """
+
+        # Fetch the reference data of all the hosts at once, so that groups
+        # do not wait for each other on the cache lock
+        self._get_host_info().load(self.hosts)
+
+        tasks = {}
+        for g5k_cluster in self.host_clusters:
+            tasks[g5k_cluster] = functools.partial(
+                self._configure_group, g5k_cluster,
+                self.host_clusters[g5k_cluster], copy)
+
+        results = run_in_parallel(tasks, self.max_parallel_groups)
+
+        # Previous configurations are replaced
+        for d in self.group_conf_dirs.values():
+            shutil.rmtree(d, ignore_errors=True)
+
+        self.group_conf_dirs = {}
+        failed_groups = []
+        for g5k_cluster in sorted(results):
+            res = results[g5k_cluster]
+            num_hosts = len(self.host_clusters[g5k_cluster])
+            if res.ok:
+                self.group_conf_dirs[g5k_cluster] = res.result
+                logger.info("Group %s (%d hosts) configured in %.2f s" %
+                            (g5k_cluster, num_hosts, res.elapsed))
+            else:
+                logger.error("Group %s (%d hosts) failed after %.2f s:\n%s" %
+                             (g5k_cluster, num_hosts, res.elapsed, res.error))
+                failed_groups.append(g5k_cluster)
+
+        if failed_groups:
+            raise ClusterException("Configuration failed for groups " +
+                                   ", ".join(failed_groups))
+
+    def _configure_group(self, g5k_cluster, hosts, copy=True):
+        """Create the configuration of a group of hosts and copy it to them.
+
+        Args:
+          g5k_cluster (str):
+            The name of the group.
+          hosts (list of Host):
+            The hosts in the group.
+          copy (bool, optional):
+            Whether to copy the configuration to the hosts.
+
+        Returns (str):
+          The local directory containing the configuration of the group.
+        """
+
+        conf_dir = tempfile.mkdtemp("", self.get_cluster_type() + "-" +
+                                    g5k_cluster + "-", "/tmp")
+        for f in os.listdir(self.temp_conf_dir):
+            shutil.copy(os.path.join(self.temp_conf_dir, f), conf_dir)
+
+        self._configure_servers(conf_dir, hosts)
+
+        if copy and not self._copy_conf(conf_dir, hosts):
+            raise ClusterException("Error while copying configuration to " +
+                                   g5k_cluster)
+
+        return conf_dir
+
+    def _prepare_conf(self):
+        """Render the base configuration of the cluster in
+        self.temp_conf_dir."""
+        pass
+
+    def _get_restart_batches(self, batch_size):
+        """Return the groups of hosts restarted together in a rolling update.
+
+        Args:
+          batch_size (int):
+            The maximum number of hosts in a batch.
+
+        Returns (list of list of Host):
+          The batches, in restart order.
+        """
+
+        return [self.hosts[i:i + batch_size]
+                for i in range(0, len(self.hosts), batch_size)]
+
+    def _stop_nodes(self, hosts):
+        """Gracefully stop the server in the given hosts.
+
+        Returns (bool):
+          True if the servers were stopped, False otherwise.
+        """
+
+        raise ClusterException(self.get_cluster_type() +
+                               " clusters do not support rolling updates")
+
+    def _start_nodes(self, hosts):
+        """Start the server in the given hosts and wait until they rejoin the
+        cluster.
+
+        Returns (bool):
+          True if the hosts are back in the cluster, False otherwise.
+        """
+
+        raise ClusterException(self.get_cluster_type() +
+                               " clusters do not support rolling updates")
+
+    def rolling_restart(self, batch_size=1, reconfigure=False):
+        """Restart the cluster one batch of hosts at a time, so that the rest
+        of them keep serving requests. Data is preserved.
+
+        Args:
+          batch_size (int, optional):
+            The number of hosts restarted at the same time.
+          reconfigure (bool, optional):
+            Whether to render the configuration again from the local conf
+            dir and push it to every batch before restarting it.
+
+        Raises:
+          ClusterException: if a batch does not rejoin the cluster. The
+            remaining batches are not restarted.
+        """
+
+        self._check_initialization()
+
+        if reconfigure:
+            logger.info("Rendering new configuration")
+            self._prepare_conf()
+            self._configure_groups(copy=False)
+
+        host_groups = dict((h, g) for (g, hosts) in self.host_clusters.items()
+                           for h in hosts)
+
+        batches = self._get_restart_batches(max(1, batch_size))
+        for (i, batch) in enumerate(batches):
+            logger.info("Updating batch " + str(i + 1) + "/" +
+                        str(len(batches)) + ": " + str(batch))
+
+            if self.running and not self._stop_nodes(batch):
+                raise ClusterException("Could not stop " + str(batch))
+
+            if reconfigure:
+                for g5k_cluster in set(host_groups[h] for h in batch):
+                    group_batch = [h for h in batch
+                                   if host_groups[h] == g5k_cluster]
+                    if not self._copy_conf(
+                            self.group_conf_dirs[g5k_cluster], group_batch):
+                        raise ClusterException(
+                            "Could not copy configuration to " +
+                            str(group_batch))
+
+            if self.running and not self._start_nodes(batch):
+                raise ClusterException(str(batch) + " did not rejoin the "
+                                       "cluster")
+
+    def rolling_reconfigure(self, batch_size=1):
+        """Apply the local configuration to a running cluster with a rolling
+        restart, without cleaning its data.
+
+        Args:
+          batch_size (int, optional):
+            The number of hosts updated at the same time.
+        """
+
+        self.rolling_restart(batch_size, reconfigure=True)
+
     def _check_initialization(self):
         """ Check whether the cluster is initialized and raise and exception if
         not.
@@ -48,6 +550,39 @@ class Cluster(object):
             raise ClusterNotInitializedException(
                 "The cluster should be initialized")
 
+    def get_ycsb_binding(self):
+        """Return the YCSB binding used to benchmark the cluster.
+
+        Returns (tuple of (str, dict)):
+          The name of the binding and the properties needed to connect to the
+          cluster.
+        """
+
+        raise ClusterException(self.get_cluster_type() +
+                               " clusters do not support YCSB")
+
+    def prepare_ycsb(self):
+        """Create the structures needed by YCSB before loading data."""
+        pass
+
+    def load_data(self, chunks, namespace, loaders=None):
+        """Bulk load a dataset staged in parallel to the loader hosts.
+
+        Args:
+          chunks (list of str):
+            The local files or directories with the input data.
+          namespace (str):
+            Where the data is loaded, in the format of the framework.
+          loaders (list of Host, optional):
+            The hosts where the loading tool is executed.
+
+        Returns (bool):
+          True if all the data was loaded, False otherwise.
+        """
+
+        raise ClusterException(self.get_cluster_type() +
+                               " clusters do not support data loading")
+
     @abstractmethod
     def start(self):
         """Start the server"""
@@ -0,0 +1,125 @@
+import threading
+
+from execo.action import Local, ParallelActions
+from execo.config import default_connection_params
+from execo_engine import logger
+
+# Default parameters
+DEFAULT_SSH_CONTROL_PERSIST = 600
+
+# /tmp exists in every node, which matters when taktuk propagates itself and
+# nodes connect to each other
+CONTROL_PATH = "/tmp/.dm_g5k_ssh_%u_%r@%h:%p"
+
+POOLED_PARAMS = ["ssh_options", "scp_options", "taktuk_connector_options"]
+
+
+class SshPool(object):
+    """A pool of persistent SSH connections based on ControlMaster.
+
+    Once enabled, the first connection to a host becomes a master that
+    stays open for persist seconds after its last use, and every following
+    ssh, scp or taktuk connection to the host is multiplexed over it
+    instead of negotiating a new session. The pool works by extending
+    execo's default connection params, so all the actions created by the
+    clusters use it without further changes. Masters outlive the process,
+    so successive invocations of the command line tools also reuse them,
+    until they expire or are closed.
+
+    Enabling the pool affects every action created afterwards in the
+    process, including those of clusters that did not ask for it, so
+    clusters only enable it when their ssh_pool property is set.
+    """
+
+    def __init__(self, persist=DEFAULT_SSH_CONTROL_PERSIST):
+        """Create a new pool.
+
+        Args:
+          persist (int, optional):
+            The number of seconds idle masters are kept open.
+        """
+
+        self.persist = persist
+        self.enabled = False
+        self._original_params = {}
+
+    def get_options(self):
+        """Return the ssh options enabling connection multiplexing.
+
+        Returns (tuple of str):
+          The options, to be added to ssh, scp or taktuk connector options.
+        """
+
+        return ("-o", "ControlMaster=auto",
+                "-o", "ControlPath=" + CONTROL_PATH,
+                "-o", "ControlPersist=" + str(self.persist))
+
+    def enable(self):
+        """Make all new connections go through the pool."""
+
+        if self.enabled:
+            return
+
+        for param in POOLED_PARAMS:
+            self._original_params[param] = default_connection_params[param]
+            default_connection_params[param] = (
+                tuple(default_connection_params[param]) + self.get_options())
+
+        self.enabled = True
+        logger.debug("SSH connection pool enabled")
+
+    def disable(self):
+        """Make new connections go directly to the hosts. Open masters are
+        not closed."""
+
+        if not self.enabled:
+            return
+
+        default_connection_params.update(self._original_params)
+        self._original_params = {}
+
+        self.enabled = False
+        logger.debug("SSH connection pool disabled")
+
+    def close(self, hosts):
+        """Close the masters open to the given hosts.
+
+        Args:
+          hosts (list of Host): the hosts whose connections are closed.
+        """
+
+        actions = []
+        for h in hosts:
+            target = h.address if not h.user else h.user + "@" + h.address
+            port = " -p " + str(h.port) if h.port else ""
+            actions.append(Local("ssh -o ControlPath=" + CONTROL_PATH +
+                                 port + " -O exit " + target))
+
+        action = ParallelActions(actions)
+        for a in actions:
+            for p in a.processes:
+                p.nolog_exit_code = p.nolog_error = True
+        action.run()
+
+
+__pool = None
+__pool_lock = threading.Lock()
+
+
+def get_ssh_pool(persist=DEFAULT_SSH_CONTROL_PERSIST):
+    """Return the pool shared by all the clusters of the process.
+
+    Args:
+      persist (int, optional):
+        The number of seconds idle masters are kept open. Only used when the
+        pool is created.
+
+    Returns (SshPool):
+      The shared pool.
+    """
+
+    global __pool
+    with __pool_lock:
+        if __pool is None:
+            __pool = SshPool(persist)
+        return __pool
@@ -0,0 +1,355 @@
+import hashlib
+import os
+import time
+
+from execo.action import TaktukPut, TaktukRemote, Local, ParallelActions, \
+    SequentialActions
+from execo.config import default_connection_params
+from execo.process import Process
+from execo.ssh_utils import get_ssh_command
+from execo_engine import logger
+
+from dm_g5k.util import get_stream_extract_command
+
+# Distribution modes
+FLAT_DISTRIBUTION = "flat"
+CHAIN_DISTRIBUTION = "chain"
+TREE_DISTRIBUTION = "tree"
+STREAM_DISTRIBUTION = "stream"
+
+DISTRIBUTION_MODES = [FLAT_DISTRIBUTION,
+                      CHAIN_DISTRIBUTION,
+                      TREE_DISTRIBUTION,
+                      STREAM_DISTRIBUTION]
+
+# Default parameters
+DEFAULT_DIST_MODE = FLAT_DISTRIBUTION
+DEFAULT_DIST_FANOUT = 2
+DEFAULT_DIST_PORT = 34567
+DEFAULT_DIST_CACHE_DIR = "/tmp/dm_g5k_cache"
+DEFAULT_DIST_CACHE_ENTRIES = 2
+
+NC = "/bin/nc.traditional"
+SEND_RETRIES = 50
+SEND_RETRY_DELAY = 0.2
+
+# Broadcasts taking longer than this are considered stalled
+BROADCAST_MIN_TIMEOUT = 120
+BROADCAST_MIN_RATE = 5 * 1024 * 1024
+
+
+def get_file_checksum(file_name, block_size=1 << 20):
+    """Return the SHA-1 checksum of the given file.
+
+    Args:
+      file_name (str): the path of the file.
+      block_size (int, optional): the size of the chunks read from the file.
+
+    Returns (str):
+      The hexadecimal digest of the file contents.
+    """
+
+    digest = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        block = f.read(block_size)
+        while block:
+            digest.update(block)
+            block = f.read(block_size)
+
+    return digest.hexdigest()
+
+
+def build_broadcast_tree(hosts, mode, fanout=DEFAULT_DIST_FANOUT):
+    """Organize the hosts in a broadcast tree rooted at the local machine.
+
+    In chain mode the frontend seeds fanout nodes, each of them heading a
+    chain that traverses a slice of the remaining hosts. In tree mode the
+    hosts are placed in a fanout-ary tree whose root is the frontend.
+
+    Args:
+      hosts (list of Host):
+        The hosts to organize.
+      mode (str):
+        Either CHAIN_DISTRIBUTION or TREE_DISTRIBUTION.
+      fanout (int, optional):
+        The number of chains or the arity of the tree.
+
+    Returns (tuple of (list of Host, dict of Host -> list of Host)):
+      The hosts directly fed by the frontend and the children of every host.
+    """
+
+    fanout = max(1, min(fanout, len(hosts)))
+    children = dict((h, []) for h in hosts)
+
+    if mode == CHAIN_DISTRIBUTION:
+        chains = [hosts[i::fanout] for i in range(fanout)]
+        for chain in chains:
+            for (prev, nxt) in zip(chain[:-1], chain[1:]):
+                children[prev].append(nxt)
+        seeds = [chain[0] for chain in chains]
+    elif mode == TREE_DISTRIBUTION:
+        # Heap layout with the frontend in position 0
+        seeds = hosts[0:fanout]
+        for (i, h) in enumerate(hosts):
+            pos = i + 1
+            first_child = fanout * pos
+            children[h] = hosts[first_child:first_child + fanout]
+    else:
+        raise ValueError("Unknown broadcast mode " + str(mode))
+
+    return seeds, children
+
+
+def _send_command(host, port, stdin=None):
+    """Return a shell loop sending its input to the given host, retrying
+    while the receiving end is not yet listening."""
+
+    redirect = " < " + stdin if stdin else ""
+    return ("for i in $(seq " + str(SEND_RETRIES) + "); do " +
+            NC + " -q 0 " + host.address + " " + str(port) + redirect +
+            " && break; sleep " + str(SEND_RETRY_DELAY) + "; done")
+
+
+def _forward_command(children, port, extract_cmd):
+    """Return the command run on a node of the broadcast tree: receive the
+    stream, forward it to the children and extract it on the fly."""
+
+    receive = NC + " -l -p " + str(port)
+    if not children:
+        return receive + " | " + extract_cmd
+
+    fifos = ["/tmp/dm_g5k_dist_" + str(port) + "_" + str(i)
+             for i in range(len(children))]
+    senders = " ".join("(" + _send_command(c, port) + ") < " + f + " &"
+                       for (c, f) in zip(children, fifos))
+
+    return ("rm -f " + " ".join(fifos) + " ; " +
+            "mkfifo " + " ".join(fifos) + " && " +
+            senders + " " +
+            receive + " | tee " + " ".join(fifos) + " | " + extract_cmd +
+            " ; status=$? ; wait ; rm -f " + " ".join(fifos) +
+            " ; exit $status")
+
+
+def _flat_install(hosts, dist_file, dest_dir):
+    """Copy the file to every host and extract it afterwards."""
+
+    remote_file = "/tmp/" + os.path.basename(dist_file)
+
+    put_file = TaktukPut(hosts, [dist_file], "/tmp")
+    extract = TaktukRemote("mkdir -p " + dest_dir + " && " +
+                           get_stream_extract_command(dist_file, dest_dir) +
+                           " < " + remote_file + " ; status=$? ; " +
+                           "rm -f " + remote_file + " ; exit $status",
+                           hosts)
+    action = SequentialActions([put_file, extract])
+    action.run()
+
+    return action.ok
+
+
+def _broadcast_install(hosts, dist_file, dest_dir, mode, fanout, port):
+    """Stream the file through a chain or tree of hosts, extracting it on
+    every node as it arrives.
+
+    A node failing in the middle of a chain or tree leaves its descendants
+    listening forever, so the whole broadcast is given a deadline based on
+    the size of the file, after which all the processes are killed.
+    """
+
+    (seeds, children) = build_broadcast_tree(hosts, mode, fanout)
+
+    extract_cmd = get_stream_extract_command(dist_file, dest_dir)
+    commands = ["mkdir -p " + dest_dir + " && " +
+                _forward_command(children[h], port, extract_cmd)
+                for h in hosts]
+
+    timeout = (BROADCAST_MIN_TIMEOUT +
+               os.path.getsize(dist_file) / float(BROADCAST_MIN_RATE))
+    deadline = time.time() + timeout
+
+    receivers = TaktukRemote("bash -c '{{commands}}'", hosts)
+    receivers.start()
+
+    senders = [Process(_send_command(s, port, dist_file), shell=True)
+               for s in seeds]
+    for s in senders:
+        s.start()
+    for s in senders:
+        s.wait(timeout=max(0, deadline - time.time()))
+
+    if not all(s.ended and s.ok for s in senders):
+        logger.warn("Could not send " + dist_file + " to the seed nodes")
+        for s in senders:
+            if not s.ended:
+                s.kill()
+        receivers.kill()
+
+    receivers.wait(timeout=max(0, deadline - time.time()))
+
+    if not receivers.ended:
+        stalled = [p.host for p in receivers.processes if not p.ended]
+        logger.warn("Broadcast of " + dist_file + " did not finish in " +
+                    "%d s. Stalled hosts: " % timeout + str(stalled))
+        receivers.kill()
+        receivers.wait()
+        return False
+
+    return receivers.ok
+
+
+def _stream_install(hosts, dist_file, dest_dir):
+    """Pipe the file from the frontend into the extraction command of every
+    host, so that no intermediate copy of the archive is written."""
+
+    # Binary data cannot go through a pseudo-terminal
+    ssh_options = tuple(o for o in default_connection_params["ssh_options"]
+                        if o != "-tt")
+
+    remote_cmd = ("mkdir -p " + dest_dir + " && " +
+                  get_stream_extract_command(dist_file, dest_dir))
+
+    actions = []
+    for h in hosts:
+        ssh_cmd = get_ssh_command(h.user, h.keyfile, h.port,
+                                  {"ssh_options": ssh_options})
+        actions.append(Local(" ".join(ssh_cmd) + " " + h.address +
+                             " '" + remote_cmd + "' < " + dist_file,
+                             process_args={"shell": True}))
+
+    action = ParallelActions(actions)
+    action.run()
+
+    return action.ok
+
+
+def install_dist_file(hosts, dist_file, dest_dir, mode=DEFAULT_DIST_MODE,
+                      fanout=DEFAULT_DIST_FANOUT, port=DEFAULT_DIST_PORT):
+    """Copy a distribution archive to the given hosts and extract it into
+    dest_dir, removing the top-level directory of the archive.
+
+    Args:
+      hosts (list of Host):
+        The hosts where the archive is installed.
+      dist_file (str):
+        The local path of the archive.
+      dest_dir (str):
+        The remote directory where the archive contents are placed.
+      mode (str, optional):
+        How the archive is sent to the hosts. FLAT_DISTRIBUTION copies it
+        from the frontend to every host, while CHAIN_DISTRIBUTION and
+        TREE_DISTRIBUTION seed a few nodes that forward the stream to the
+        rest of them. STREAM_DISTRIBUTION pipes the archive from the
+        frontend straight into the extraction command of every host.
+      fanout (int, optional):
+        The number of chains or the arity of the tree.
+      port (int, optional):
+        The TCP port used for node-to-node transfers.
+
+    Returns (bool):
+      True if the archive was installed in all hosts, False otherwise.
+    """
+
+    if not hosts:
+        return True
+
+    logger.info("Distributing " + dist_file + " to " + str(len(hosts)) +
+                " hosts (" + mode + ")")
+
+    if mode == FLAT_DISTRIBUTION:
+        ok = _flat_install(hosts, dist_file, dest_dir)
+    elif mode in (CHAIN_DISTRIBUTION, TREE_DISTRIBUTION):
+        ok = _broadcast_install(hosts, dist_file, dest_dir, mode, fanout,
+                                port)
+    elif mode == STREAM_DISTRIBUTION:
+        ok = _stream_install(hosts, dist_file, dest_dir)
+    else:
+        raise ValueError("Unknown distribution mode " + str(mode))
+
+    if not ok:
+        logger.error("Error while distributing " + dist_file)
+
+    return ok
+
+
+def install_cached_dist_file(hosts, dist_file, dest_dir, cache_dir,
+                             mode=DEFAULT_DIST_MODE,
+                             fanout=DEFAULT_DIST_FANOUT,
+                             port=DEFAULT_DIST_PORT,
+                             max_entries=DEFAULT_DIST_CACHE_ENTRIES):
+    """Install a distribution archive in dest_dir through a node-local cache.
+
+    The archive is extracted into a cache entry named after its checksum.
+    Only the hosts without a complete entry for that checksum receive the
+    archive; the rest of them just copy their local entry into dest_dir.
+    Afterwards only the max_entries most recently used entries are kept.
+
+    Args:
+      hosts (list of Host):
+        The hosts where the archive is installed.
+      dist_file (str):
+        The local path of the archive.
+      dest_dir (str):
+        The remote directory where the archive contents are placed.
+      cache_dir (str):
+        The node-local directory where extracted archives are kept.
+      mode (str, optional):
+        The distribution mode used for the hosts with a missing entry.
+      fanout (int, optional):
+        The number of chains or the arity of the tree.
+      port (int, optional):
+        The TCP port used for node-to-node transfers.
+      max_entries (int, optional):
+        The number of entries kept in the cache of every host.
+
+    Returns (bool):
+      True if the archive was installed in all hosts, False otherwise.
+    """
+
+    if not hosts:
+        return True
+
+    entry = os.path.join(cache_dir, get_file_checksum(dist_file))
+    marker = entry + ".complete"
+
+    # Look for hosts with a complete cache entry
+    check = TaktukRemote("test -f " + marker, hosts)
+    for p in check.processes:
+        p.nolog_exit_code = p.nolog_error = True
+    check.run()
+
+    missing_hosts = [p.host for p in check.processes if not p.ok]
+    logger.info("Distribution file cached in " +
+                str(len(hosts) - len(missing_hosts)) + " of " +
+                str(len(hosts)) + " hosts")
+
+    # Fill the cache in the hosts missing it
+    if missing_hosts:
+        TaktukRemote("rm -rf " + entry + " " + marker, missing_hosts).run()
+        if not install_dist_file(missing_hosts, dist_file, entry, mode,
+                                 fanout, port):
+            return False
+        TaktukRemote("touch " + marker, missing_hosts).run()
+
+    # Copy the cached tree into its final location and evict the least
+    # recently used entries (markers are touched on every use)
+    copy = TaktukRemote("rm -rf " + dest_dir + " && " +
+                        "mkdir -p " + os.path.dirname(dest_dir) + " && " +
+                        "cp -a " + entry + " " + dest_dir + " && " +
+                        "touch " + marker,
+                        hosts)
+    copy.run()
+
+    if not copy.ok:
+        logger.error("Error while installing " + dist_file + " from cache")
+
+    evict = TaktukRemote("cd " + cache_dir + " && "
+                         "ls -t *.complete | tail -n +" +
+                         str(max(1, max_entries) + 1) + " | "
+                         "while read m ; do rm -rf ${m%.complete} $m ; done",
+                         hosts)
+    for p in evict.processes:
+        p.nolog_exit_code = p.nolog_error = True
+    evict.run()
+
+    return copy.ok
@@ -0,0 +1,298 @@
+import getpass
+import json
+import os
+import tempfile
+import threading
+import time
+
+from execo_engine import logger
+from execo_g5k.api_utils import get_host_cluster, get_host_site, \
+    get_host_shortname, get_resource_attributes
+
+from dm_g5k.util import run_in_parallel
+
+__user_login = getpass.getuser()
+
+# Default parameters
+DEFAULT_HOST_INFO_FILE = "/tmp/" + __user_login + "_dm_g5k_hosts.json"
+DEFAULT_HOST_INFO_TTL = 24 * 3600
+
+
+class HostInfoCache(object):
+    """A persistent cache of the Grid5000 reference data of the hosts.
+
+    For every host the cache stores its cluster, site, number of cores,
+    memory (in bytes) and storage devices. Missing or expired entries are
+    retrieved from the reference API with one request per involved cluster,
+    fetching all its nodes at once. The sites are queried in parallel. If a
+    snapshot file is given, the cache is read from it and the API is never
+    contacted.
+    """
+
+    def __init__(self, cache_file=DEFAULT_HOST_INFO_FILE,
+                 ttl=DEFAULT_HOST_INFO_TTL, snapshot_file=None):
+        """Create a new cache.
+
+        Args:
+          cache_file (str, optional):
+            The file where the cache is persisted.
+          ttl (int, optional):
+            The number of seconds an entry is considered valid.
+          snapshot_file (str, optional):
+            A file with entries to be used offline, as written by
+            save_snapshot.
+        """
+
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.snapshot_file = snapshot_file
+        self.offline = snapshot_file is not None
+
+        self._lock = threading.RLock()
+        self._entries = self.__read(snapshot_file or cache_file)
+
+    @staticmethod
+    def __read(file_name):
+        if not file_name or not os.path.exists(file_name):
+            return {}
+
+        try:
+            with open(file_name) as f:
+                return json.load(f)
+        except ValueError:
+            logger.warn("Ignoring corrupt host info file " + file_name)
+            return {}
+
+    def __write(self, file_name, entries):
+        dir_name = os.path.dirname(file_name) or "."
+        (fd, temp_file) = tempfile.mkstemp("", ".hostinfo-", dir_name)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f)
+        os.rename(temp_file, file_name)
+
+    def __is_valid(self, entry):
+        return self.offline or time.time() - entry["timestamp"] < self.ttl
+
+    @staticmethod
+    def __parse_node(site, cluster, node):
+        architecture = node.get("architecture", {})
+        return {
+            "cluster": cluster,
+            "site": site,
+            "cores": architecture.get("nb_cores",
+                                      architecture.get("smt_size")),
+            "memory": node.get("main_memory", {}).get("ram_size"),
+            "disks": [{"device": d.get("device"),
+                       "storage": d.get("storage"),
+                       "interface": d.get("interface"),
+                       "size": d.get("size")}
+                      for d in node.get("storage_devices", [])],
+            "timestamp": time.time()
+        }
+
+    def __fetch_site(self, site, clusters):
+        """Retrieve the nodes of the given clusters of a site, one cluster
+        after the other."""
+
+        entries = {}
+        for cluster in clusters:
+            logger.debug("Retrieving reference data of " + cluster)
+            path = "sites/" + site + "/clusters/" + cluster + "/nodes"
+            for node in get_resource_attributes(path)["items"]:
+                entries[node["uid"]] = self.__parse_node(site, cluster, node)
+        return entries
+
+    def load(self, hosts):
+        """Make sure the cache contains valid entries for the given hosts,
+        retrieving the missing ones from the reference API.
+
+        Args:
+          hosts (list of Host): the hosts to look up.
+        """
+
+        with self._lock:
+            missing = {}
+            for h in hosts:
+                name = get_host_shortname(h)
+                entry = self._entries.get(name)
+                if entry is None or not self.__is_valid(entry):
+                    if self.offline:
+                        logger.warn("Host " + name + " not in snapshot " +
+                                    self.snapshot_file)
+                        continue
+                    site = get_host_site(h)
+                    missing.setdefault(site, set()).add(get_host_cluster(h))
+
+            if not missing:
+                return
+
+            tasks = dict((site, (lambda s=site: self.__fetch_site(
+                s, missing[s]))) for site in missing)
+            results = run_in_parallel(tasks)
+
+            for site in sorted(results):
+                if results[site].ok:
+                    self._entries.update(results[site].result)
+                else:
+                    logger.warn("Could not retrieve reference data of " +
+                                site + ":\n" + results[site].error)
+
+            try:
+                self.__write(self.cache_file, self._entries)
+            except (IOError, OSError) as e:
+                logger.warn("Could not write host info cache: " + str(e))
+
+    def get(self, host):
+        """Return the reference data of a host.
+
+        Args:
+          host (Host): the host to look up.
+
+        Returns (dict):
+          The data of the host, with keys cluster, site, cores, memory and
+          disks, or None if it is not available.
+        """
+
+        self.load([host])
+        return self._entries.get(get_host_shortname(host))
+
+    def get_cluster(self, host):
+        """Return the Grid5000 cluster of a host.
+
+        The name is taken from the cache if present, otherwise it is derived
+        from the host name without contacting the reference API.
+        """
+
+        entry = self._entries.get(get_host_shortname(host))
+        if entry:
+            return entry["cluster"]
+        else:
+            return get_host_cluster(host)
+
+    def get_site(self, host):
+        """Return the Grid5000 site of a host without contacting the
+        reference API.
+
+        The name is taken from the cache if present. Otherwise it is taken
+        from the fully qualified name of the host or, failing that, from a
+        cached host of the same cluster.
+
+        Returns (str):
+          The name of the site, or None if it cannot be determined.
+        """
+
+        entry = self._entries.get(get_host_shortname(host))
+        if entry:
+            return entry["site"]
+
+        parts = getattr(host, "address", host).split(".")
+        if len(parts) == 4 and parts[2:] == ["grid5000", "fr"]:
+            return parts[1]
+
+        cluster = self.get_cluster(host)
+        for e in self._entries.values():
+            if e["cluster"] == cluster:
+                return e["site"]
+
+        return None
+
+    def interleave(self, hosts):
+        """Order the given hosts so that the first ones are spread across
+        sites and, inside every site, across clusters.
+
+        Sites and clusters take turns in the order of their first host, and
+        hosts keep their relative order inside each cluster.
+
+        Args:
+          hosts (list of Host): the hosts to order.
+
+        Returns (list of Host):
+          The same hosts in the new order.
+        """
+
+        sites = {}
+        site_order = []
+        for h in hosts:
+            site = self.get_site(h)
+            if site not in sites:
+                sites[site] = []
+                site_order.append(site)
+            sites[site].append(h)
+
+        def round_robin(lists):
+            result = []
+            for i in range(max(len(l) for l in lists)):
+                result.extend(l[i] for l in lists if i < len(l))
+            return result
+
+        site_lists = []
+        for site in site_order:
+            clusters = self.group_by_cluster(sites[site])
+            cluster_order = sorted(clusters, key=lambda c: sites[site].index(
+                clusters[c][0]))
+            site_lists.append(round_robin([clusters[c]
+                                           for c in cluster_order]))
+
+        return round_robin(site_lists) if site_lists else []
+
+    def group_by_cluster(self, hosts):
+        """Group the given hosts by Grid5000 cluster, keeping their order.
+
+        Args:
+          hosts (list of Host): the hosts to group.
+
+        Returns (dict of str -> list of Host):
+          The hosts of every cluster.
+        """
+
+        groups = {}
+        for h in hosts:
+            groups.setdefault(self.get_cluster(h), []).append(h)
+        return groups
+
+    def save_snapshot(self, file_name, hosts=None):
+        """Write the cached entries to a file usable offline.
+
+        Args:
+          file_name (str):
+            The destination file.
+          hosts (list of Host, optional):
+            If given, only the entries of these hosts are written.
+        """
+
+        if hosts is not None:
+            self.load(hosts)
+            names = set(get_host_shortname(h) for h in hosts)
+            entries = dict((n, e) for (n, e) in self._entries.items()
+                           if n in names)
+        else:
+            entries = self._entries
+
+        self.__write(file_name, entries)
+
+
+__caches = {}
+__caches_lock = threading.Lock()
+
+
+def get_host_info_cache(cache_file=DEFAULT_HOST_INFO_FILE,
+                        ttl=DEFAULT_HOST_INFO_TTL, snapshot_file=None):
+    """Return the cache shared by all the clusters with the given parameters.
+
+    Args:
+      cache_file (str, optional):
+        The file where the cache is persisted.
+      ttl (int, optional):
+        The number of seconds an entry is considered valid.
+      snapshot_file (str, optional):
+        A file with entries to be used offline.
+
+    Returns (HostInfoCache):
+      The shared cache.
+    """
+
+    key = (cache_file, ttl, snapshot_file)
+    with __caches_lock:
+        if key not in __caches:
+            __caches[key] = HostInfoCache(cache_file, ttl, snapshot_file)
+        return __caches[key]
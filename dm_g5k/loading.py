@@ -0,0 +1,213 @@
+import os
+import time
+
+from execo.action import TaktukPut, TaktukRemote, ParallelActions, \
+    SequentialActions
+from execo_engine import logger
+
+# Default parameters
+DEFAULT_STAGING_DIR = "/tmp/dm_g5k_load"
+
+MB = 1024 * 1024
+
+
+def get_chunk_files(chunk):
+    """Return the files of an input chunk.
+
+    Args:
+      chunk (str): the local path of a file or a directory of files.
+
+    Returns (list of str):
+      The chunk itself if it is a file, or the files it contains otherwise.
+    """
+
+    if os.path.isdir(chunk):
+        return [os.path.join(chunk, f) for f in sorted(os.listdir(chunk))
+                if os.path.isfile(os.path.join(chunk, f))]
+    else:
+        return [chunk]
+
+
+def get_chunk_size(chunk):
+    """Return the size in bytes of an input chunk."""
+
+    return sum(os.path.getsize(f) for f in get_chunk_files(chunk))
+
+
+def assign_chunks(chunks, hosts):
+    """Distribute the input chunks among the hosts so that every host gets
+    about the same amount of data.
+
+    Chunks are assigned from the biggest to the smallest, each one to the
+    host with less data at the moment.
+
+    Args:
+      chunks (list of str):
+        The local paths of the chunks.
+      hosts (list of Host):
+        The hosts receiving them.
+
+    Returns (dict of Host -> list of str):
+      The chunks of every host. Hosts without chunks are not included.
+    """
+
+    load = dict((h, 0) for h in hosts)
+    assignment = {}
+    for (size, chunk) in sorted(((get_chunk_size(c), c) for c in chunks),
+                                reverse=True):
+        host = min(hosts, key=lambda h: load[h])
+        load[host] += size
+        assignment.setdefault(host, []).append(chunk)
+
+    return assignment
+
+
+def stage_chunks(assignment, dest_dir=DEFAULT_STAGING_DIR, subdir=""):
+    """Copy the chunks assigned to every host to its local disk.
+
+    All the hosts receive their chunks at the same time, one chunk after
+    the other. Every chunk is placed in its own directory, so that files
+    with the same name in different chunks do not collide.
+
+    Args:
+      assignment (dict of Host -> list of str):
+        The chunks of every host, as returned by assign_chunks.
+      dest_dir (str, optional):
+        The remote directory where the chunks are placed. Its previous
+        contents are removed.
+      subdir (str, optional):
+        A path appended to the directory of every chunk, used by tools
+        expecting a given layout.
+
+    Returns (dict of Host -> list of str):
+      The remote directories of the chunks of every host, or None if the
+      chunks could not be staged.
+    """
+
+    hosts = list(assignment)
+    remote_dirs = {}
+    for h in hosts:
+        remote_dirs[h] = [dest_dir + "/" + str(i) + subdir
+                          for i in range(len(assignment[h]))]
+
+    dirs = [" ".join(remote_dirs[h]) for h in hosts]
+    mkdir = TaktukRemote("rm -rf " + dest_dir + " && mkdir -p {{dirs}}",
+                         hosts)
+
+    actions = []
+    for h in hosts:
+        actions.append(SequentialActions(
+            [TaktukPut([h], get_chunk_files(c), d)
+             for (c, d) in zip(assignment[h], remote_dirs[h])]))
+    puts = ParallelActions(actions)
+
+    total_bytes = sum(get_chunk_size(c) for chunks in assignment.values()
+                      for c in chunks)
+    logger.info("Staging " + str(total_bytes // MB) + " MB in " +
+                str(len(hosts)) + " hosts")
+
+    start = time.time()
+    action = SequentialActions([mkdir, puts])
+    action.run()
+    elapsed = max(time.time() - start, 1e-3)
+
+    if not action.finished_ok:
+        logger.warn("Error while staging the input chunks")
+        return None
+
+    logger.info("Staged " + str(total_bytes // MB) + " MB in %.2f s "
+                "(%.1f MB/s)" % (elapsed, total_bytes / elapsed / MB))
+
+    return remote_dirs
+
+
+def run_loaders(commands, sizes):
+    """Execute the loading commands of every host at the same time and
+    report the ingest throughput.
+
+    Args:
+      commands (dict of Host -> str):
+        The shell command loading the data staged in every host.
+      sizes (dict of Host -> int):
+        The bytes loaded by every host, used to compute the throughput.
+
+    Returns (bool):
+      True if all the loaders succeeded, False otherwise.
+    """
+
+    hosts = list(commands)
+    host_commands = ["start=$(date +%s%N) && " + commands[h] +
+                     " && echo $(($(date +%s%N) - start))" for h in hosts]
+
+    action = TaktukRemote("{{host_commands}}", hosts)
+    for p in action.processes:
+        p.nolog_exit_code = p.nolog_error = True
+
+    start = time.time()
+    action.run()
+    elapsed_total = max(time.time() - start, 1e-3)
+
+    total_bytes = 0
+    for p in action.processes:
+        lines = p.stdout.split() if p.ok else []
+        if not lines or not lines[-1].isdigit():
+            logger.warn("Loader in " + str(p.host) + " failed: " +
+                        p.stderr.strip()[-1000:])
+            continue
+        size = sizes.get(p.host, 0)
+        elapsed = max(int(lines[-1]) / 1e9, 1e-3)
+        total_bytes += size
+        logger.info("Loaded " + str(size // MB) + " MB from " +
+                    str(p.host) + " in %.2f s (%.1f MB/s)" %
+                    (elapsed, size / elapsed / MB))
+
+    logger.info("Loaded " + str(total_bytes // MB) + " MB from " +
+                str(len(hosts)) + " hosts in %.2f s (%.1f MB/s)" %
+                (elapsed_total, total_bytes / elapsed_total / MB))
+
+    return action.finished_ok
+
+
+def load_chunks(chunks, hosts, get_command, dest_dir=DEFAULT_STAGING_DIR,
+                subdir=""):
+    """Stage the input chunks in the hosts, load them with the given
+    command and remove them.
+
+    Args:
+      chunks (list of str):
+        The local paths of the chunks, files or directories of files.
+      hosts (list of Host):
+        The hosts where the loaders are executed.
+      get_command (callable):
+        A function receiving the host index and the remote directories of
+        its chunks and returning the command that loads them.
+      dest_dir (str, optional):
+        The remote directory where the chunks are staged.
+      subdir (str, optional):
+        A path appended to the directory of every chunk.
+
+    Returns (bool):
+      True if all the chunks were loaded, False otherwise.
+    """
+
+    if not chunks:
+        logger.warn("No input chunks to load")
+        return True
+
+    assignment = assign_chunks(chunks, hosts)
+    remote_dirs = stage_chunks(assignment, dest_dir, subdir)
+    if remote_dirs is None:
+        return False
+
+    commands = {}
+    sizes = {}
+    for (i, h) in enumerate(hosts):
+        if h in assignment:
+            commands[h] = get_command(i, remote_dirs[h])
+            sizes[h] = sum(get_chunk_size(c) for c in assignment[h])
+
+    ok = run_loaders(commands, sizes)
+
+    TaktukRemote("rm -rf " + dest_dir, list(assignment)).run()
+
+    return ok
@@ -1,18 +1,23 @@
+import json
 import os
 import yaml
 import shutil
 from subprocess import call
-import tempfile
 
 from ConfigParser import ConfigParser
 from yaml import CLoader as Loader, CDumper as Dumper
 
-from execo.action import TaktukPut, Get, Remote, TaktukRemote, \
-    SequentialActions
+from execo.action import Get, Remote, TaktukRemote
 from execo_engine import logger
-from execo_g5k.api_utils import get_host_cluster
+from execo_g5k.api_utils import get_host_shortname
 
-from dm_g5k.cluster import Cluster
+from dm_g5k.cluster import Cluster, ClusterException
+from dm_g5k.loading import DEFAULT_STAGING_DIR, get_chunk_files, \
+    load_chunks
+from dm_g5k.readiness import wait_for_port, wait_for_replica_set
+from dm_g5k.tuning import get_group_resources, compute_mongodb_settings, \
+    apply_mongodb_settings
+from dm_g5k.util import update_yaml_file, write_file_atomically
 
 # Configuration files
 CONF_FILE = "mongodb.conf"
@@ -24,24 +29,67 @@ DEFAULT_MONGODB_CONF_DIR = DEFAULT_MONGODB_BASE_DIR + "/conf"
 DEFAULT_MONGODB_LOGS_FILE = DEFAULT_MONGODB_BASE_DIR + "/mongodb.log"
 
 DEFAULT_MONGODB_PORT = 27017
+DEFAULT_MONGODB_READ_PREFERENCE = "primary"
+
+MAX_VOTING_MEMBERS = 7
+
+DEFAULT_MONGODB_LOAD_WORKERS = 4
+IMPORT_TYPES = {".json": "json", ".csv": "csv", ".tsv": "tsv"}
 
 DEFAULT_MONGODB_LOCAL_CONF_DIR = "conf"
 
 
+def get_replica_set_config(name, members, configsvr=False,
+                           member_options=None):
+    """Return the document initiating a replica set with all its members.
+
+    Args:
+      name (str):
+        The name of the replica set.
+      members (list of str):
+        The host:port address of every member.
+      configsvr (bool, optional):
+        Whether the replica set holds config servers.
+      member_options (list of dict, optional):
+        The options of every member (priority, votes, tags, arbiterOnly,
+        hidden, slaveDelay...), in the same order as members.
+
+    Returns (str):
+      The document, to be passed to rs.initiate().
+    """
+
+    if member_options is None:
+        member_options = [{} for _ in members]
+
+    config = {
+        "_id": name,
+        "members": [dict(options, _id=i, host=m)
+                    for (i, (m, options)) in enumerate(zip(members,
+                                                           member_options))]
+    }
+    if configsvr:
+        config["configsvr"] = True
+
+    return json.dumps(config, sort_keys=True)
+
+
 class MongoDBCluster(Cluster):
     """This class manages the whole life-cycle of a MongoDB cluster.
     """
 
     # Default properties
-    defaults = {
+    defaults = dict(Cluster.defaults, **{
         "mongodb_base_dir": DEFAULT_MONGODB_BASE_DIR,
         "mongodb_data_dir": DEFAULT_MONGODB_DATA_DIR,
         "mongodb_conf_dir": DEFAULT_MONGODB_CONF_DIR,
         "mongodb_logs_file": DEFAULT_MONGODB_LOGS_FILE,
         "mongodb_port": str(DEFAULT_MONGODB_PORT),
+        "mongodb_rs_spec": "",
+        "mongodb_preferred_site": "",
+        "mongodb_read_preference": DEFAULT_MONGODB_READ_PREFERENCE,
 
         "local_base_conf_dir": DEFAULT_MONGODB_LOCAL_CONF_DIR
-    }
+    })
 
     @staticmethod
     def get_cluster_type():
@@ -70,8 +118,19 @@ class MongoDBCluster(Cluster):
         self.conf_dir = config.get("cluster", "mongodb_conf_dir")
         self.logs_file = config.get("cluster", "mongodb_logs_file")
         self.port = config.getint("cluster", "mongodb_port")
+        self.preferred_site = config.get("cluster", "mongodb_preferred_site")
+        self.read_preference = config.get("cluster",
+                                          "mongodb_read_preference")
         self.local_base_conf_dir = config.get("local", "local_base_conf_dir")
 
+        rs_spec_file = config.get("cluster", "mongodb_rs_spec")
+        if rs_spec_file:
+            with open(rs_spec_file) as f:
+                self.rs_spec = json.load(f)
+        else:
+            self.rs_spec = {}
+        self._load_common_properties(config)
+
         self.bin_dir = self.base_dir + "/bin"
 
         # Configure nodes
@@ -81,13 +140,7 @@ class MongoDBCluster(Cluster):
         self.do_replication = len(self.hosts) > 1
 
         # Store cluster information
-        self.host_clusters = {}
-        for h in self.hosts:
-            g5k_cluster = get_host_cluster(h)
-            if g5k_cluster in self.host_clusters:
-                self.host_clusters[g5k_cluster].append(h)
-            else:
-                self.host_clusters[g5k_cluster] = [h]
+        self.host_clusters = self._get_host_info().group_by_cluster(self.hosts)
 
         logger.info("MongoDB cluster created with master " + str(self.master) +
                     " and hosts " + str(self.hosts) +
@@ -101,29 +154,20 @@ class MongoDBCluster(Cluster):
             The file containing MongoDB binaries.
         """
 
-        # 1. Copy hadoop tar file and uncompress
+        # 1. Copy MongoDB tar file and uncompress
         logger.info("Copy " + tar_file + " to hosts and uncompress")
         rm_files = TaktukRemote("rm -rf " + self.base_dir +
                                 " " + self.conf_dir +
                                 " " + self.data_dir +
                                 " " + self.logs_file,
                                 self.hosts)
+        rm_files.run()
+        self._reset_conf_hashes()
+        if not self._install_dist_file(tar_file, self.base_dir):
+            raise ClusterException("Could not install " + tar_file)
 
-        put_tar = TaktukPut(self.hosts, [tar_file], "/tmp")
-        tar_xf = TaktukRemote("tar xf /tmp/" + os.path.basename(tar_file) +
-                              " -C /tmp", self.hosts)
-        SequentialActions([rm_files, put_tar, tar_xf]).run()
-
-        # 2. Move installation to base dir
+        # 2. Create other dirs
         logger.info("Create installation directories")
-        action = Remote(
-            "mv /tmp/" +
-            os.path.basename(tar_file).replace(".tgz", "") + " " +
-            self.base_dir,
-            self.hosts)
-        action.run()
-
-        # 3 Create other dirs
         mkdirs = TaktukRemote("mkdir -p " + self.data_dir +
                               " && mkdir -p " + self.conf_dir +
                               " && touch " + os.path.join(self.conf_dir,
@@ -139,17 +183,19 @@ class MongoDBCluster(Cluster):
         logger.info("Initializing MongoDB")
 
         # Set basic configuration
-        self._copy_base_conf()
-        self._create_master_and_slave_conf()
+        self._prepare_conf()
 
         # Configure hosts depending on resource type
-        for g5k_cluster in self.host_clusters:
-            hosts = self.host_clusters[g5k_cluster]
-            self._configure_servers(hosts)
-            self._copy_conf(self.temp_conf_dir, hosts)
+        self._configure_groups()
 
         self.initialized = True
 
+    def _prepare_conf(self):
+        """Render the base configuration in self.temp_conf_dir."""
+
+        self._copy_base_conf()
+        self._create_master_and_slave_conf()
+
     def _pre_initialize(self):
         """Clean previous configurations"""
 
@@ -165,8 +211,8 @@ class MongoDBCluster(Cluster):
     def _copy_base_conf(self):
         """Copy base configuration files to tmp dir."""
 
-        self.temp_conf_dir = tempfile.mkdtemp("", "mongodb-", "/tmp")
-        if os.path.get_clists(self.local_base_conf_dir):
+        self._new_temp_conf_dir()
+        if os.path.exists(self.local_base_conf_dir):
             base_conf_files = [os.path.join(self.local_base_conf_dir, f)
                                for f in os.listdir(self.local_base_conf_dir)]
             for f in base_conf_files:
@@ -196,57 +242,96 @@ class MongoDBCluster(Cluster):
     def _create_master_and_slave_conf(self):
         """Create master and slaves configuration files."""
 
-        # Load configuration
-        conf_file = os.path.join(self.temp_conf_dir, CONF_FILE)
-        with open(conf_file) as conf_stream:
-            config = yaml.load(conf_stream, Loader=Loader)
-            if not config:
-                config = {}
-
         # General configuration
-        if "systemLog" not in config:
-            config["systemLog"] = {}
-        config["systemLog"]["destination"] = "file"
-        config["systemLog"]["path"] = self.logs_file
-
-        if "net" not in config:
-            config["net"] = {}
-        config["net"]["port"] = str(self.port)
-
-        if "storage" not in config:
-            config["storage"] = {}
-        config["storage"]["dbPath"] = self.data_dir
+        properties = {
+            "systemLog.destination": "file",
+            "systemLog.path": self.logs_file,
+            "net.port": str(self.port),
+            "storage.dbPath": self.data_dir
+        }
 
         # Replication
         if self.do_replication:
             self.rs_name = "mdb_" + str(self.master.address)
-            if "replication" not in config:
-                config["replication"] = {}
-            rep_config = config["replication"]
+            properties["replication.replSetName"] = self.rs_name
 
-            rep_config["replSetName"] = self.rs_name
+        update_yaml_file(os.path.join(self.temp_conf_dir, CONF_FILE),
+                         properties)
 
-        # Write back configuration
-        with open(conf_file, "w") as conf_stream:
-            conf_stream.write(yaml.dump(config, Dumper=Dumper))
-
-    def _configure_servers(self, hosts=None):
-        pass
+    def _configure_servers(self, conf_dir, hosts=None):
+        """Place the database in the fastest disk of the hosts and tune the
+        WiredTiger cache and the journal to their hardware.
 
-    def _copy_conf(self, conf_dir, hosts=None):
+        Args:
+          conf_dir (str):
+            The local directory with the configuration files of the group.
+          hosts (list of Host, optional):
+            The hosts of the group. All the cluster hosts are used if not
+            provided.
+        """
 
         if not hosts:
             hosts = self.hosts
 
-        conf_files = [os.path.join(conf_dir, f) for f in os.listdir(conf_dir)]
+        conf_file = os.path.join(conf_dir, CONF_FILE)
+        with open(conf_file) as conf_stream:
+            config = yaml.load(conf_stream, Loader=Loader) or {}
+
+        # Storage
+        ssd = None
+        disks = self._get_storage_disks(hosts)
+        if disks:
+            db_path = os.path.join(disks[0]["dir"], "db")
+            config.setdefault("storage", {})["dbPath"] = db_path
+            ssd = disks[0]["ssd"]
+            self.__place_journal(db_path, disks, hosts)
+
+        # Hardware
+        resources = get_group_resources(self._get_host_info(), hosts)
+        if resources:
+            if ssd is None:
+                ssd = resources["ssd"]
+            settings = compute_mongodb_settings(resources["cores"],
+                                                resources["memory"], ssd)
+            logger.info("Settings for " + str(len(hosts)) + " hosts with " +
+                        str(resources["cores"]) + " cores and " +
+                        str(resources["memory"] // (1024 * 1024)) + " MB: " +
+                        str(settings))
+            apply_mongodb_settings(config, settings)
+        else:
+            logger.warn("Hardware of " + str(hosts) + " is unknown. "
+                        "Using default settings")
 
-        action = TaktukPut(hosts, conf_files, self.conf_dir)
-        action.run()
+        write_file_atomically(conf_file, yaml.dump(config, Dumper=Dumper))
+
+    def __place_journal(self, db_path, disks, hosts):
+        """Create the database directory and, if there is more than one disk,
+        link its journal to the second one.
 
-        if not action.finished_ok:
-            logger.warn("Error while copying configuration")
-            if not action.ended:
-                action.kill()
+        Args:
+          db_path (str):
+            The database directory, in the first disk.
+          disks (list of dict):
+            The disks of the hosts, from the fastest to the slowest.
+          hosts (list of Host):
+            The hosts of the group.
+        """
+
+        if len(disks) > 1:
+            journal_dir = os.path.join(disks[1]["dir"], "journal")
+            self._create_storage_dirs([db_path, journal_dir], hosts)
+            link = TaktukRemote("ln -sfn " + journal_dir + " " +
+                                os.path.join(db_path, "journal"), hosts)
+            link.run()
+            if not link.finished_ok:
+                raise ClusterException("Could not link the journal to " +
+                                       journal_dir)
+        else:
+            journal_dir = os.path.join(db_path, "journal")
+            self._create_storage_dirs([db_path], hosts)
+
+        logger.info("Storage for " + str(len(hosts)) + " hosts: database in " +
+                    db_path + ", journal in " + journal_dir)
 
     def start(self):
         """Start MongoDB server."""
@@ -273,21 +358,375 @@ class MongoDBCluster(Cluster):
         else:
             self.running = True
 
+        not_listening = wait_for_port(self.hosts, self.port,
+                                      self.start_timeout)
+        if not_listening:
+            logger.warn("MongoDB is not listening in " + str(not_listening))
+            return
+
         # Start replication
-        logger.info("Configuring replication")
         if self.do_replication:
-            mongo_command = "rs.initiate();"
-            mongo_command += ';'.join(
-                'rs.add("' + h.address + ':'+ str(self.port) + '")'
-                for h in self.hosts)
+            logger.info("Configuring replication")
+            if not self._initiate_replica_set(self.rs_name, self.hosts,
+                                              self.port):
+                logger.warn("The replica set is not ready")
+
+    def _get_member_options(self, hosts):
+        """Return the replica set options of the given members.
+
+        By default, members are tagged with their site and cluster, the
+        first one gets the highest priority and the rest of the members in
+        the preferred site (mongodb_preferred_site, or the site of the first
+        member) are preferred over remote ones, so that elections keep the
+        primary close to the clients. Options given for a member in the
+        mongodb_rs_spec file, indexed by address or short name, override the
+        defaults. Only arbiters and the members with the highest priority
+        keep their vote, up to MAX_VOTING_MEMBERS.
+
+        Args:
+          hosts (list of Host):
+            The members of the replica set, the initial primary first.
+
+        Returns (list of dict):
+          The options of every member.
+        """
+
+        host_info = self._get_host_info()
+        preferred_site = self.preferred_site or host_info.get_site(hosts[0])
+
+        all_options = []
+        for (i, h) in enumerate(hosts):
+            site = host_info.get_site(h)
+            cluster = host_info.get_cluster(h)
+
+            if i == 0:
+                priority = 3
+            elif site == preferred_site:
+                priority = 2
+            else:
+                priority = 1
+
+            options = {"priority": priority,
+                       "tags": dict((k, v) for (k, v) in
+                                    (("site", site), ("cluster", cluster))
+                                    if v)}
+            options.update(self.rs_spec.get(
+                h.address, self.rs_spec.get(get_host_shortname(h), {})))
+
+            # Members that can never become primary
+            if options.get("slaveDelay"):
+                options["hidden"] = True
+            if options.get("arbiterOnly"):
+                options.pop("tags", None)
+            if (options.get("arbiterOnly") or options.get("hidden") or
+                    options.get("votes", 1) == 0):
+                options["priority"] = 0
+
+            all_options.append(options)
+
+        # Arbiters only exist to vote, so they keep it
+        voting = sorted((o for o in all_options if o.get("votes", 1)),
+                        key=lambda o: (not o.get("arbiterOnly"),
+                                       -o["priority"]))
+        for options in voting[MAX_VOTING_MEMBERS:]:
+            options["votes"] = 0
+            options["priority"] = 0
+
+        return all_options
+
+    def _initiate_replica_set(self, name, hosts, port, configsvr=False):
+        """Initiate a replica set with all its members at once and wait until
+        it is ready.
+
+        Args:
+          name (str):
+            The name of the replica set.
+          hosts (list of Host):
+            The members of the replica set, the initial primary first.
+          port (int):
+            The port of the members.
+          configsvr (bool, optional):
+            Whether the replica set holds config servers.
+
+        Returns (bool):
+          True if the replica set is ready, False otherwise.
+        """
+
+        member_options = self._get_member_options(hosts)
+        config = get_replica_set_config(
+            name, [h.address + ":" + str(port) for h in hosts], configsvr,
+            member_options)
+
+        num_data_members = len([o for o in member_options
+                                if not o.get("arbiterOnly")])
+
+        return (self.execute_js("rs.initiate(" + config + ")", hosts[0],
+                                port) and
+                wait_for_replica_set(hosts[0], self.bin_dir, port,
+                                     num_data_members, self.start_timeout))
+
+    def _get_replica_sets(self):
+        """Return the replica sets of the cluster.
+
+        Returns (list of tuple of (str, list of Host, int)):
+          The name (None without replication), members and port of every
+          replica set.
+        """
+
+        if self.do_replication:
+            return [(self.rs_name, self.hosts, self.port)]
+        else:
+            return [(None, self.hosts, self.port)]
+
+    def _get_mongod_options(self, host):
+        """Return the command line options of the mongod server of a host,
+        besides its configuration file."""
+
+        return ""
+
+    def _get_primary(self, hosts, port):
+        """Return the current primary of a replica set.
+
+        Args:
+          hosts (list of Host):
+            The members of the replica set.
+          port (int):
+            The port of the members.
+
+        Returns (Host):
+          The primary, or None if it could not be determined.
+        """
+
+        proc = TaktukRemote(self.bin_dir + "/mongo --quiet --port " +
+                            str(port) + " --eval 'print(rs.isMaster().primary)'",
+                            hosts[:1])
+        for p in proc.processes:
+            p.nolog_exit_code = p.nolog_error = True
+        proc.run()
+
+        if not proc.finished_ok:
+            return None
+
+        lines = proc.processes[0].stdout.strip().splitlines()
+        primary = lines[-1] if lines else ""
+        for h in hosts:
+            if primary == h.address + ":" + str(port):
+                return h
+        return None
+
+    def _get_restart_batches(self, batch_size):
+        """Restart the members of every replica set in batches of secondaries
+        and the primary at the end, so that only one election takes place.
+        """
+
+        batches = []
+        for (name, hosts, port) in self._get_replica_sets():
+            primary = self._get_primary(hosts, port) if name else None
+            others = [h for h in hosts if h != primary]
+            batches.extend(others[i:i + batch_size]
+                           for i in range(0, len(others), batch_size))
+            if primary:
+                batches.append([primary])
+        return batches
+
+    def _stop_nodes(self, hosts):
+        """Stop mongod in the given hosts, stepping down any primary among
+        them first.
+
+        Returns (bool):
+          True if the servers were stopped, False otherwise.
+        """
+
+        for (name, members, port) in self._get_replica_sets():
+            if not name or not set(hosts) & set(members):
+                continue
+            primary = self._get_primary(members, port)
+            if primary in hosts:
+                logger.info("Stepping down primary " + str(primary))
+                # The shell loses its connection when the primary steps down
+                step_down = TaktukRemote(
+                    self.bin_dir + "/mongo --quiet --port " + str(port) +
+                    " --eval 'rs.stepDown(60)'", [primary])
+                for p in step_down.processes:
+                    p.nolog_exit_code = p.nolog_error = True
+                step_down.run()
+
+        proc = TaktukRemote(self.bin_dir + "/mongod "
+                            "--shutdown "
+                            "--config " + os.path.join(self.conf_dir,
+                                                       CONF_FILE),
+                            hosts)
+        proc.run()
+
+        return proc.finished_ok
+
+    def _start_nodes(self, hosts):
+        """Start mongod in the given hosts and wait until they are back in
+        their replica sets.
+
+        Returns (bool):
+          True if all the hosts rejoined their replica sets, False otherwise.
+        """
+
+        mongod_options = [self._get_mongod_options(h) for h in hosts]
+        proc = TaktukRemote(self.bin_dir + "/mongod "
+                            "--fork "
+                            "--config " + os.path.join(self.conf_dir,
+                                                       CONF_FILE) +
+                            " {{mongod_options}}",
+                            hosts)
+        proc.run()
+        if not proc.finished_ok:
+            return False
+
+        for (name, members, port) in self._get_replica_sets():
+            restarted = [h for h in members if h in hosts]
+            if not restarted:
+                continue
+            if wait_for_port(restarted, port, self.start_timeout):
+                return False
+            if name:
+                num_data_members = len(
+                    [o for o in self._get_member_options(members)
+                     if not o.get("arbiterOnly")])
+                if not wait_for_replica_set(restarted[0], self.bin_dir, port,
+                                            num_data_members,
+                                            self.start_timeout):
+                    return False
+
+        return True
+
+    def execute_js(self, script, node=None, port=None):
+        """Execute a JavaScript snippet with the mongo shell.
+
+        Args:
+          script (str):
+            The code to execute. It should not contain single quotes.
+          node (Host, optional):
+            The host were the shell is executed. If not provided, self.master
+            is chosen.
+          port (int, optional):
+            The port of the server to connect to. If not provided, self.port
+            is used.
+
+        Returns (bool):
+          True if the code was executed successfully, False otherwise.
+        """
+
+        if not node:
+            node = self.master
+        if not port:
+            port = self.port
+
+        proc = TaktukRemote(self.bin_dir + "/mongo --quiet --port " +
+                            str(port) + " --eval '" + script + "'", [node])
+        proc.run()
+
+        if not proc.finished_ok:
+            logger.warn("Error while executing " + script)
+
+        return proc.finished_ok
+
+    def get_ycsb_binding(self):
+        """Return the YCSB binding for MongoDB and its properties."""
+
+        if self.do_replication:
+            url = ("mongodb://" +
+                   ",".join(h.address + ":" + str(self.port)
+                            for h in self.hosts) +
+                   "/ycsb?replicaSet=" + self.rs_name)
+        else:
+            url = ("mongodb://" + self.master.address + ":" +
+                   str(self.port) + "/ycsb")
+
+        return ("mongodb", {"mongodb.url": url,
+                            "mongodb.readPreference": self.read_preference})
+
+    def prepare_ycsb(self):
+        """Nothing to do: MongoDB creates the YCSB collection on insert."""
+
+        self._check_initialization()
+
+    def _get_loaders(self):
+        """Return the hosts where data loaders are executed by default."""
 
-            proc = TaktukRemote(self.bin_dir + "/mongo "
-                                               "--eval '" + mongo_command + "'",
-                                [self.master])
-            proc.run()
+        return self.hosts
 
-            if not proc.finished_ok:
-                logger.warn("Not able to start replication")
+    def _get_load_targets(self):
+        """Return the addresses loaders connect to. Every loader uses one of
+        them in turns."""
+
+        if self.do_replication:
+            return [self.rs_name + "/" +
+                    ",".join(h.address + ":" + str(self.port)
+                             for h in self.hosts)]
+        else:
+            return [self.master.address + ":" + str(self.port)]
+
+    def load_data(self, chunks, namespace, loaders=None,
+                  workers=DEFAULT_MONGODB_LOAD_WORKERS,
+                  staging_dir=DEFAULT_STAGING_DIR):
+        """Bulk load a collection with mongorestore or mongoimport.
+
+        Chunks are distributed among the loaders and staged in their disks
+        in parallel, and then all the loaders insert their chunks at the
+        same time with several insertion workers each. BSON files, as
+        written by mongodump, are loaded with mongorestore. JSON files and
+        CSV or TSV files with a header line are loaded with mongoimport.
+
+        Args:
+          chunks (list of str):
+            The local files, or directories of files, with the documents.
+            All of them should have the same format.
+          namespace (str):
+            The collection, as database.collection.
+          loaders (list of Host, optional):
+            The hosts where the tools are executed. The data-bearing hosts
+            of the cluster are used if not provided.
+          workers (int, optional):
+            The number of insertion workers of every loader.
+          staging_dir (str, optional):
+            The remote directory where the chunks are staged.
+
+        Returns (bool):
+          True if all the documents were loaded, False otherwise.
+        """
+
+        self._check_initialization()
+
+        if not chunks:
+            logger.warn("No input chunks to load")
+            return True
+
+        (database, collection) = namespace.split(".", 1)
+        ext = os.path.splitext(get_chunk_files(chunks[0])[0])[1]
+
+        if ext == ".bson":
+            tool = "/mongorestore"
+            options = " --numInsertionWorkersPerCollection " + str(workers)
+        elif ext in IMPORT_TYPES:
+            tool = "/mongoimport"
+            options = (" --type " + IMPORT_TYPES[ext] +
+                       " --numInsertionWorkers " + str(workers) +
+                       (" --headerline" if ext != ".json" else "") +
+                       " --file")
+        else:
+            logger.error("Unknown format of " + chunks[0])
+            raise ClusterException("Unknown format of " + chunks[0])
+
+        targets = self._get_load_targets()
+
+        def get_command(i, dirs):
+            return ("for f in " + " ".join(d + "/*" for d in dirs) +
+                    " ; do " + self.bin_dir + tool + " --quiet"
+                    " --host " + targets[i % len(targets)] +
+                    " --db " + database + " --collection " + collection +
+                    options + " $f || exit 1 ; done")
+
+        logger.info("Loading " + str(len(chunks)) + " chunks into " +
+                    namespace)
+        return load_chunks(chunks, loaders or self._get_loaders(),
+                           get_command, staging_dir)
 
     def start_shell(self, node=None):
         """Open a MongoDB shell.
@@ -316,7 +755,8 @@ class MongoDBCluster(Cluster):
 
         proc = TaktukRemote(self.bin_dir + "/mongod "
                             "--shutdown "
-                            "--dbpath " + self.data_dir,
+                            "--config " + os.path.join(self.conf_dir,
+                                                       CONF_FILE),
                             self.hosts)
         proc.run()
 
@@ -355,6 +795,7 @@ class MongoDBCluster(Cluster):
 
         action = Remote("rm -rf " + self.data_dir + "/*", self.hosts)
         action.run()
+        self._clean_storage_dirs()
 
         if restart:
             self.start()
@@ -0,0 +1,379 @@
+import functools
+import json
+import os
+
+from subprocess import call
+from ConfigParser import ConfigParser
+
+from execo.action import TaktukRemote
+from execo_engine import logger
+
+from dm_g5k.cluster import ClusterException
+from dm_g5k.distribution import install_dist_file
+from dm_g5k.mongodb import MongoDBCluster, CONF_FILE
+from dm_g5k.readiness import wait_for_port
+from dm_g5k.util import run_in_parallel
+
+# Default parameters
+DEFAULT_NUM_CONFIG_SERVERS = 3
+DEFAULT_SHARD_SIZE = 3
+DEFAULT_NUM_ROUTERS = 1
+DEFAULT_CONFIG_SERVER_PORT = 27019
+DEFAULT_ROUTER_PORT = 27020
+
+DEFAULT_CHUNKS_PER_SHARD = 4
+
+CONFIG_RS_NAME = "mdb_config"
+SHARD_RS_PREFIX = "mdb_shard"
+
+
+class ShardedMongoDBCluster(MongoDBCluster):
+    """This class manages a sharded MongoDB cluster.
+
+    The hosts are split in three roles: a replica set of config servers, the
+    mongos routers (unless they run in external client hosts) and the
+    shards, each one a replica set of about shard_size members. Shards take
+    their members in turns from the remaining hosts, so that consecutive
+    hosts, usually in the same Grid5000 cluster, end up in different shards.
+    """
+
+    # Routers stay in the light section, as the shell connects to them
+    heavy_fields = MongoDBCluster.heavy_fields + ("config_servers", "shards")
+
+    # Default properties
+    defaults = dict(MongoDBCluster.defaults, **{
+        "mongodb_num_config_servers": str(DEFAULT_NUM_CONFIG_SERVERS),
+        "mongodb_shard_size": str(DEFAULT_SHARD_SIZE),
+        "mongodb_num_routers": str(DEFAULT_NUM_ROUTERS),
+        "mongodb_config_server_port": str(DEFAULT_CONFIG_SERVER_PORT),
+        "mongodb_router_port": str(DEFAULT_ROUTER_PORT)
+    })
+
+    def __init__(self, hosts, config_file=None, routers=None):
+        """Create a new sharded MongoDB cluster with the given hosts.
+
+        Args:
+          hosts (list of Host):
+            The hosts that conform the cluster.
+          config_file (str, optional):
+            The path of the config file to be used.
+          routers (list of Host, optional):
+            The hosts where mongos routers are executed, typically the
+            benchmark clients. If not provided, mongodb_num_routers hosts of
+            the cluster are dedicated to them.
+        """
+
+        super(ShardedMongoDBCluster, self).__init__(hosts, config_file)
+
+        # Load sharding properties
+        config = ConfigParser(self.defaults)
+        config.add_section("cluster")
+        config.add_section("local")
+
+        if config_file:
+            config.readfp(open(config_file))
+
+        self.num_config_servers = config.getint("cluster",
+                                                "mongodb_num_config_servers")
+        self.shard_size = config.getint("cluster", "mongodb_shard_size")
+        self.config_server_port = config.getint("cluster",
+                                                "mongodb_config_server_port")
+        self.router_port = config.getint("cluster", "mongodb_router_port")
+        num_routers = 0 if routers else config.getint("cluster",
+                                                      "mongodb_num_routers")
+
+        # Assign roles
+        num_fixed = self.num_config_servers + num_routers
+        if len(hosts) <= num_fixed:
+            logger.error("At least " + str(num_fixed + 1) + " hosts are "
+                         "needed for a sharded cluster")
+            raise ClusterException("Not enough hosts for a sharded cluster")
+
+        self.config_servers = hosts[:self.num_config_servers]
+        if routers:
+            self.routers = list(routers)
+            self.external_routers = True
+        else:
+            self.routers = hosts[self.num_config_servers:num_fixed]
+            self.external_routers = False
+
+        shard_hosts = hosts[num_fixed:]
+        num_shards = max(1, len(shard_hosts) // self.shard_size)
+        self.shards = [shard_hosts[i::num_shards] for i in range(num_shards)]
+        self.shard_names = [SHARD_RS_PREFIX + str(i)
+                            for i in range(num_shards)]
+
+        # Shards are replica sets on their own
+        self.do_replication = False
+
+        self.routers_log_file = os.path.join(
+            os.path.dirname(self.logs_file), "mongos.log")
+
+        logger.info("Sharded MongoDB cluster with config servers " +
+                    str(self.config_servers) + ", routers " +
+                    str(self.routers) + " and " + str(num_shards) +
+                    " shards: " + str(self.shards))
+
+    def bootstrap(self, tar_file):
+        """Install MongoDB in all cluster nodes and external routers from the
+        specified tgz file.
+
+        Args:
+          tar_file (str):
+            The file containing MongoDB binaries.
+        """
+
+        super(ShardedMongoDBCluster, self).bootstrap(tar_file)
+
+        if self.external_routers:
+            logger.info("Installing MongoDB in " + str(len(self.routers)) +
+                        " routers")
+            TaktukRemote("rm -rf " + self.base_dir, self.routers).run()
+            if not install_dist_file(self.routers, tar_file, self.base_dir,
+                                     self.dist_mode, self.dist_fanout,
+                                     self.dist_port):
+                raise ClusterException("Could not install " + tar_file +
+                                       " in the routers")
+
+    def start(self):
+        """Start the config servers, the shards and the routers, and register
+        the shards in the cluster."""
+
+        self._check_initialization()
+
+        logger.info("Starting sharded MongoDB")
+
+        if self.running:
+            logger.warn("MongoDB was already started")
+            return
+
+        # Config servers
+        if not self.__start_replica_sets([self.config_servers],
+                                         [CONFIG_RS_NAME], "--configsvr",
+                                         self.config_server_port):
+            logger.warn("Config servers could not be started")
+            return
+
+        # Shards
+        if not self.__start_replica_sets(self.shards, self.shard_names,
+                                         "--shardsvr", self.port):
+            logger.warn("Shards could not be started")
+            return
+
+        # Routers
+        config_db = (CONFIG_RS_NAME + "/" +
+                     ",".join(h.address + ":" + str(self.config_server_port)
+                              for h in self.config_servers))
+        proc = TaktukRemote(self.bin_dir + "/mongos --fork"
+                            " --logpath " + self.routers_log_file +
+                            " --port " + str(self.router_port) +
+                            " --configdb " + config_db,
+                            self.routers)
+        proc.run()
+
+        not_listening = wait_for_port(self.routers, self.router_port,
+                                      self.start_timeout)
+        if not proc.finished_ok or not_listening:
+            logger.warn("Routers could not be started")
+            return
+
+        # Register shards
+        logger.info("Adding " + str(len(self.shards)) + " shards")
+        script = "; ".join(
+            'sh.addShard("' + name + "/" +
+            ",".join(h.address + ":" + str(self.port) for h in members) +
+            '")'
+            for (name, members) in zip(self.shard_names, self.shards))
+        if not self.execute_js(script, self.routers[0], self.router_port):
+            logger.warn("Shards could not be added")
+
+    def __start_replica_sets(self, replica_sets, names, role_option, port):
+        """Start the mongod servers of the given replica sets and initiate
+        them concurrently.
+
+        Returns (bool):
+          True if all the replica sets are ready, False otherwise.
+        """
+
+        hosts = [h for members in replica_sets for h in members]
+        rs_names = [name for (name, members) in zip(names, replica_sets)
+                    for _ in members]
+
+        proc = TaktukRemote(self.bin_dir + "/mongod --fork"
+                            " --config " + os.path.join(self.conf_dir,
+                                                        CONF_FILE) +
+                            " " + role_option +
+                            " --replSet {{rs_names}}"
+                            " --port " + str(port),
+                            hosts)
+        proc.run()
+
+        if not proc.finished_ok:
+            return False
+
+        self.running = True
+
+        if wait_for_port(hosts, port, self.start_timeout):
+            return False
+
+        tasks = {}
+        for (name, members) in zip(names, replica_sets):
+            tasks[name] = functools.partial(self._initiate_replica_set,
+                                            name, members, port,
+                                            role_option == "--configsvr")
+        results = run_in_parallel(tasks)
+
+        failed = [n for n in sorted(results)
+                  if not (results[n].ok and results[n].result)]
+        if failed:
+            logger.warn("Replica sets not ready: " + ", ".join(failed))
+
+        return not failed
+
+    def _get_replica_sets(self):
+        """Return the config server and shard replica sets."""
+
+        return ([(CONFIG_RS_NAME, self.config_servers,
+                  self.config_server_port)] +
+                [(name, members, self.port)
+                 for (name, members) in zip(self.shard_names, self.shards)])
+
+    def _get_mongod_options(self, host):
+        """Return the role, replica set and port options of a host."""
+
+        if host in self.config_servers:
+            return ("--configsvr --replSet " + CONFIG_RS_NAME +
+                    " --port " + str(self.config_server_port))
+        for (name, members) in zip(self.shard_names, self.shards):
+            if host in members:
+                return ("--shardsvr --replSet " + name +
+                        " --port " + str(self.port))
+        return ""
+
+    def _get_loaders(self):
+        """Return the shard members, so that loading is spread among all the
+        shards."""
+
+        return [h for members in self.shards for h in members]
+
+    def _get_load_targets(self):
+        """Return the routers, so that loaders spread among them."""
+
+        return [h.address + ":" + str(self.router_port) for h in self.routers]
+
+    def shard_collection(self, namespace, shard_key, hashed=True,
+                         split_points=None,
+                         chunks_per_shard=DEFAULT_CHUNKS_PER_SHARD):
+        """Shard a collection, creating and distributing its chunks before
+        any document is inserted.
+
+        Args:
+          namespace (str):
+            The collection, as database.collection.
+          shard_key (str):
+            The field used as shard key.
+          hashed (bool, optional):
+            Whether to use a hashed shard key. In that case the collection
+            is created with chunks_per_shard chunks in every shard.
+          split_points (list, optional):
+            For ranged shard keys, the values where chunks are split. The
+            resulting chunks are moved to the shards in turns.
+          chunks_per_shard (int, optional):
+            The number of initial chunks of every shard with hashed keys.
+
+        Returns (bool):
+          True if the collection was sharded, False otherwise.
+        """
+
+        self._check_initialization()
+
+        database = namespace.split(".")[0]
+        ns = json.dumps(namespace)
+
+        script = ["sh.enableSharding(" + json.dumps(database) + ")"]
+        if hashed:
+            script.append(
+                "sh.shardCollection(" + ns + ", " +
+                json.dumps({shard_key: "hashed"}) + ", false, " +
+                json.dumps({"numInitialChunks":
+                            chunks_per_shard * len(self.shards)}) + ")")
+        else:
+            script.append("sh.shardCollection(" + ns + ", " +
+                          json.dumps({shard_key: 1}) + ")")
+            for (i, point) in enumerate(split_points or []):
+                key = json.dumps({shard_key: point})
+                shard = self.shard_names[(i + 1) % len(self.shards)]
+                script.append("sh.splitAt(" + ns + ", " + key + ")")
+                script.append("sh.moveChunk(" + ns + ", " + key + ", " +
+                              json.dumps(shard) + ")")
+
+        logger.info("Sharding " + namespace + " by " + shard_key)
+        return self.execute_js("; ".join(script), self.routers[0],
+                               self.router_port)
+
+    def get_ycsb_binding(self):
+        """Return the YCSB binding for MongoDB, connected to the routers."""
+
+        url = ("mongodb://" +
+               ",".join(h.address + ":" + str(self.router_port)
+                        for h in self.routers) + "/ycsb")
+
+        return ("mongodb", {"mongodb.url": url,
+                            "mongodb.readPreference": self.read_preference})
+
+    def prepare_ycsb(self, chunks_per_shard=DEFAULT_CHUNKS_PER_SHARD):
+        """Shard the YCSB collection by hashed _id.
+
+        Args:
+          chunks_per_shard (int, optional):
+            The number of initial chunks of every shard.
+        """
+
+        self.shard_collection("ycsb.usertable", "_id", True,
+                              chunks_per_shard=chunks_per_shard)
+
+    def start_shell(self, node=None):
+        """Open a MongoDB shell connected to a router.
+
+        Args:
+          node (Host, optional):
+            The router were the shell is to be started. If not provided, the
+            first router is chosen.
+        """
+
+        self._check_initialization()
+
+        if not node:
+            node = self.routers[0]
+
+        call("ssh -t " + node.address + " " +
+             self.bin_dir + "/mongo --port " + str(self.router_port),
+             shell=True)
+
+    def stop(self):
+        """Stop the routers, the shards and the config servers."""
+
+        self._check_initialization()
+
+        logger.info("Stopping sharded MongoDB")
+
+        routers = TaktukRemote("pkill -x mongos", self.routers)
+        for p in routers.processes:
+            p.nolog_exit_code = True
+        routers.run()
+
+        shards = TaktukRemote(self.bin_dir + "/mongod --shutdown"
+                              " --config " + os.path.join(self.conf_dir,
+                                                          CONF_FILE),
+                              [h for members in self.shards
+                               for h in members] + self.config_servers)
+        shards.run()
+
+        self.running = False
+
+    def clean_logs(self):
+        """Remove all MongoDB logs, including those of the routers."""
+
+        super(ShardedMongoDBCluster, self).clean_logs()
+
+        TaktukRemote("rm -f " + self.routers_log_file, self.routers).run()
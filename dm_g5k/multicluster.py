@@ -1,27 +1,193 @@
-from dm_g5k.cluster import Cluster
+import threading
+import time
+
+from execo_engine import logger
+
+from dm_g5k.cluster import Cluster, ClusterException
+from dm_g5k.util import TaskResult, run_task
 
 
 class MultiCluster(Cluster):
+    """This class orchestrates the life-cycle of several clusters.
+
+    Operations are executed concurrently on the child clusters, respecting
+    the declared dependencies between them: bootstrap, initialize and start
+    wait for the clusters a child depends on, while stop and clean are
+    executed in the reverse order.
+    """
+
+    @staticmethod
+    def get_cluster_type():
+        return "multi"
+
+    def __init__(self, clusters, dependencies=None, max_workers=0):
+        """Create a new multicluster with the given clusters.
+
+        Args:
+          clusters (list of Cluster):
+            The child clusters.
+          dependencies (dict of Cluster -> list of Cluster, optional):
+            For every child, the clusters that must complete an operation
+            before the child starts it.
+          max_workers (int, optional):
+            The maximum number of children operated at the same time. If 0,
+            there is no limit.
+        """
 
-    def __init__(self, clusters):
         self.clusters = clusters
+        self.max_workers = max_workers
+
+        self.dependencies = dict((c, []) for c in clusters)
+        if dependencies:
+            for (c, deps) in dependencies.items():
+                if c not in self.dependencies or \
+                        any(d not in self.dependencies for d in deps):
+                    raise ClusterException("Dependencies must refer to "
+                                           "clusters of the multicluster")
+                self.dependencies[c] = list(deps)
+
+        self.__check_acyclic()
+
+        self.hosts = [h for c in clusters for h in c.hosts]
+        self.timings = {}
+
+    def __check_acyclic(self):
+        """Raise an exception if the dependencies contain a cycle."""
+
+        visiting = set()
+        visited = set()
+
+        def visit(c):
+            if c in visited:
+                return
+            if c in visiting:
+                raise ClusterException("Cyclic dependency involving " +
+                                       self._get_name(c))
+            visiting.add(c)
+            for d in self.dependencies[c]:
+                visit(d)
+            visiting.remove(c)
+            visited.add(c)
 
-    def initialize(self):
         for c in self.clusters:
-            c.initialize()
+            visit(c)
 
-    def bootstrap(self, dist_file):
+    def _get_name(self, cluster):
+        """Return a readable name for the given child cluster."""
+
+        return (cluster.get_cluster_type() + "-" +
+                str(self.clusters.index(cluster)))
+
+    def _run_operation(self, operation, args=None, reverse=False):
+        """Execute an operation in all the children as soon as their
+        dependencies have completed it.
+
+        Args:
+          operation (str):
+            The name of the method to call in each child.
+          args (dict of Cluster -> tuple, optional):
+            The positional arguments for each child.
+          reverse (bool, optional):
+            If True, a child waits for the clusters depending on it instead
+            of the ones it depends on.
+
+        Raises:
+          ClusterException: if the operation fails in any child.
+        """
+
+        if reverse:
+            waits_for = dict((c, [d for d in self.clusters
+                                  if c in self.dependencies[d]])
+                             for c in self.clusters)
+        else:
+            waits_for = self.dependencies
+
+        if not args:
+            args = {}
+
+        done = dict((c, threading.Event()) for c in self.clusters)
+        results = {}
+        max_workers = self.max_workers
+        if max_workers <= 0 or max_workers > len(self.clusters):
+            max_workers = len(self.clusters)
+        slots = threading.BoundedSemaphore(max_workers)
+
+        def run(c):
+            name = self._get_name(c)
+            try:
+                for d in waits_for[c]:
+                    done[d].wait()
+                failed_deps = [self._get_name(d) for d in waits_for[c]
+                               if not results[d].ok]
+                if failed_deps:
+                    results[c] = TaskResult(name, error="Skipped, " +
+                                            ", ".join(failed_deps) +
+                                            " failed")
+                    return
+
+                with slots:
+                    results[c] = run_task(
+                        name,
+                        lambda: getattr(c, operation)(*args.get(c, ())))
+            finally:
+                done[c].set()
+
+        start = time.time()
+        threads = [threading.Thread(target=run, args=(c,))
+                   for c in self.clusters]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+
+        self.timings[operation] = dict((self._get_name(c), results[c].elapsed)
+                                       for c in self.clusters)
+
+        failed = []
         for c in self.clusters:
-            c.bootstrap()
+            res = results[c]
+            if res.ok:
+                logger.info("%s: %s completed in %.2f s" %
+                            (res.name, operation, res.elapsed))
+            else:
+                logger.error("%s: %s failed after %.2f s:\n%s" %
+                             (res.name, operation, res.elapsed, res.error))
+                failed.append(res.name)
+
+        logger.info("%s completed in %.2f s" % (operation, elapsed))
+
+        if failed:
+            raise ClusterException(operation + " failed for " +
+                                   ", ".join(failed))
+
+    def bootstrap(self, dist_file):
+        """Install the software of every child cluster.
+
+        Args:
+          dist_file (str or dict of Cluster -> str):
+            The file used by all the children or the file of each child.
+        """
+
+        if isinstance(dist_file, dict):
+            args = dict((c, (f,)) for (c, f) in dist_file.items())
+        else:
+            args = dict((c, (dist_file,)) for c in self.clusters)
+
+        self._run_operation("bootstrap", args)
+
+    def initialize(self):
+        self._run_operation("initialize")
+        self.initialized = True
 
     def start(self):
-        for c in self.clusters:
-            c.start()
+        self._run_operation("start")
+        self.running = True
 
     def stop(self):
-        for c in self.clusters:
-            c.stop()
+        self._run_operation("stop", reverse=True)
+        self.running = False
 
     def clean(self):
-        for c in self.clusters:
-            c.clean()
\ No newline at end of file
+        self._run_operation("clean", reverse=True)
+        self.initialized = False
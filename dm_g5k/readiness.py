@@ -0,0 +1,162 @@
+import re
+import time
+
+from execo.action import TaktukRemote
+from execo_engine import logger
+
+# Default parameters
+DEFAULT_READY_TIMEOUT = 300
+
+INITIAL_POLL_DELAY = 0.5
+MAX_POLL_DELAY = 10
+PROBE_TIMEOUT = 30
+
+
+def wait_until_ready(hosts, cmd, timeout=DEFAULT_READY_TIMEOUT, check=None,
+                     description="ready"):
+    """Run a probe command in all the pending hosts at the same time until it
+    succeeds in every one of them or the deadline expires.
+
+    Rounds are separated by an exponential backoff, and every round only
+    probes the hosts that were not ready in the previous one.
+
+    Args:
+      hosts (list of Host):
+        The hosts to probe.
+      cmd (str):
+        The probe command. Substitutions like {{{host}}} are supported.
+      timeout (float, optional):
+        The overall number of seconds to wait.
+      check (callable, optional):
+        A function receiving the host and the output of a successful probe
+        and returning whether the host is ready. If not given, a zero exit
+        code is enough.
+      description (str, optional):
+        What is being waited for, used in log messages.
+
+    Returns (list of Host):
+      The hosts that were not ready before the deadline.
+    """
+
+    deadline = time.time() + timeout
+    delay = INITIAL_POLL_DELAY
+    pending = list(hosts)
+
+    while pending:
+        remaining = deadline - time.time()
+        probe = TaktukRemote(cmd, pending, process_args={
+            "timeout": max(1, min(PROBE_TIMEOUT, remaining))})
+        for p in probe.processes:
+            p.nolog_exit_code = p.nolog_error = p.nolog_timeout = True
+        probe.run()
+
+        pending = [p.host for p in probe.processes
+                   if not (p.ok and (check is None or
+                                     check(p.host, p.stdout)))]
+        if not pending:
+            break
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            logger.warn(str(len(pending)) + " hosts not " + description +
+                        " after " + str(timeout) + " s: " + str(pending))
+            break
+
+        logger.debug(str(len(pending)) + " hosts not " + description +
+                     " yet, retrying in %.1f s" % min(delay, remaining))
+        time.sleep(min(delay, remaining))
+        delay = min(2 * delay, MAX_POLL_DELAY)
+
+    if not pending:
+        logger.info("All " + str(len(hosts)) + " hosts are " + description)
+
+    return pending
+
+
+def wait_for_port(hosts, port, timeout=DEFAULT_READY_TIMEOUT):
+    """Wait until every host accepts TCP connections in the given port.
+
+    Args:
+      hosts (list of Host):
+        The hosts to probe.
+      port (int):
+        The port to connect to.
+      timeout (float, optional):
+        The overall number of seconds to wait.
+
+    Returns (list of Host):
+      The hosts not listening before the deadline.
+    """
+
+    return wait_until_ready(
+        hosts, "bash -c 'echo > /dev/tcp/{{{host}}}/" + str(port) + "'",
+        timeout, description="listening in port " + str(port))
+
+
+def wait_for_cassandra_ring(host, bin_dir, num_nodes,
+                            timeout=DEFAULT_READY_TIMEOUT):
+    """Wait until nodetool reports the given number of nodes Up and Normal.
+
+    Args:
+      host (Host):
+        The node where nodetool is executed.
+      bin_dir (str):
+        The Cassandra bin directory.
+      num_nodes (int):
+        The expected number of nodes in the ring.
+      timeout (float, optional):
+        The overall number of seconds to wait.
+
+    Returns (bool):
+      True if the ring is complete, False otherwise.
+    """
+
+    def all_up(_, stdout):
+        return len(re.findall(r"^UN\s", stdout, re.MULTILINE)) >= num_nodes
+
+    return not wait_until_ready([host], bin_dir + "/nodetool status",
+                                timeout, all_up,
+                                str(num_nodes) + " nodes Up and Normal")
+
+
+def wait_for_replica_set(host, bin_dir, port, num_members,
+                         timeout=DEFAULT_READY_TIMEOUT):
+    """Wait until a MongoDB replica set has a primary and all its members are
+    either primary or secondary.
+
+    Args:
+      host (Host):
+        A member of the replica set.
+      bin_dir (str):
+        The MongoDB bin directory.
+      port (int):
+        The port of the member.
+      num_members (int):
+        The expected number of data-bearing members.
+      timeout (float, optional):
+        The overall number of seconds to wait.
+
+    Returns (bool):
+      True if the replica set is ready, False otherwise.
+    """
+
+    status_cmd = ("var s = rs.status(); "
+                  "var p = 0, n = 0; "
+                  "if (s.ok) { s.members.forEach(function (m) { "
+                  "if (m.state == 1) { p++; } "
+                  "if (m.state == 1 || m.state == 2) { n++; } }); } "
+                  "print(p + \" \" + n);")
+
+    def members_ready(_, stdout):
+        lines = stdout.strip().splitlines()
+        if not lines:
+            return False
+        fields = lines[-1].split()
+        return (len(fields) == 2 and fields[0] == "1" and
+                fields[1].isdigit() and int(fields[1]) >= num_members)
+
+    return not wait_until_ready([host],
+                                bin_dir + "/mongo --quiet --port " +
+                                str(port) + " --eval '" + status_cmd + "'",
+                                timeout, members_ready,
+                                str(num_members) + " replica set members up")
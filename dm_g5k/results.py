@@ -0,0 +1,61 @@
+import csv
+import json
+import os
+import tempfile
+
+
+class ResultsStore(object):
+    """A file collecting benchmark results as flat records.
+
+    The format is chosen from the file extension: .json files contain a list
+    of objects and any other extension produces a CSV file whose columns are
+    the union of the keys of all the records. The file is rewritten
+    atomically after every addition, so partial results survive an
+    interrupted experiment.
+    """
+
+    def __init__(self, file_name):
+        """Create a store backed by the given file, loading the records it
+        already contains.
+
+        Args:
+          file_name (str): the path of the results file.
+        """
+
+        self.file_name = file_name
+        self.records = []
+
+        if os.path.exists(file_name):
+            with open(file_name) as f:
+                if self.__is_json():
+                    self.records = json.load(f)
+                else:
+                    self.records = list(csv.DictReader(f))
+
+    def __is_json(self):
+        return self.file_name.endswith(".json")
+
+    def add(self, record):
+        """Add a record and persist the store.
+
+        Args:
+          record (dict): the values of the record, indexed by column.
+        """
+
+        self.records.append(record)
+        self.save()
+
+    def save(self):
+        """Write all the records to the results file."""
+
+        dir_name = os.path.dirname(os.path.abspath(self.file_name))
+        (fd, temp_file) = tempfile.mkstemp("", ".results-", dir_name)
+        with os.fdopen(fd, "w") as f:
+            if self.__is_json():
+                json.dump(self.records, f, indent=2, sort_keys=True)
+            else:
+                columns = sorted(set(k for r in self.records for k in r))
+                writer = csv.DictWriter(f, columns)
+                writer.writeheader()
+                writer.writerows(self.records)
+        os.rename(temp_file, self.file_name)
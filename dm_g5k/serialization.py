@@ -1,12 +1,79 @@
+import fcntl
 import getpass
+import json
 import os
 import pickle
+import tempfile
+import time
 
+from contextlib import contextmanager
+
+from execo.host import Host
 from execo_engine import logger
 
+from dm_g5k.util import import_class
+
 __user_login = getpass.getuser()
 serialize_base = "/tmp/" + __user_login + "_"
 
+# State format
+STATE_FORMAT = "dm_g5k-cluster"
+STATE_VERSION = 1
+PICKLE_PROTOCOL = 2
+
+
+class StateFormatException(Exception):
+    pass
+
+
+class PartialStateException(Exception):
+    pass
+
+
+class _NotLoaded(object):
+    """Placeholder for a heavy field of a partially deserialized cluster.
+    Any use of it raises a PartialStateException instead of silently working
+    on an empty value."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __fail(self, *args):
+        raise PartialStateException(
+            "Field " + self.name + " was not loaded (the cluster was "
+            "deserialized with partial=True)")
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        self.__fail()
+
+    def __repr__(self):
+        return "<not loaded: " + self.name + ">"
+
+    __iter__ = __len__ = __nonzero__ = __fail
+    __getitem__ = __setitem__ = __delitem__ = __contains__ = __fail
+
+
+class _HostRef(object):
+    """Reference to an entry of the host table of a state section."""
+
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def __reduce__(self):
+        return (_HostRef, (self.index,))
+
+    def __eq__(self, other):
+        return isinstance(other, _HostRef) and self.index == other.index
+
+    def __hash__(self):
+        return hash(self.index)
+
 
 def __get_clusters_dir(cluster_type):
     clusters_dir = serialize_base + cluster_type + "/clusters"
@@ -21,6 +88,84 @@ def __get_cluster_file(cluster_type, cid):
     return __get_clusters_dir(cluster_type) + "/" + str(cid)
 
 
+def __get_registry_file(cluster_type):
+    return serialize_base + cluster_type + "/registry.json"
+
+
+def __scan_registry(cluster_type):
+    """Build the registry from the files in the clusters dir. Used only when
+    the registry does not exist yet."""
+
+    clusters_dir = __get_clusters_dir(cluster_type)
+
+    registry = {"last_used": None, "next_id": 1, "clusters": {}}
+    for f in os.listdir(clusters_dir):
+        if f.isdigit():
+            fstat = os.stat(os.path.join(clusters_dir, f))
+            registry["clusters"][f] = fstat.st_atime
+            registry["next_id"] = max(registry["next_id"], int(f) + 1)
+
+    if registry["clusters"]:
+        registry["last_used"] = int(max(registry["clusters"],
+                                        key=registry["clusters"].get))
+
+    return registry
+
+
+@contextmanager
+def __registry(cluster_type, write=False):
+    """Give access to the registry of the given cluster type.
+
+    The registry is a JSON file recording the last used id, the next id to
+    generate and the last access time of each cluster. Access is serialized
+    with a lock file and modifications are written atomically.
+
+    Args:
+      cluster_type (str):
+        The type of cluster.
+      write (bool, optional):
+        Whether the registry is going to be modified. In that case an
+        exclusive lock is held and the registry is written back on exit.
+    """
+
+    registry_file = __get_registry_file(cluster_type)
+    __get_clusters_dir(cluster_type)
+
+    with open(registry_file + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+        try:
+            if not write and not os.path.exists(registry_file):
+                # Rebuilding the registry writes it: take the exclusive lock
+                # and check again, another process may have done it
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                write = True
+
+            if os.path.exists(registry_file):
+                with open(registry_file) as f:
+                    registry = json.load(f)
+            else:
+                registry = __scan_registry(cluster_type)
+                write = True
+
+            yield registry
+
+            if write:
+                (fd, temp_file) = tempfile.mkstemp(
+                    "", ".registry-", os.path.dirname(registry_file))
+                with os.fdopen(fd, "w") as f:
+                    json.dump(registry, f)
+                os.rename(temp_file, registry_file)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def __mark_used(cluster_type, cid):
+    with __registry(cluster_type, write=True) as registry:
+        registry["last_used"] = int(cid)
+        registry["clusters"][str(cid)] = time.time()
+        registry["next_id"] = max(registry["next_id"], int(cid) + 1)
+
+
 def get_default_id(cluster_type):
     """Return the last used id.
 
@@ -28,25 +173,15 @@ def get_default_id(cluster_type):
       cluster_type (str): the type of cluster.
 
     Returns:
-      int: The id of the most recently modified cluster.
+      int: The id of the most recently used cluster.
     """
-    files = os.listdir(__get_clusters_dir(cluster_type))
 
-    most_recent_file = None
-    most_recent_access = 0
-
-    for f in files:
-        if not f.endswith(".hc"):
-            fstat = os.stat(os.path.join(__get_clusters_dir(cluster_type), f))
-            if fstat.st_atime > most_recent_access:
-                most_recent_file = int(f)
-                most_recent_access = fstat.st_atime
-
-    return most_recent_file
+    with __registry(cluster_type) as registry:
+        return registry["last_used"]
 
 
 def generate_new_id(cluster_type):
-    """Return the highest generated id + 1.
+    """Reserve and return a new id, higher than any id generated before.
 
     Args:
       cluster_type (str): the type of cluster.
@@ -55,17 +190,11 @@ def generate_new_id(cluster_type):
       The new generated id.
     """
 
-    files = os.listdir(__get_clusters_dir(cluster_type))
-
-    if len(files) == 0:
-        return 1
-    else:
-        highest_id = 0
-
-        for f in files:
-            highest_id = max(highest_id, int(f))
+    with __registry(cluster_type, write=True) as registry:
+        new_id = registry["next_id"]
+        registry["next_id"] = new_id + 1
 
-        return highest_id + 1
+    return new_id
 
 
 def cluster_exists(cluster_type, cid):
@@ -79,7 +208,92 @@ def cluster_exists(cluster_type, cid):
     return os.path.exists(fname)
 
 
-def deserialize_cluster(cluster_type, cid):
+def __encode(value, table, positions):
+    """Replace hosts in value by references to a table of compact hosts."""
+
+    if isinstance(value, Host):
+        if value.user is None and value.keyfile is None and value.port is None:
+            key = value.address
+        else:
+            key = (value.address, value.user, value.keyfile, value.port)
+        if key not in positions:
+            positions[key] = len(table)
+            table.append(key)
+        return _HostRef(positions[key])
+    elif isinstance(value, list):
+        return [__encode(v, table, positions) for v in value]
+    elif isinstance(value, tuple):
+        return tuple(__encode(v, table, positions) for v in value)
+    elif isinstance(value, dict):
+        return dict((__encode(k, table, positions),
+                     __encode(v, table, positions))
+                    for (k, v) in value.items())
+    else:
+        return value
+
+
+def __decode(value, hosts):
+    """Replace host references in value by the hosts they point to."""
+
+    if isinstance(value, _HostRef):
+        return hosts[value.index]
+    elif isinstance(value, list):
+        return [__decode(v, hosts) for v in value]
+    elif isinstance(value, tuple):
+        return tuple(__decode(v, hosts) for v in value)
+    elif isinstance(value, dict):
+        return dict((__decode(k, hosts), __decode(v, hosts))
+                    for (k, v) in value.items())
+    else:
+        return value
+
+
+def __dump_section(state):
+    table = []
+    encoded = __encode(state, table, {})
+    return pickle.dumps({"hosts": table, "state": encoded}, PICKLE_PROTOCOL)
+
+
+def __load_section(data):
+    section = pickle.loads(data)
+    hosts = [Host(h) if isinstance(h, basestring) else
+             Host(h[0], user=h[1], keyfile=h[2], port=h[3])
+             for h in section["hosts"]]
+    return __decode(section["state"], hosts)
+
+
+def __read_state(fname, partial=False):
+    """Read a state file.
+
+    Returns (tuple of (dict, dict, str)):
+      The header, the light section and the raw heavy section (None if
+      partial is True). For files written before the versioned format, the
+      header is None and the light section is the cluster object itself.
+    """
+
+    with open(fname, 'rb') as c_file:
+        header = pickle.load(c_file)
+
+        if not isinstance(header, dict) or header.get("format") != STATE_FORMAT:
+            # Raw pickle of the cluster object
+            return None, header, None
+
+        if header["version"] > STATE_VERSION:
+            raise StateFormatException(
+                "State file " + fname + " has version " +
+                str(header["version"]) + ", only versions up to " +
+                str(STATE_VERSION) + " are supported")
+
+        light = __load_section(c_file.read(header["light_size"]))
+        if partial:
+            heavy_data = None
+        else:
+            heavy_data = c_file.read(header["heavy_size"])
+
+    return header, light, heavy_data
+
+
+def deserialize_cluster(cluster_type, cid, partial=False):
     """Return a cluster object from the given file.
 
     Args:
@@ -87,6 +301,12 @@ def deserialize_cluster(cluster_type, cid):
         The type of cluster to obtain.
       cid (int):
         The id of the cluster.
+      partial (bool, optional):
+        If True, only the light fields of the cluster are loaded, leaving
+        out those listed in its heavy_fields (typically the hosts). Using
+        one of them raises a PartialStateException. The object can still be
+        serialized back, keeping the stored values of the fields that were
+        not loaded.
 
     Returns:
       The deserialized cluster object.
@@ -96,15 +316,32 @@ def deserialize_cluster(cluster_type, cid):
 
     logger.info("Deserialize cluster from " + fname)
 
-    with open(fname, 'rb') as c_file:
-        cluster_object = pickle.load(c_file)
+    (header, light, heavy_data) = __read_state(fname, partial)
+
+    if header is None:
+        cluster_object = light
+    else:
+        cls = import_class(header["class"])
+        cluster_object = cls.__new__(cls)
+        cluster_object.__dict__.update(light)
+        if partial:
+            cluster_object._partial_state = True
+            for f in getattr(cluster_object, "heavy_fields", ()):
+                setattr(cluster_object, f, _NotLoaded(f))
+        else:
+            cluster_object.__dict__.update(__load_section(heavy_data))
+
+    __mark_used(cluster_type, cid)
+
+    if hasattr(cluster_object, "_setup_connections"):
+        cluster_object._setup_connections()
 
     return cluster_object
 
 
 def serialize_cluster(cluster_type, cid, cluster_object):
-    """Serialize the cluster object. Replace also the linked Hadoop cluster if
-    it exists.
+    """Serialize the cluster object. The file is replaced atomically, so that
+    a failure while writing keeps the previous state.
 
     Args:
       cluster_type (str):
@@ -119,8 +356,43 @@ def serialize_cluster(cluster_type, cid, cluster_object):
 
     logger.info("Serialize cluster (" + cluster_type + ") in " + fname)
 
-    c_file = open(fname, 'wb')
-    pickle.dump(cluster_object, c_file)
+    state = dict(cluster_object.__dict__)
+    partial = state.pop("_partial_state", False)
+
+    heavy_fields = getattr(cluster_object, "heavy_fields", ())
+    heavy = dict((f, state.pop(f)) for f in heavy_fields if f in state)
+
+    light_data = __dump_section(state)
+    if partial:
+        (_, _, heavy_data) = __read_state(fname)
+    else:
+        heavy_data = __dump_section(heavy)
+
+    cls = cluster_object.__class__
+    header = {
+        "format": STATE_FORMAT,
+        "version": STATE_VERSION,
+        "class": cls.__module__ + "." + cls.__name__,
+        "light_size": len(light_data),
+        "heavy_size": len(heavy_data)
+    }
+
+    (fd, temp_file) = tempfile.mkstemp("", "." + str(cid) + "-",
+                                       __get_clusters_dir(cluster_type))
+    try:
+        with os.fdopen(fd, 'wb') as c_file:
+            pickle.dump(header, c_file, PICKLE_PROTOCOL)
+            c_file.write(light_data)
+            c_file.write(heavy_data)
+            c_file.flush()
+            os.fsync(c_file.fileno())
+        os.rename(temp_file, fname)
+    except:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+    __mark_used(cluster_type, cid)
 
 
 def remove_cluster(cluster_type, cid):
@@ -135,4 +407,13 @@ def remove_cluster(cluster_type, cid):
     """
 
     fname = __get_cluster_file(cluster_type, cid)
-    os.remove(fname)
\ No newline at end of file
+    os.remove(fname)
+
+    with __registry(cluster_type, write=True) as registry:
+        registry["clusters"].pop(str(cid), None)
+        if registry["last_used"] == int(cid):
+            if registry["clusters"]:
+                registry["last_used"] = int(max(registry["clusters"],
+                                                key=registry["clusters"].get))
+            else:
+                registry["last_used"] = None
\ No newline at end of file
@@ -0,0 +1,141 @@
+import re
+
+from execo.action import TaktukRemote
+from execo_engine import logger
+
+# Storage modes
+DEFAULT_STORAGE = "default"
+AUTO_STORAGE = "auto"
+TMPFS_STORAGE = "tmpfs"
+
+STORAGE_MODES = [DEFAULT_STORAGE, AUTO_STORAGE, TMPFS_STORAGE]
+
+DEFAULT_STORAGE_MODE = DEFAULT_STORAGE
+
+TMPFS_DIR = "/dev/shm"
+
+IGNORED_MOUNTS = ["[SWAP]", "/boot", "/boot/efi"]
+
+# lsblk output followed by the writable mount points. The root filesystem is
+# tested through /tmp, which is where data goes when it is the only choice.
+DISCOVER_COMMAND = (
+    "lsblk -b -n -P -o NAME,PKNAME,TYPE,ROTA,SIZE,MOUNTPOINT ; "
+    "for m in $(lsblk -n -o MOUNTPOINT) ; do "
+    "d=$m ; [ \"$m\" = / ] && d=/tmp ; "
+    "test -w $d && echo \"WRITABLE=\\\"$m\\\"\" ; "
+    "done ; true")
+
+__field_regex = re.compile(r'([A-Z]+)="([^"]*)"')
+
+
+def __get_disk_name(device):
+    """Return the name of the disk holding the given block device."""
+
+    if device["PKNAME"]:
+        return device["PKNAME"]
+    elif device["TYPE"] == "part":
+        return re.sub(r"p?[0-9]+$", "", device["NAME"])
+    else:
+        return device["NAME"]
+
+
+def parse_storage(output):
+    """Parse the output of DISCOVER_COMMAND in a host.
+
+    Args:
+      output (str): the standard output of the command.
+
+    Returns (list of dict):
+      One entry per disk with a writable mount point, from the fastest to
+      the slowest: NVMe before other SSDs and SSDs before rotational disks,
+      bigger first in the same class. Each entry contains the disk name, the
+      directory to use, whether it is an SSD or NVMe device and its size in
+      bytes.
+    """
+
+    devices = []
+    writable = set()
+    for line in output.splitlines():
+        fields = dict(__field_regex.findall(line))
+        if "WRITABLE" in fields:
+            writable.add(fields["WRITABLE"])
+        elif "NAME" in fields:
+            devices.append(fields)
+
+    mounts = set(d["MOUNTPOINT"] for d in devices)
+
+    disks = {}
+    for d in devices:
+        mount = d["MOUNTPOINT"]
+        if not mount or mount in IGNORED_MOUNTS or mount not in writable:
+            continue
+        if mount == "/":
+            if "/tmp" in mounts:
+                continue
+            directory = "/tmp"
+        else:
+            directory = mount
+
+        disk = __get_disk_name(d)
+        size = int(d["SIZE"] or 0)
+        if disk in disks and disks[disk]["size"] >= size:
+            continue
+        disks[disk] = {
+            "disk": disk,
+            "dir": directory,
+            "ssd": d["ROTA"] == "0",
+            "nvme": disk.startswith("nvme"),
+            "size": size
+        }
+
+    return sorted(disks.values(),
+                  key=lambda e: (not e["nvme"], not e["ssd"], -e["size"]))
+
+
+def discover_storage(hosts):
+    """Discover the local disks of the given hosts in parallel.
+
+    Args:
+      hosts (list of Host): the hosts to inspect.
+
+    Returns (dict of Host -> list of dict):
+      The disks of every host, as returned by parse_storage. Hosts where
+      the discovery failed are not included.
+    """
+
+    action = TaktukRemote(DISCOVER_COMMAND, hosts)
+    for p in action.processes:
+        p.nolog_exit_code = p.nolog_error = True
+    action.run()
+
+    storage = {}
+    for p in action.processes:
+        if p.ok:
+            storage[p.host] = parse_storage(p.stdout)
+        else:
+            logger.warn("Could not discover the disks of " + str(p.host))
+    return storage
+
+
+def get_common_disks(hosts):
+    """Return the disks available with the same directory in all the given
+    hosts, so that a single configuration can be shared by them.
+
+    Args:
+      hosts (list of Host): the hosts of a group.
+
+    Returns (list of dict):
+      The disks of the first host, from the fastest to the slowest, that
+      are also mounted in the same directory in the others.
+    """
+
+    storage = discover_storage(hosts)
+    if len(storage) < len(hosts):
+        return []
+
+    disks = storage[hosts[0]]
+    for h in hosts[1:]:
+        dirs = set(e["dir"] for e in storage[h])
+        disks = [e for e in disks if e["dir"] in dirs]
+
+    return disks
@@ -0,0 +1,231 @@
+import re
+
+from execo_engine import logger
+
+from dm_g5k.util import write_file_atomically
+
+MB = 1024 * 1024
+
+# Cassandra
+CASSANDRA_G1_MIN_MEMORY = 32 * 1024 * MB
+CASSANDRA_MAX_CMS_HEAP = 8 * 1024
+CASSANDRA_MAX_G1_HEAP = 16 * 1024
+
+CMS_GC_OPTIONS = ["-XX:+UseParNewGC", "-XX:+UseConcMarkSweepGC",
+                  "-XX:+CMSParallelRemarkEnabled", "-XX:SurvivorRatio=\\S*",
+                  "-XX:MaxTenuringThreshold=\\S*",
+                  "-XX:CMSInitiatingOccupancyFraction=\\S*",
+                  "-XX:+UseCMSInitiatingOccupancyOnly",
+                  "-XX:+UseTLAB", "-XX:+CMSClassUnloadingEnabled",
+                  "-Xmn\\S*"]
+G1_GC_OPTIONS = ["-XX:+UseG1GC", "-XX:MaxGCPauseMillis=500",
+                 "-XX:G1RSetUpdatingPauseTimePercent=5"]
+
+# A block added by render_cassandra_env: a marked comment followed by the
+# variables it sets and, for the header, a blank line
+__env_block_regex = re.compile(
+    r"^# [^\n]*\(dm_g5k\)\n"
+    r"(?:(?:MAX_HEAP_SIZE|HEAP_NEWSIZE|JVM_OPTS)=[^\n]*\n?)*\n?",
+    re.MULTILINE)
+
+
+def get_group_resources(host_info, hosts):
+    """Return the hardware resources shared by all the hosts of a group.
+
+    Values are the minimum among the hosts, so that the resulting
+    configuration fits in every one of them.
+
+    Args:
+      host_info (HostInfoCache):
+        The cache with the reference data of the hosts.
+      hosts (list of Host):
+        The hosts of the group.
+
+    Returns (dict):
+      The number of cores, the memory in bytes, the number of disks and
+      whether the first disk is an SSD, or None if the data of some host is
+      not available.
+    """
+
+    host_info.load(hosts)
+
+    entries = [host_info.get(h) for h in hosts]
+    if not entries or any(e is None or not e.get("cores") or
+                          not e.get("memory") for e in entries):
+        return None
+
+    return {
+        "cores": min(e["cores"] for e in entries),
+        "memory": min(e["memory"] for e in entries),
+        "disks": min(len(e["disks"]) for e in entries) or 1,
+        "ssd": all(e["disks"] and e["disks"][0]["storage"] == "SSD"
+                   for e in entries)
+    }
+
+
+def compute_cassandra_settings(cores, memory, data_disks=1, ssd=False):
+    """Compute the JVM and thread pool settings of a Cassandra node.
+
+    The heap follows the rule used by cassandra-env.sh (half of the memory up
+    to 1GB, a quarter of it up to 8GB), but nodes with more than 32GB of
+    memory switch to G1 with a quarter of the memory up to 16GB. Thread pools
+    follow the recommendations in cassandra.yaml: 16 concurrent reads per
+    data disk (32 for SSDs, which are bound by cores instead), 8 concurrent
+    writes per core, and one flush writer per disk (or per 4 cores for SSDs)
+    between 2 and 8.
+
+    Args:
+      cores (int):
+        The number of cores of the node.
+      memory (int):
+        The memory of the node in bytes.
+      data_disks (int, optional):
+        The number of disks holding data directories.
+      ssd (bool, optional):
+        Whether the data disks are SSDs.
+
+    Returns (dict):
+      The heap and young generation sizes in MB, the garbage collector
+      ("CMS" or "G1") and the concurrent_reads, concurrent_writes and
+      memtable_flush_writers values.
+    """
+
+    memory_mb = memory // MB
+
+    if memory >= CASSANDRA_G1_MIN_MEMORY:
+        gc = "G1"
+        heap = min(memory_mb // 4, CASSANDRA_MAX_G1_HEAP)
+        young = None
+    else:
+        gc = "CMS"
+        heap = max(min(memory_mb // 2, 1024),
+                   min(memory_mb // 4, CASSANDRA_MAX_CMS_HEAP))
+        young = min(100 * cores, heap // 4)
+
+    if ssd:
+        concurrent_reads = max(32, 4 * cores)
+        flush_writers = min(8, max(2, cores // 4))
+    else:
+        concurrent_reads = 16 * data_disks
+        flush_writers = min(8, max(2, data_disks))
+
+    return {
+        "heap_mb": heap,
+        "young_mb": young,
+        "gc": gc,
+        "concurrent_reads": concurrent_reads,
+        "concurrent_writes": 8 * cores,
+        "memtable_flush_writers": flush_writers
+    }
+
+
+def render_cassandra_env(env_file, settings):
+    """Apply the JVM settings to a cassandra-env.sh file.
+
+    The heap sizes are defined at the beginning of the file, which prevents
+    the script from computing them, and the garbage collector options are
+    replaced at the end of it if G1 is chosen. Blocks added by previous
+    renderings are removed first, so the file can be rendered again with
+    different settings.
+
+    Args:
+      env_file (str):
+        The path of the cassandra-env.sh file.
+      settings (dict):
+        The settings returned by compute_cassandra_settings.
+    """
+
+    with open(env_file) as f:
+        contents = __env_block_regex.sub("", f.read()).rstrip("\n") + "\n"
+
+    header = ["# Hardware-aware settings (dm_g5k)",
+              'MAX_HEAP_SIZE="' + str(settings["heap_mb"]) + 'M"']
+    if settings["young_mb"]:
+        header.append('HEAP_NEWSIZE="' + str(settings["young_mb"]) + 'M"')
+    else:
+        # cassandra-env.sh requires both variables to be set together
+        header.append('HEAP_NEWSIZE="' +
+                      str(max(settings["heap_mb"] // 4, 1)) + 'M"')
+
+    footer = []
+    if settings["gc"] == "G1":
+        footer = ["# Replace CMS with G1 (dm_g5k)",
+                  "JVM_OPTS=`echo \"$JVM_OPTS\" | sed -e '" +
+                  "; ".join("s/" + o + "//g" for o in CMS_GC_OPTIONS) +
+                  "'`",
+                  'JVM_OPTS="$JVM_OPTS ' + " ".join(G1_GC_OPTIONS) + '"']
+
+    contents = "\n".join(header) + "\n\n" + contents
+    if footer:
+        contents += "\n" + "\n".join(footer) + "\n"
+
+    write_file_atomically(env_file, contents)
+
+    logger.debug("Rendered " + env_file + " with " + str(settings))
+
+
+# MongoDB
+MONGODB_MIN_CACHE_GB = 1
+MONGODB_ZLIB_MIN_CORES = 16
+
+
+def compute_mongodb_settings(cores, memory, ssd=False):
+    """Compute the WiredTiger and journal settings of a MongoDB node.
+
+    The cache takes half of the memory minus 1GB, as WiredTiger does by
+    default, but it is written explicitly so that every group gets its own
+    value. Journal commits are more frequent on SSDs, and nodes with many
+    cores and rotational disks trade CPU for I/O with zlib compression.
+
+    Args:
+      cores (int):
+        The number of cores of the node.
+      memory (int):
+        The memory of the node in bytes.
+      ssd (bool, optional):
+        Whether the data disk is an SSD.
+
+    Returns (dict):
+      The cache size in GB, the journal commit interval in ms, the sync
+      period in seconds and the block compressor.
+    """
+
+    memory_gb = memory // (1024 * MB)
+
+    if not ssd and cores >= MONGODB_ZLIB_MIN_CORES:
+        compressor = "zlib"
+    else:
+        compressor = "snappy"
+
+    return {
+        "cache_size_gb": max(MONGODB_MIN_CACHE_GB, (memory_gb - 1) // 2),
+        "commit_interval_ms": 30 if ssd else 100,
+        "sync_period_secs": 60,
+        "block_compressor": compressor
+    }
+
+
+def apply_mongodb_settings(config, settings):
+    """Set the WiredTiger and journal settings in a MongoDB configuration.
+
+    Args:
+      config (dict):
+        The parsed mongodb.conf, modified in place.
+      settings (dict):
+        The settings returned by compute_mongodb_settings.
+    """
+
+    storage = config.setdefault("storage", {})
+    storage["engine"] = "wiredTiger"
+    storage["syncPeriodSecs"] = settings["sync_period_secs"]
+
+    journal = storage.setdefault("journal", {})
+    journal["enabled"] = True
+    journal["commitIntervalMs"] = settings["commit_interval_ms"]
+
+    wired_tiger = storage.setdefault("wiredTiger", {})
+    engine_config = wired_tiger.setdefault("engineConfig", {})
+    engine_config["cacheSizeGB"] = settings["cache_size_gb"]
+    engine_config["journalCompressor"] = settings["block_compressor"]
+    wired_tiger.setdefault("collectionConfig", {})["blockCompressor"] = \
+        settings["block_compressor"]
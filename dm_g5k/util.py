@@ -1,7 +1,16 @@
+import functools
 import os
+import re
+import shutil
 import tempfile
+import time
+import traceback
+import yaml
+
+from multiprocessing.pool import ThreadPool
+from yaml import CLoader as Loader, CDumper as Dumper
 
-from execo.action import Remote
+from execo.action import TaktukRemote
 from execo.host import Host
 from execo.log import style
 from execo_engine import logger
@@ -9,7 +18,6 @@ from execo_g5k import get_oar_job_nodes, get_oargrid_job_nodes
 
 
 # Imports #####################################################################
-import shutil
 
 
 def import_class(name):
@@ -50,57 +58,171 @@ def import_function(name):
 
 # Compression #################################################################
 
-def uncompress(file_name, host):
-    if file_name.endswith("tar.gz"):
-        decompression = Remote("tar xf " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-7])
-        dir_name = os.path.dirname(file_name[:-7])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-7] + " " + new_name, [host])
-        action.run()
-    elif file_name.endswith("gz"):
-        decompression = Remote("gzip -d " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-3])
-        dir_name = os.path.dirname(file_name[:-3])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-3] + " " + new_name, [host])
-        action.run()
-    elif file_name.endswith("zip"):
-        decompression = Remote("unzip " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-4])
-        dir_name = os.path.dirname(file_name[:-4])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-4] + " " + new_name, [host])
-        action.run()
-    elif file_name.endswith("bz2"):
-        decompression = Remote("bzip2 -d " + file_name, [host])
-        decompression.run()
-
-        base_name = os.path.basename(file_name[:-4])
-        dir_name = os.path.dirname(file_name[:-4])
-        new_name = dir_name + "/data-" + base_name
-
-        action = Remote("mv " + file_name[:-4] + " " + new_name, [host])
-        action.run()
+# Decompressors, preferring the parallel versions when they are installed
+GZIP_CMD = "$(command -v pigz || echo gzip)"
+BZIP2_CMD = "$(command -v pbzip2 || echo bzip2)"
+ZSTD_CMD = "zstd -T0"
+XZ_CMD = "xz -T0"
+
+# (extension, decompressor, whether it is a tar archive)
+COMPRESSION_FORMATS = [
+    (".tar.gz", GZIP_CMD, True),
+    (".tgz", GZIP_CMD, True),
+    (".tar.bz2", BZIP2_CMD, True),
+    (".tbz2", BZIP2_CMD, True),
+    (".tar.zst", ZSTD_CMD, True),
+    (".tar.xz", XZ_CMD, True),
+    (".txz", XZ_CMD, True),
+    (".gz", GZIP_CMD, False),
+    (".bz2", BZIP2_CMD, False),
+    (".zst", ZSTD_CMD, False),
+    (".xz", XZ_CMD, False),
+    (".zip", None, False)
+]
+
+
+def get_uncompress_command(file_name):
+    """Return a shell command that decompresses the given file and leaves
+    the result with the name used by uncompress.
+
+    Decompression and renaming happen in a single step: compressed files
+    are written directly to the new name and archives are extracted into
+    the new directory, stripping their top-level directory. Once done, the
+    command prints the size in bytes of the result and the time taken in
+    nanoseconds.
+
+    Args:
+      file_name (str):
+        The path of the compressed file in the hosts.
+
+    Returns (tuple of (str, str)):
+      The command and the name of the result, or None if the extension of
+      the file is not known.
+    """
+
+    for (ext, decompressor, is_tar) in COMPRESSION_FORMATS:
+        if file_name.endswith(ext):
+            break
+    else:
+        return None
+
+    base_name = os.path.basename(file_name[:-len(ext)])
+    dir_name = os.path.dirname(file_name[:-len(ext)])
+    new_name = dir_name + "/data-" + base_name
+
+    if is_tar:
+        command = ("rm -rf " + new_name + " && mkdir -p " + new_name +
+                   " && " + decompressor + " -dc " + file_name +
+                   " | tar xf - --strip-components=1 -C " + new_name)
+    elif decompressor:
+        command = (decompressor + " -dc " + file_name + " > " + new_name +
+                   " && rm -f " + file_name)
     else:
+        command = ("unzip -q -o " + file_name + " -d " + dir_name +
+                   " && rm -rf " + new_name + " && mv " +
+                   file_name[:-len(ext)] + " " + new_name)
+
+    command = ("start=$(date +%s%N) && " + command +
+               " && echo $(du -sb " + new_name + " | cut -f1)"
+               " $(($(date +%s%N) - start))")
+
+    return (command, new_name)
+
+
+def uncompress(file_name, hosts):
+    """Decompress a file in all the given hosts at the same time.
+
+    The result is renamed as data-<name>, where name is the file name
+    without the compression extension. Parallel decompressors (pigz,
+    pbzip2) are used in the hosts where they are available, and the
+    throughput of every host is reported.
+
+    Args:
+      file_name (str):
+        The path of the compressed file in the hosts.
+      hosts (list of Host or Host):
+        The hosts where the file is decompressed.
+
+    Returns (str):
+      The path of the decompressed file or directory, or file_name if the
+      extension is not known.
+    """
+
+    if isinstance(hosts, Host):
+        hosts = [hosts]
+
+    command = get_uncompress_command(file_name)
+    if not command:
         logger.warn("Unknown extension")
         return file_name
+    (command, new_name) = command
+
+    action = TaktukRemote(command, hosts)
+    for p in action.processes:
+        p.nolog_exit_code = p.nolog_error = True
+    start = time.time()
+    action.run()
+    elapsed_total = time.time() - start
+
+    total_bytes = 0
+    for p in action.processes:
+        fields = p.stdout.split() if p.ok else []
+        if len(fields) != 2:
+            logger.warn("Could not uncompress " + file_name + " in " +
+                        str(p.host) + ": " + p.stderr.strip())
+            continue
+        size = int(fields[0])
+        elapsed = max(int(fields[1]) / 1e9, 1e-3)
+        total_bytes += size
+        logger.info("Uncompressed " + file_name + " in " + str(p.host) +
+                    ": " + str(size // (1024 * 1024)) + " MB in %.2f s "
+                    "(%.1f MB/s)" % (elapsed, size / elapsed / (1024 * 1024)))
+
+    logger.info("Uncompressed " + str(total_bytes // (1024 * 1024)) +
+                " MB in " + str(len(hosts)) + " hosts in %.2f s" %
+                elapsed_total)
 
     return new_name
 
 
+def get_stream_extract_command(file_name, dest_dir):
+    """Return a shell command extracting into dest_dir an archive read from
+    the standard input. The format is detected from the extension of
+    file_name with the same table as uncompress, so the same parallel
+    decompressors are used, and the top-level directory of the archive is
+    stripped. Compressed files are assumed to be tar archives.
+
+    The command is a group, so it can be followed by an input redirection.
+
+    Args:
+      file_name (str):
+        The name of the archive.
+      dest_dir (str):
+        The directory where the archive contents are extracted.
+
+    Returns (str):
+      The extraction command.
+    """
+
+    strip_opts = " --strip-components=1 -C " + dest_dir
+
+    for (ext, decompressor, _) in COMPRESSION_FORMATS:
+        if file_name.endswith(ext):
+            break
+    else:
+        return "{ tar xf -" + strip_opts + " ; }"
+
+    if decompressor:
+        return ("{ " + decompressor + " -dc | tar xf -" + strip_opts +
+                " ; }")
+    else:
+        # unzip needs a seekable file, bsdtar is able to read from a pipe
+        return "{ bsdtar xf -" + strip_opts + " ; }"
+
+
 # Hosts #######################################################################
 
-def generate_hosts(hosts_input):
+def generate_hosts(hosts_input, return_cores=False):
     """Generate a list of hosts from the given file.
 
     Args:
@@ -109,28 +231,137 @@ def generate_hosts(hosts_input):
         If a file is used, each host should be in a different line.
         Repeated hosts are pruned.
         Hint: in a running Grid5000 job,  $OAR_NODEFILE should be used.
+      return_cores (bool, optional): If True, the number of times each host
+        appears in the input is also returned. In an OAR nodefile this is
+        the number of cores reserved in the host.
 
     Return:
-      list of Host: The list of hosts.
+      list of Host: The list of hosts, in order of first appearance.
+      dict of Host -> int: The number of cores of each host (only if
+        return_cores is True).
     """
+
     hosts = []
+    cores = {}
+
+    def add_host(h):
+        if h in cores:
+            cores[h] += 1
+        else:
+            cores[h] = 1
+            hosts.append(h)
+
     if os.path.isfile(hosts_input):
-        for line in open(hosts_input):
-            h = Host(line.rstrip())
-            if h not in hosts:
-                hosts.append(h)
+        with open(hosts_input) as f:
+            for line in f:
+                address = line.strip()
+                if address:
+                    add_host(Host(address))
     elif ':' in hosts_input:
         # We assume the string is a comma separated list of site:job_id
-        for job in hosts_input.split(','):
+        jobs = hosts_input.split(',')
+        tasks = {}
+        for job in jobs:
             site, job_id = job.split(':')
-            hosts += get_oar_job_nodes(int(job_id), site)
+            tasks[job] = functools.partial(get_oar_job_nodes,
+                                           int(job_id), site)
+        results = run_in_parallel(tasks)
+
+        for job in jobs:
+            if not results[job].ok:
+                logger.error("Could not get the nodes of job " + job +
+                             ":\n" + results[job].error)
+                raise RuntimeError("Could not get the nodes of job " + job)
+            for h in results[job].result:
+                add_host(h)
     else:
         # If the file_name is a number, we assume this is a oargrid_job_id
-        hosts = get_oargrid_job_nodes(int(hosts_input))
+        for h in get_oargrid_job_nodes(int(hosts_input)):
+            add_host(h)
     logger.debug('Hosts list: \n%s',
                  ' '.join(style.host(host.address.split('.')[0])
                           for host in hosts))
-    return hosts
+
+    if return_cores:
+        return hosts, cores
+    else:
+        return hosts
+
+
+# Concurrency #################################################################
+
+class TaskResult(object):
+    """The outcome of a task executed with run_in_parallel."""
+
+    def __init__(self, name, result=None, error=None, elapsed=0.0):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "TaskResult(%s, ok=%s, elapsed=%.2f)" % (self.name, self.ok,
+                                                        self.elapsed)
+
+
+def run_task(name, func):
+    """Execute a function and capture its outcome.
+
+    Args:
+      name (str):
+        The name of the task.
+      func (callable):
+        The function to execute, without arguments.
+
+    Returns (TaskResult):
+      The result of the function or the traceback of the exception it
+      raised, together with the time it took.
+    """
+
+    start = time.time()
+    try:
+        result = func()
+        return TaskResult(name, result=result, elapsed=time.time() - start)
+    except Exception:
+        return TaskResult(name, error=traceback.format_exc(),
+                          elapsed=time.time() - start)
+
+
+def run_in_parallel(tasks, max_workers=0):
+    """Execute the given functions concurrently in a pool of threads.
+
+    Exceptions raised by the functions are not propagated: they are stored
+    in the corresponding result so that all the tasks get executed.
+
+    Args:
+      tasks (dict of str -> callable):
+        The functions to execute, without arguments, indexed by name.
+      max_workers (int, optional):
+        The maximum number of functions executed at the same time. If 0,
+        all of them are executed at once.
+
+    Returns (dict of str -> TaskResult):
+      The result of each task, indexed by name.
+    """
+
+    if not tasks:
+        return {}
+
+    if max_workers <= 0 or max_workers > len(tasks):
+        max_workers = len(tasks)
+
+    pool = ThreadPool(max_workers)
+    try:
+        results = pool.map(lambda item: run_task(*item), tasks.items())
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict((r.name, r) for r in results)
 
 
 # Output formatting ###########################################################
@@ -159,6 +390,95 @@ def create_xml_file(f):
         fout.write("</configuration>")
 
 
+def write_file_atomically(f, contents):
+    """Replace the contents of a file so that readers see either the old or
+    the new version, never a partial one.
+
+    The new contents are written to a temporary file in the same directory,
+    which is then renamed over the original one keeping its permissions.
+
+    Args:
+      f (str):
+        The path of the file.
+      contents (str):
+        The new contents of the file.
+    """
+
+    (fd, temp_file) = tempfile.mkstemp("", "." + os.path.basename(f) + "-",
+                                       os.path.dirname(os.path.abspath(f)))
+    try:
+        with os.fdopen(fd, "w") as outf:
+            outf.write(contents)
+        if os.path.exists(f):
+            shutil.copymode(f, temp_file)
+        os.rename(temp_file, f)
+    except:
+        os.remove(temp_file)
+        raise
+
+
+def update_xml_file(f, properties, create_if_absent=False):
+    """Assign the given values to several variables of xml file f in a single
+    pass.
+
+    All the names are matched with one compiled pattern, so the file is read
+    and written only once no matter how many variables are changed.
+
+    Args:
+      f (str):
+        The path of the file.
+      properties (dict of str -> object):
+        The new value of each variable.
+      create_if_absent (bool, optional):
+        If True, the variables not present in the file are created together
+        at the end of it.
+
+    Returns (set of str):
+      The names of the variables that have been assigned.
+    """
+
+    if not properties:
+        return set()
+
+    values = dict((name, str(value)) for (name, value) in properties.items())
+
+    with open(f) as inf:
+        contents = inf.read()
+
+    names_regex = "|".join(re.escape(n) for n in
+                           sorted(values, key=len, reverse=True))
+    property_regex = re.compile(
+        r"(<name>\s*(" + names_regex + r")\s*</name>"
+        r"(?:(?!</property>).)*?<value>)[^<]*(</value>)", re.DOTALL)
+
+    assigned = set()
+
+    def replace_value(match):
+        assigned.add(match.group(2))
+        return match.group(1) + values[match.group(2)] + match.group(3)
+
+    contents = property_regex.sub(replace_value, contents)
+
+    missing = [n for n in sorted(values) if n not in assigned]
+    if missing and create_if_absent:
+        end = contents.rfind("</configuration>")
+        if end < 0:
+            logger.error("Configuration file " + f +
+                         " is not correctly formatted")
+        else:
+            contents = (contents[:end] +
+                        "".join("  <property><name>" + n + "</name>" +
+                                "<value>" + values[n] +
+                                "</value></property>\n" for n in missing) +
+                        contents[end:])
+            assigned.update(missing)
+
+    if assigned:
+        write_file_atomically(f, contents)
+
+    return assigned
+
+
 def replace_in_xml_file(f, name, value, create_if_absent=False):
     """Assign the given value to variable name in xml file f.
 
@@ -177,47 +497,61 @@ def replace_in_xml_file(f, name, value, create_if_absent=False):
       True if the assignment has been made, False otherwise.
     """
 
-    changed = False
+    return name in update_xml_file(f, {name: value}, create_if_absent)
 
-    (_, temp_file) = tempfile.mkstemp("", "xmlf-", "/tmp")
 
-    inf = open(f)
-    outf = open(temp_file, "w")
-    line = inf.readline()
-    while line != "":
-        if "<name>" + name + "</name>" in line:
-            if "<value>" in line:
-                outf.write(__replace_line(line, value))
-                changed = True
-            else:
-                outf.write(line)
-                line = inf.readline()
-                if line != "":
-                    outf.write(__replace_line(line, value))
-                    changed = True
-                else:
-                    logger.error("Configuration file " + f +
-                                 " is not correctly formatted")
-        else:
-            if ("</configuration>" in line and
-                    create_if_absent and not changed):
-                outf.write("  <property><name>" + name + "</name>" +
-                           "<value>" + str(value) + "</value></property>\n")
-                outf.write(line)
-                changed = True
-            else:
-                outf.write(line)
-        line = inf.readline()
-    inf.close()
-    outf.close()
+def update_yaml_file(f, properties, create_if_absent=True):
+    """Assign the given values to several variables of yaml file f, loading
+    and dumping the file only once.
 
-    if changed:
-        shutil.copyfile(temp_file, f)
-    os.remove(temp_file)
+    Names are paths in the yaml tree with their components separated by
+    dots, as in "storage.wiredTiger.engineConfig.cacheSizeGB". Components
+    traversing a list are used as indexes, as in
+    "seed_provider.0.parameters.0.seeds".
 
-    return changed
+    Args:
+      f (str):
+        The path of the file.
+      properties (dict of str -> object):
+        The new value of each variable.
+      create_if_absent (bool, optional):
+        If True, the variables not present in the file are created, together
+        with the mappings containing them.
 
+    Returns (set of str):
+      The names of the variables that have been assigned.
+    """
 
-def __replace_line(line, value):
-    return re.sub(r'(.*)<value>[^<]*</value>(.*)', r'\g<1><value>' + value +
-                  r'</value>\g<2>', line)
\ No newline at end of file
+    if not properties:
+        return set()
+
+    with open(f) as inf:
+        config = yaml.load(inf, Loader=Loader) or {}
+
+    assigned = set()
+    for (name, value) in properties.items():
+        keys = name.split(".")
+        node = config
+        try:
+            for key in keys[:-1]:
+                if isinstance(node, list):
+                    node = node[int(key)]
+                elif key in node or create_if_absent:
+                    node = node.setdefault(key, {})
+                else:
+                    break
+            else:
+                key = keys[-1]
+                if isinstance(node, list):
+                    node[int(key)] = value
+                    assigned.add(name)
+                elif key in node or create_if_absent:
+                    node[key] = value
+                    assigned.add(name)
+        except (AttributeError, IndexError, TypeError, ValueError):
+            logger.error("Could not assign " + name + " in " + f)
+
+    if assigned:
+        write_file_atomically(f, yaml.dump(config, Dumper=Dumper))
+
+    return assigned
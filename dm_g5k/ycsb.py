@@ -0,0 +1,283 @@
+import os
+import re
+import time
+
+from execo.action import TaktukRemote
+from execo_engine import logger
+
+from dm_g5k.cluster import ClusterException
+from dm_g5k.distribution import install_dist_file
+
+# Default parameters
+DEFAULT_YCSB_DIR = "/tmp/ycsb"
+DEFAULT_RECORD_COUNT = 100000
+DEFAULT_OPERATION_COUNT = 100000
+
+LOAD_PHASE = "load"
+RUN_PHASE = "run"
+
+# Core workloads shipped with YCSB
+WORKLOADS = {
+    "a": {"readproportion": 0.5, "updateproportion": 0.5,
+          "scanproportion": 0, "insertproportion": 0,
+          "requestdistribution": "zipfian"},
+    "b": {"readproportion": 0.95, "updateproportion": 0.05,
+          "scanproportion": 0, "insertproportion": 0,
+          "requestdistribution": "zipfian"},
+    "c": {"readproportion": 1, "updateproportion": 0,
+          "scanproportion": 0, "insertproportion": 0,
+          "requestdistribution": "zipfian"},
+    "d": {"readproportion": 0.95, "updateproportion": 0,
+          "scanproportion": 0, "insertproportion": 0.05,
+          "requestdistribution": "latest"},
+    "e": {"readproportion": 0, "updateproportion": 0,
+          "scanproportion": 0.95, "insertproportion": 0.05,
+          "requestdistribution": "zipfian",
+          "maxscanlength": 100, "scanlengthdistribution": "uniform"},
+    "f": {"readproportion": 0.5, "updateproportion": 0,
+          "scanproportion": 0, "insertproportion": 0,
+          "readmodifywriteproportion": 0.5,
+          "requestdistribution": "zipfian"}
+}
+
+__stat_regex = re.compile(r"^\[([A-Z\-_]+)\], ([^,]+), ([0-9.eE+\-]+)\s*$",
+                          re.MULTILINE)
+
+
+def parse_ycsb_output(output):
+    """Parse the statistics printed by a YCSB client.
+
+    Args:
+      output (str): the standard output of the client.
+
+    Returns (dict of (str, str) -> float):
+      The value of each statistic, indexed by section (e.g. READ or OVERALL)
+      and metric (e.g. 95thPercentileLatency(us)).
+    """
+
+    stats = {}
+    for (section, metric, value) in __stat_regex.findall(output):
+        stats[(section, metric.strip())] = float(value)
+    return stats
+
+
+def aggregate_ycsb_stats(client_stats):
+    """Combine the statistics of several clients running the same phase.
+
+    Throughputs and operation counts are added, average latencies are
+    weighted by the number of operations and percentiles and maximum
+    latencies take the worst client value, which gives an upper bound of the
+    percentile of the whole run.
+
+    Args:
+      client_stats (list of dict): the parsed output of every client.
+
+    Returns (dict of str -> float):
+      Flat statistics, such as throughput, READ_ops, READ_avg_latency_us or
+      READ_p99_latency_us.
+    """
+
+    result = {
+        "throughput": sum(s.get(("OVERALL", "Throughput(ops/sec)"), 0)
+                          for s in client_stats),
+        "runtime_ms": max([s.get(("OVERALL", "RunTime(ms)"), 0)
+                           for s in client_stats] or [0])
+    }
+
+    sections = set(section for s in client_stats for (section, _) in s
+                   if section not in ("OVERALL", "TOTAL_GCS", "TOTAL_GC_TIME"))
+    for section in sorted(sections):
+        ops = [s.get((section, "Operations"), 0) for s in client_stats]
+        total_ops = sum(ops)
+        if not total_ops:
+            continue
+        result[section + "_ops"] = total_ops
+
+        for unit in ("us", "ms"):
+            avg_key = (section, "AverageLatency(" + unit + ")")
+            if any(avg_key in s for s in client_stats):
+                result[section + "_avg_latency_" + unit] = sum(
+                    s.get(avg_key, 0) * n
+                    for (s, n) in zip(client_stats, ops)) / total_ops
+
+            for (name, metric) in (("p95", "95thPercentileLatency"),
+                                   ("p99", "99thPercentileLatency"),
+                                   ("max", "MaxLatency")):
+                key = (section, metric + "(" + unit + ")")
+                values = [s[key] for s in client_stats if key in s]
+                if values:
+                    result[section + "_" + name + "_latency_" + unit] = \
+                        max(values)
+
+    return result
+
+
+class YCSBBenchmark(object):
+    """This class runs YCSB workloads against a data management cluster.
+
+    The YCSB clients are executed in the given client hosts, which may or
+    may not be part of the cluster. The cluster provides the YCSB binding to
+    use and its connection properties through get_ycsb_binding, so the same
+    workload definitions apply to every framework.
+    """
+
+    def __init__(self, cluster, clients, ycsb_dir=DEFAULT_YCSB_DIR,
+                 record_count=DEFAULT_RECORD_COUNT,
+                 operation_count=DEFAULT_OPERATION_COUNT,
+                 results_store=None):
+        """Create a new benchmark.
+
+        Args:
+          cluster (Cluster):
+            The cluster to benchmark. It should be running.
+          clients (list of Host):
+            The hosts where YCSB clients are executed.
+          ycsb_dir (str, optional):
+            The directory where YCSB is installed in the clients.
+          record_count (int, optional):
+            The number of records inserted during the load phase.
+          operation_count (int, optional):
+            The number of operations of each run phase.
+          results_store (ResultsStore, optional):
+            If given, the results of every phase are added to it.
+        """
+
+        self.cluster = cluster
+        self.clients = clients
+        self.ycsb_dir = ycsb_dir
+        self.record_count = record_count
+        self.operation_count = operation_count
+        self.results_store = results_store
+
+    def bootstrap(self, tar_file):
+        """Install YCSB in the client hosts.
+
+        Args:
+          tar_file (str):
+            The file containing YCSB binaries.
+        """
+
+        logger.info("Installing YCSB in " + str(len(self.clients)) +
+                    " clients")
+        TaktukRemote("rm -rf " + self.ycsb_dir, self.clients).run()
+        if not install_dist_file(self.clients, tar_file, self.ycsb_dir,
+                                 self.cluster.dist_mode,
+                                 self.cluster.dist_fanout,
+                                 self.cluster.dist_port):
+            raise ClusterException("Could not install " + tar_file)
+
+    def __get_command(self, phase, workload, threads, extra_props):
+        (binding, props) = self.cluster.get_ycsb_binding()
+
+        all_props = {"workload": "com.yahoo.ycsb.workloads.CoreWorkload",
+                     "recordcount": self.record_count,
+                     "operationcount": self.operation_count}
+        all_props.update(WORKLOADS[workload])
+        all_props.update(props)
+        all_props.update(extra_props)
+
+        return (os.path.join(self.ycsb_dir, "bin/ycsb") + " " + phase + " " +
+                binding + " -s -threads " + str(threads) + " " +
+                " ".join("-p " + k + "=" + str(v)
+                         for (k, v) in sorted(all_props.items())))
+
+    def run_phase(self, phase, workload, threads):
+        """Execute a phase of a workload in all the clients at the same time.
+
+        In the load phase the records are split among the clients; in the
+        run phase every client executes operation_count / len(clients)
+        operations. Workloads inserting during the run phase (d and e) start
+        the insert sequence of every client at a different offset after the
+        loaded records, leaving room for all its operations, so that the
+        keys inserted by different clients never collide. Reads and scans
+        still choose keys among all the loaded records.
+
+        Args:
+          phase (str):
+            Either LOAD_PHASE or RUN_PHASE.
+          workload (str):
+            The core workload, from "a" to "f".
+          threads (int):
+            The number of threads of each client.
+
+        Returns (dict):
+          The aggregated statistics of the phase, or None if it failed.
+        """
+
+        workload = workload.lower()
+        if workload not in WORKLOADS:
+            raise ValueError("Unknown workload " + workload)
+
+        num_clients = len(self.clients)
+        commands = []
+        for i in range(num_clients):
+            if phase == LOAD_PHASE:
+                start = i * self.record_count // num_clients
+                end = (i + 1) * self.record_count // num_clients
+                extra = {"insertstart": start, "insertcount": end - start}
+            else:
+                operations = self.operation_count // num_clients
+                extra = {"operationcount": operations,
+                         "insertstart": 0,
+                         "insertcount": self.record_count,
+                         "recordcount": self.record_count + i * operations}
+            commands.append(self.__get_command(phase, workload, threads,
+                                               extra))
+
+        logger.info("Running YCSB workload " + workload + " (" + phase +
+                    ") with " + str(num_clients) + " clients x " +
+                    str(threads) + " threads")
+
+        start_ts = time.time()
+        action = TaktukRemote("{{commands}}", self.clients)
+        action.run()
+
+        if not action.finished_ok:
+            logger.error("YCSB " + phase + " phase of workload " + workload +
+                         " failed")
+            return None
+
+        stats = aggregate_ycsb_stats([parse_ycsb_output(p.stdout)
+                                      for p in action.processes])
+        stats.update({
+            "framework": self.cluster.get_cluster_type(),
+            "workload": workload,
+            "phase": phase,
+            "clients": num_clients,
+            "threads": threads,
+            "timestamp": start_ts
+        })
+
+        logger.info("Throughput: %.1f ops/s" % stats["throughput"])
+
+        if self.results_store is not None:
+            self.results_store.add(stats)
+
+        return stats
+
+    def run_workload(self, workload, threads, load=True):
+        """Execute the load (optionally) and run phases of a workload.
+
+        Args:
+          workload (str):
+            The core workload, from "a" to "f".
+          threads (int):
+            The number of threads of each client.
+          load (bool, optional):
+            Whether to load the data before running the workload.
+
+        Returns (list of dict):
+          The statistics of every executed phase.
+        """
+
+        self.cluster.prepare_ycsb()
+
+        results = []
+        phases = [LOAD_PHASE, RUN_PHASE] if load else [RUN_PHASE]
+        for phase in phases:
+            stats = self.run_phase(phase, workload, threads)
+            if stats is None:
+                break
+            results.append(stats)
+
+        return results
@@ -0,0 +1,45 @@
+import unittest
+
+from dm_g5k.cassandra_stress import aggregate_stress_results, \
+    parse_stress_output
+
+STRESS_OUTPUT = """\
+type       total ops,    op/s,    pk/s,   row/s,    mean,     med
+total,         12345,   12345,   12345,   12345,     1.0,     0.9
+
+Results:
+Op rate                   :   10,234 op/s  [WRITE: 10,234 op/s]
+Partition rate            :   10,234 pk/s  [WRITE: 10,234 pk/s]
+Row rate                  :   10,234 row/s [WRITE: 10,234 row/s]
+Latency mean              :    4.8 ms [WRITE: 4.8 ms]
+Latency median            :    3.1 ms [WRITE: 3.1 ms]
+Latency 95th percentile   :   12.5 ms [WRITE: 12.5 ms]
+Latency 99th percentile   :   30.2 ms [WRITE: 30.2 ms]
+Latency 99.9th percentile :   85.0 ms [WRITE: 85.0 ms]
+Latency max               :  250.3 ms [WRITE: 250.3 ms]
+Total partitions          :  1,000,000 [WRITE: 1,000,000]
+"""
+
+
+class StressOutputTest(unittest.TestCase):
+
+    def test_parse(self):
+        results = parse_stress_output(STRESS_OUTPUT)
+        self.assertEqual(results["op_rate"], 10234.0)
+        self.assertEqual(results["latency_mean_ms"], 4.8)
+        self.assertEqual(results["latency_p999_ms"], 85.0)
+        self.assertEqual(results["latency_max_ms"], 250.3)
+        self.assertEqual(len(results), 9)
+
+    def test_aggregate(self):
+        other = {"op_rate": 5000.0, "latency_p99_ms": 50.0}
+        results = aggregate_stress_results([parse_stress_output(STRESS_OUTPUT),
+                                            other])
+        self.assertEqual(results["op_rate"], 15234.0)
+        self.assertEqual(results["partition_rate"], 10234.0)
+        self.assertEqual(results["latency_p99_ms"], 50.0)
+        self.assertEqual(results["latency_mean_ms"], 4.8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from dm_g5k.distribution import CHAIN_DISTRIBUTION, TREE_DISTRIBUTION, \
+    build_broadcast_tree
+
+
+class BroadcastTreeTest(unittest.TestCase):
+
+    hosts = ["h" + str(i) for i in range(7)]
+
+    def check_covers(self, seeds, children):
+        reached = list(seeds)
+        for h in self.hosts:
+            reached.extend(children[h])
+        self.assertEqual(sorted(reached), sorted(self.hosts))
+
+    def test_chain(self):
+        (seeds, children) = build_broadcast_tree(self.hosts,
+                                                 CHAIN_DISTRIBUTION, 2)
+        self.assertEqual(seeds, ["h0", "h1"])
+        self.assertEqual(children["h0"], ["h2"])
+        self.assertEqual(children["h4"], ["h6"])
+        self.assertEqual(children["h6"], [])
+        self.check_covers(seeds, children)
+
+    def test_tree(self):
+        (seeds, children) = build_broadcast_tree(self.hosts,
+                                                 TREE_DISTRIBUTION, 2)
+        self.assertEqual(seeds, ["h0", "h1"])
+        self.assertEqual(children["h0"], ["h2", "h3"])
+        self.assertEqual(children["h1"], ["h4", "h5"])
+        self.assertEqual(children["h2"], ["h6"])
+        self.check_covers(seeds, children)
+
+    def test_fanout_bigger_than_hosts(self):
+        (seeds, children) = build_broadcast_tree(self.hosts[:2],
+                                                 TREE_DISTRIBUTION, 4)
+        self.assertEqual(seeds, ["h0", "h1"])
+        self.assertEqual(children, {"h0": [], "h1": []})
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, build_broadcast_tree, self.hosts,
+                          "flat")
+
+
+if __name__ == "__main__":
+    unittest.main()
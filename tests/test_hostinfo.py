@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from execo.host import Host
+
+from dm_g5k.hostinfo import HostInfoCache
+
+
+def entry(cluster, site):
+    return {"cluster": cluster, "site": site, "cores": 8,
+            "memory": 32 * 1024 ** 3, "disks": [], "timestamp": 0}
+
+
+class HostInfoSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.temp_dir, "snapshot.json")
+        with open(self.snapshot, "w") as f:
+            json.dump({"paravance-1": entry("paravance", "rennes"),
+                       "paravance-2": entry("paravance", "rennes"),
+                       "parasilo-1": entry("parasilo", "rennes"),
+                       "grisou-1": entry("grisou", "nancy"),
+                       "grisou-2": entry("grisou", "nancy")}, f)
+        self.cache = HostInfoCache(os.path.join(self.temp_dir, "cache.json"),
+                                   snapshot_file=self.snapshot)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_offline_entries_never_expire(self):
+        info = self.cache.get(Host("grisou-1.nancy.grid5000.fr"))
+        self.assertEqual(info["cluster"], "grisou")
+        self.assertEqual(info["site"], "nancy")
+        self.assertEqual(info["cores"], 8)
+
+    def test_offline_missing_host(self):
+        self.assertIsNone(self.cache.get(Host("ecotype-1")))
+
+    def test_get_site(self):
+        # From the cache, the fully qualified name and the cached cluster
+        self.assertEqual(self.cache.get_site(Host("parasilo-1")), "rennes")
+        self.assertEqual(self.cache.get_site(Host("gros-3.nancy.grid5000.fr")),
+                         "nancy")
+        self.assertEqual(self.cache.get_site(Host("paravance-9")), "rennes")
+        self.assertIsNone(self.cache.get_site(Host("ecotype-1")))
+
+    def test_group_by_cluster(self):
+        hosts = [Host("paravance-1"), Host("grisou-1"), Host("paravance-2")]
+        groups = self.cache.group_by_cluster(hosts)
+        self.assertEqual(groups["paravance"], [hosts[0], hosts[2]])
+        self.assertEqual(groups["grisou"], [hosts[1]])
+
+    def test_interleave(self):
+        hosts = [Host(n) for n in ["paravance-1", "paravance-2", "parasilo-1",
+                                   "grisou-1", "grisou-2"]]
+        self.assertEqual(
+            [h.address for h in self.cache.interleave(hosts)],
+            ["paravance-1", "grisou-1", "parasilo-1", "grisou-2",
+             "paravance-2"])
+
+    def test_interleave_empty(self):
+        self.assertEqual(self.cache.interleave([]), [])
+
+    def test_save_snapshot(self):
+        snapshot = os.path.join(self.temp_dir, "subset.json")
+        self.cache.save_snapshot(snapshot, [Host("grisou-2")])
+        with open(snapshot) as f:
+            self.assertEqual(list(json.load(f)), ["grisou-2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from execo.host import Host
+
+import dm_g5k.serialization as serialization
+from dm_g5k.serialization import PartialStateException, cluster_exists, \
+    deserialize_cluster, generate_new_id, get_default_id, remove_cluster, \
+    serialize_cluster
+
+CLUSTER_TYPE = "test"
+
+
+class FakeCluster(object):
+
+    hosts = []
+    heavy_fields = ("hosts",)
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.master = hosts[0]
+        self.name = "fake"
+
+
+class SerializationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.serialize_base = serialization.serialize_base
+        serialization.serialize_base = self.temp_dir + "/"
+
+        self.hosts = [Host("paravance-1"), Host("paravance-2", user="root"),
+                      Host("paravance-3", port=2222)]
+        self.cid = generate_new_id(CLUSTER_TYPE)
+        serialize_cluster(CLUSTER_TYPE, self.cid, FakeCluster(self.hosts))
+
+    def tearDown(self):
+        serialization.serialize_base = self.serialize_base
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        cluster = deserialize_cluster(CLUSTER_TYPE, self.cid)
+        self.assertIsInstance(cluster, FakeCluster)
+        self.assertEqual(cluster.name, "fake")
+        self.assertEqual([(h.address, h.user, h.port) for h in cluster.hosts],
+                         [("paravance-1", None, None),
+                          ("paravance-2", "root", None),
+                          ("paravance-3", None, 2222)])
+        self.assertEqual(cluster.master.address, "paravance-1")
+
+    def test_partial(self):
+        cluster = deserialize_cluster(CLUSTER_TYPE, self.cid, partial=True)
+        self.assertEqual(cluster.master.address, "paravance-1")
+        self.assertRaises(PartialStateException, len, cluster.hosts)
+        self.assertRaises(PartialStateException, iter, cluster.hosts)
+
+        # Fields not loaded keep their stored value
+        cluster.name = "renamed"
+        serialize_cluster(CLUSTER_TYPE, self.cid, cluster)
+        cluster = deserialize_cluster(CLUSTER_TYPE, self.cid)
+        self.assertEqual(cluster.name, "renamed")
+        self.assertEqual(len(cluster.hosts), 3)
+
+    def test_legacy_pickle(self):
+        cid = generate_new_id(CLUSTER_TYPE)
+        with open(self.temp_dir + "/" + CLUSTER_TYPE + "/clusters/" +
+                  str(cid), "wb") as f:
+            pickle.dump(FakeCluster(self.hosts), f)
+        cluster = deserialize_cluster(CLUSTER_TYPE, cid)
+        self.assertEqual(len(cluster.hosts), 3)
+
+    def test_registry(self):
+        new_id = generate_new_id(CLUSTER_TYPE)
+        self.assertTrue(new_id > self.cid)
+        self.assertFalse(cluster_exists(CLUSTER_TYPE, new_id))
+        self.assertEqual(get_default_id(CLUSTER_TYPE), self.cid)
+
+        remove_cluster(CLUSTER_TYPE, self.cid)
+        self.assertFalse(cluster_exists(CLUSTER_TYPE, self.cid))
+        self.assertIsNone(get_default_id(CLUSTER_TYPE))
+        self.assertTrue(generate_new_id(CLUSTER_TYPE) > new_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from dm_g5k.storage import parse_storage
+
+LSBLK_OUTPUT = """\
+NAME="sda" PKNAME="" TYPE="disk" ROTA="1" SIZE="600000000000" MOUNTPOINT=""
+NAME="sda1" PKNAME="sda" TYPE="part" ROTA="1" SIZE="500000000" MOUNTPOINT="/boot"
+NAME="sda2" PKNAME="sda" TYPE="part" ROTA="1" SIZE="4000000000" MOUNTPOINT="[SWAP]"
+NAME="sda3" PKNAME="sda" TYPE="part" ROTA="1" SIZE="590000000000" MOUNTPOINT="/"
+NAME="sdb" PKNAME="" TYPE="disk" ROTA="0" SIZE="400000000000" MOUNTPOINT="/mnt/ssd"
+NAME="nvme0n1" PKNAME="" TYPE="disk" ROTA="0" SIZE="200000000000" MOUNTPOINT="/mnt/nvme"
+NAME="sdc" PKNAME="" TYPE="disk" ROTA="1" SIZE="900000000000" MOUNTPOINT="/mnt/ro"
+WRITABLE="/"
+WRITABLE="/boot"
+WRITABLE="/mnt/ssd"
+WRITABLE="/mnt/nvme"
+"""
+
+
+class ParseStorageTest(unittest.TestCase):
+
+    def test_order_and_directories(self):
+        disks = parse_storage(LSBLK_OUTPUT)
+        self.assertEqual([d["disk"] for d in disks],
+                         ["nvme0n1", "sdb", "sda"])
+        self.assertEqual([d["dir"] for d in disks],
+                         ["/mnt/nvme", "/mnt/ssd", "/tmp"])
+        self.assertTrue(disks[0]["nvme"] and disks[0]["ssd"])
+        self.assertFalse(disks[2]["ssd"])
+        self.assertEqual(disks[2]["size"], 590000000000)
+
+    def test_separate_tmp(self):
+        output = (LSBLK_OUTPUT +
+                  'NAME="sdd" PKNAME="" TYPE="disk" ROTA="1" '
+                  'SIZE="100000000000" MOUNTPOINT="/tmp"\nWRITABLE="/tmp"\n')
+        disks = parse_storage(output)
+        self.assertNotIn("sda", [d["disk"] for d in disks])
+        self.assertEqual(disks[-1]["dir"], "/tmp")
+
+    def test_empty(self):
+        self.assertEqual(parse_storage(""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
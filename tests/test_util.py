@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from dm_g5k.util import get_stream_extract_command, \
+    get_uncompress_command, update_xml_file, update_yaml_file
+
+XML_CONF = """\
+<?xml version="1.0"?>
+<configuration>
+  <property>
+    <name>dfs.replication</name>
+    <value>3</value>
+  </property>
+  <property><name>dfs.block.size</name><value>64m</value></property>
+</configuration>
+"""
+
+YAML_CONF = """\
+cluster_name: Test Cluster
+seed_provider:
+  - class_name: org.apache.cassandra.locator.SimpleSeedProvider
+    parameters:
+      - seeds: "127.0.0.1"
+"""
+
+
+class ConfFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, contents):
+        f = os.path.join(self.temp_dir, name)
+        with open(f, "w") as out:
+            out.write(contents)
+        return f
+
+    def test_update_xml_file(self):
+        f = self.write("conf.xml", XML_CONF)
+        assigned = update_xml_file(f, {"dfs.replication": 1,
+                                       "dfs.block.size": "128m",
+                                       "dfs.missing": "x"})
+        self.assertEqual(assigned, set(["dfs.replication", "dfs.block.size"]))
+        with open(f) as inf:
+            contents = inf.read()
+        self.assertIn("<value>1</value>", contents)
+        self.assertIn("<value>128m</value>", contents)
+        self.assertNotIn("dfs.missing", contents)
+
+    def test_update_xml_file_create(self):
+        f = self.write("conf.xml", XML_CONF)
+        assigned = update_xml_file(f, {"dfs.missing": "x"},
+                                   create_if_absent=True)
+        self.assertEqual(assigned, set(["dfs.missing"]))
+        with open(f) as inf:
+            contents = inf.read()
+        self.assertIn("<name>dfs.missing</name><value>x</value>", contents)
+        self.assertTrue(contents.rstrip().endswith("</configuration>"))
+
+    def test_update_yaml_file(self):
+        f = self.write("conf.yaml", YAML_CONF)
+        assigned = update_yaml_file(f, {
+            "cluster_name": "dm_g5k",
+            "seed_provider.0.parameters.0.seeds": "h1,h2",
+            "storage.engine.cache": 2})
+        self.assertEqual(len(assigned), 3)
+        with open(f) as inf:
+            conf = yaml.safe_load(inf)
+        self.assertEqual(conf["cluster_name"], "dm_g5k")
+        self.assertEqual(conf["seed_provider"][0]["parameters"][0]["seeds"],
+                         "h1,h2")
+        self.assertEqual(conf["storage"], {"engine": {"cache": 2}})
+
+    def test_update_yaml_file_no_create(self):
+        f = self.write("conf.yaml", YAML_CONF)
+        assigned = update_yaml_file(f, {"storage.engine": "x"},
+                                    create_if_absent=False)
+        self.assertEqual(assigned, set())
+        with open(f) as inf:
+            self.assertEqual(inf.read(), YAML_CONF)
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_uncompress_command(self):
+        (command, new_name) = get_uncompress_command("/tmp/data/part.tar.gz")
+        self.assertEqual(new_name, "/tmp/data/data-part")
+        self.assertIn("--strip-components=1", command)
+
+        (command, new_name) = get_uncompress_command("/tmp/part.csv.zst")
+        self.assertEqual(new_name, "/tmp/data-part.csv")
+        self.assertIn("zstd", command)
+
+        self.assertIsNone(get_uncompress_command("/tmp/part.csv"))
+
+    def test_stream_extract_command(self):
+        command = get_stream_extract_command("cassandra.tar.xz", "/opt/c")
+        self.assertTrue(command.startswith("{ xz"))
+        self.assertIn("tar xf - --strip-components=1 -C /opt/c", command)
+
+        self.assertEqual(get_stream_extract_command("cassandra.tar", "/opt/c"),
+                         "{ tar xf - --strip-components=1 -C /opt/c ; }")
+
+
+if __name__ == "__main__":
+    unittest.main()
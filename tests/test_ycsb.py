@@ -0,0 +1,57 @@
+import unittest
+
+from dm_g5k.ycsb import aggregate_ycsb_stats, parse_ycsb_output
+
+CLIENT_1 = """\
+Loading workload...
+[OVERALL], RunTime(ms), 10000.0
+[OVERALL], Throughput(ops/sec), 1000.0
+[TOTAL_GCS], Count, 12.0
+[READ], Operations, 3000.0
+[READ], AverageLatency(us), 100.0
+[READ], 95thPercentileLatency(us), 200.0
+[READ], 99thPercentileLatency(us), 400.0
+[READ], MaxLatency(us), 9000.0
+[UPDATE], Operations, 7000.0
+[UPDATE], AverageLatency(us), 150.0
+"""
+
+CLIENT_2 = """\
+[OVERALL], RunTime(ms), 12000.0
+[OVERALL], Throughput(ops/sec), 500.0
+[READ], Operations, 1000.0
+[READ], AverageLatency(us), 300.0
+[READ], 95thPercentileLatency(us), 500.0
+[READ], 99thPercentileLatency(us), 700.0
+[READ], MaxLatency(us), 2000.0
+"""
+
+
+class YCSBOutputTest(unittest.TestCase):
+
+    def test_parse(self):
+        stats = parse_ycsb_output(CLIENT_1)
+        self.assertEqual(stats[("OVERALL", "Throughput(ops/sec)")], 1000.0)
+        self.assertEqual(stats[("READ", "95thPercentileLatency(us)")], 200.0)
+        self.assertEqual(len(stats), 10)
+
+    def test_aggregate(self):
+        result = aggregate_ycsb_stats([parse_ycsb_output(CLIENT_1),
+                                       parse_ycsb_output(CLIENT_2)])
+        self.assertEqual(result["throughput"], 1500.0)
+        self.assertEqual(result["runtime_ms"], 12000.0)
+        self.assertEqual(result["READ_ops"], 4000.0)
+        self.assertEqual(result["READ_avg_latency_us"], 150.0)
+        self.assertEqual(result["READ_p95_latency_us"], 500.0)
+        self.assertEqual(result["READ_p99_latency_us"], 700.0)
+        self.assertEqual(result["READ_max_latency_us"], 9000.0)
+        self.assertEqual(result["UPDATE_ops"], 7000.0)
+        self.assertNotIn("TOTAL_GCS_ops", result)
+
+    def test_aggregate_empty(self):
+        self.assertEqual(aggregate_ycsb_stats([]),
+                         {"throughput": 0, "runtime_ms": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()